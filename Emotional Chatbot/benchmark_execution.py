@@ -0,0 +1,128 @@
+"""
+Benchmark prefill and decode of the causal model under each execution profile on CPU.
+
+Usage:
+    python benchmark_execution.py --model meta-llama/Llama-3.2-1B-Instruct --prompt-tokens 128 512 --new-tokens 64
+    python benchmark_execution.py --profiles eager sdpa sdpa+compile --precision bf16 --json
+
+Prefill is one forward pass over the prompt; decode is timed token by token on top of the
+prefilled cache, so the two phases are measured separately. load_seconds includes compiling
+and warming up, so running a compiled profile twice shows what the on-disk compile cache saves.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from benchmark_precision import BENCHMARK_PROMPT, current_rss_mb
+from causal_model_handler import ModelHandler
+from shared.execution_profile import AttentionBackend, ExecutionProfile, detect_supported_attention
+
+DEFAULT_PROFILES = ["eager", "sdpa", "sdpa+compile"]
+
+def prompt_ids(tokenizer, tokens: int) -> torch.Tensor:
+    """The benchmark prompt repeated and cut to exactly `tokens` tokens"""
+    ids = tokenizer(BENCHMARK_PROMPT, return_tensors="pt").input_ids[0]
+    repeats = tokens // ids.shape[-1] + 1
+    return ids.repeat(repeats)[:tokens].unsqueeze(0)
+
+def measure(model, input_ids: torch.Tensor, new_tokens: int, runs: int) -> dict:
+    """Median prefill time and decode throughput over several runs"""
+    prefill_seconds, decode_rates = [], []
+    with torch.no_grad():
+        for _ in range(runs):
+            started = time.perf_counter()
+            outputs = model(input_ids=input_ids, use_cache=True)
+            prefill_seconds.append(time.perf_counter() - started)
+
+            past_key_values = outputs.past_key_values
+            next_token = outputs.logits[:, -1:].argmax(dim=-1)
+            started = time.perf_counter()
+            for _ in range(new_tokens):
+                outputs = model(input_ids=next_token, past_key_values=past_key_values, use_cache=True)
+                past_key_values = outputs.past_key_values
+                next_token = outputs.logits[:, -1:].argmax(dim=-1)
+            decode_rates.append(new_tokens / (time.perf_counter() - started))
+
+    prefill = statistics.median(prefill_seconds)
+    return {
+        'prompt_tokens': input_ids.shape[-1],
+        'prefill_ms': round(prefill * 1000, 1),
+        'prefill_tokens_per_second': round(input_ids.shape[-1] / prefill, 1),
+        'decode_tokens_per_second': round(statistics.median(decode_rates), 2),
+    }
+
+def benchmark_profile(model_name: str, profile: ExecutionProfile, precision: str, prompt_lengths: list,
+                      new_tokens: int, runs: int) -> list:
+    """Load the model under one execution profile and measure every prompt length"""
+    rss_before = current_rss_mb()
+    load_started = time.monotonic()
+    handler = ModelHandler(model_name, precision=precision, execution_profile=profile)
+    model, tokenizer = handler.load_model()
+    load_seconds = time.monotonic() - load_started
+
+    results = []
+    for length in prompt_lengths:
+        input_ids = prompt_ids(tokenizer, length)
+        # One untimed pass so lazy initialisation and shape-specific compilation are not measured
+        measure(model, input_ids, 2, 1)
+        result = {
+            'profile': profile.name,
+            'resolved': handler.execution_profile.name,
+            'precision': handler.precision.value,
+            'load_seconds': round(load_seconds, 2),
+            'model_rss_mb': round(current_rss_mb() - rss_before, 1),
+        }
+        result.update(measure(model, input_ids, new_tokens, runs))
+        results.append(result)
+
+    del model
+    gc.collect()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare attention backends and torch.compile for the causal model on CPU")
+    parser.add_argument("--model", default="meta-llama/Llama-3.2-1B-Instruct")
+    parser.add_argument("--profiles", nargs="*", default=DEFAULT_PROFILES, help="Execution profiles, e.g. eager sdpa sdpa+compile")
+    parser.add_argument("--precision", default="fp32", help="Precision mode, see benchmark_precision.py")
+    parser.add_argument("--prompt-tokens", type=int, nargs="*", default=[128, 512])
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    supported = detect_supported_attention("cpu")
+    print(f"Attention backends on this host: {', '.join(backend.value for backend in supported)}")
+
+    results = []
+    for name in args.profiles:
+        profile = ExecutionProfile.parse(name)
+        if profile.attention == AttentionBackend.FLASH and profile.attention not in supported:
+            print(f"Skipping {profile.name}: flash attention needs a CUDA GPU")
+            continue
+        results.extend(benchmark_profile(args.model, profile, args.precision, args.prompt_tokens,
+                                         args.new_tokens, args.runs))
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    print(f"\n{'profile':<22}{'ran as':<22}{'prompt':>8}{'prefill ms':>12}{'prefill tok/s':>15}"
+          f"{'decode tok/s':>14}{'load s':>9}")
+    for result in results:
+        print(
+            f"{result['profile']:<22}{result['resolved']:<22}{result['prompt_tokens']:>8}{result['prefill_ms']:>12}"
+            f"{result['prefill_tokens_per_second']:>15}{result['decode_tokens_per_second']:>14}{result['load_seconds']:>9}"
+        )
+
+if __name__ == "__main__":
+    main()
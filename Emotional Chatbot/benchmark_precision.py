@@ -0,0 +1,134 @@
+"""
+Benchmark the causal model under every precision mode supported by this CPU.
+
+Usage:
+    python benchmark_precision.py --model meta-llama/Llama-3.2-1B-Instruct --new-tokens 64 --runs 3
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from causal_model_handler import ModelHandler, PrecisionMode, detect_supported_precisions
+
+BENCHMARK_PROMPT = (
+    "You are a friendly, supportive AI tutor who helps children with their learning in an encouraging way.\n\n"
+    "Student's message: Can you help me understand fractions?\n"
+    "Detected emotion: neutral\n\n"
+    "Response:"
+)
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def reset_peak_rss():
+    """Restart the kernel's peak RSS counter (Linux); elsewhere the peak covers the whole process"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+def peak_rss_mb() -> float:
+    """Highest resident set size of this process in MB since the last reset_peak_rss()"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux and the BSDs
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+def benchmark_mode(model_name: str, mode: PrecisionMode, new_tokens: int, runs: int) -> dict:
+    """Load the model in one precision mode and measure decode throughput and memory"""
+    reset_peak_rss()
+    rss_before = current_rss_mb()
+    load_started = time.monotonic()
+    handler = ModelHandler(model_name, precision=mode)
+    model, tokenizer = handler.load_model()
+    load_seconds = time.monotonic() - load_started
+    rss_loaded = current_rss_mb()
+
+    inputs = tokenizer(BENCHMARK_PROMPT, return_tensors="pt")
+    generate_kwargs = {
+        'max_new_tokens': new_tokens,
+        'min_new_tokens': new_tokens,
+        'do_sample': False,
+        'pad_token_id': tokenizer.pad_token_id or tokenizer.eos_token_id,
+    }
+
+    with torch.no_grad():
+        model.generate(**inputs, max_new_tokens=4, pad_token_id=generate_kwargs['pad_token_id'])
+
+        timings = []
+        for _ in range(runs):
+            started = time.monotonic()
+            output = model.generate(**inputs, **generate_kwargs)
+            timings.append((time.monotonic() - started, output.shape[-1] - inputs.input_ids.shape[-1]))
+
+    total_seconds = sum(seconds for seconds, _ in timings)
+    total_tokens = sum(tokens for _, tokens in timings)
+    result = {
+        'mode': handler.precision.value,
+        'load_seconds': round(load_seconds, 2),
+        'tokens_per_second': round(total_tokens / total_seconds, 2) if total_seconds else 0.0,
+        'model_rss_mb': round(rss_loaded - rss_before, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+    del model
+    gc.collect()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare causal model precision modes on this CPU")
+    parser.add_argument("--model", default="meta-llama/Llama-3.2-1B-Instruct")
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="*", default=None, help="Subset of modes to run, defaults to all supported")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args()
+
+    supported = detect_supported_precisions()
+    modes = [PrecisionMode(mode) for mode in args.modes] if args.modes else supported
+    print(f"Supported precision modes on this host: {', '.join(mode.value for mode in supported)}")
+
+    results = []
+    for mode in modes:
+        if mode not in supported:
+            print(f"Skipping {mode.value}: not supported on this host")
+            continue
+        results.append(benchmark_mode(args.model, mode, args.new_tokens, args.runs))
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    print(f"\n{'mode':<18}{'tokens/s':>10}{'load s':>10}{'model MB':>12}{'peak RSS MB':>14}")
+    for result in results:
+        print(
+            f"{result['mode']:<18}{result['tokens_per_second']:>10}{result['load_seconds']:>10}"
+            f"{result['model_rss_mb']:>12}{result['peak_rss_mb']:>14}"
+        )
+
+if __name__ == "__main__":
+    main()
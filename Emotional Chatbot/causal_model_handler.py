@@ -1,38 +1,180 @@
+import importlib.util
+import platform
+from enum import Enum
+from typing import List, Union
+
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
+from shared.execution_profile import ExecutionProfile, compile_model, load_with_attention_fallback, resolved_profile
+from shared.logger import Logger
+
+logger = Logger(name="Causal Model Handler", log_file_needed=True, log_file='Logs/causal_model_handler.log', level='DEV')
+
+class PrecisionMode(str, Enum):
+    FP32 = "fp32"
+    BF16 = "bf16"
+    INT8_DYNAMIC = "int8_dynamic"
+    INT8_WEIGHT_ONLY = "int8_weight_only"
+    INT4_WEIGHT_ONLY = "int4_weight_only"
+
+def _cpu_flags() -> set:
+    """Return the instruction set flags reported by the host CPU (Linux only, empty elsewhere)"""
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+def _has_native_bf16(flags: set) -> bool:
+    apple_silicon = platform.system() == "Darwin" and platform.machine() == "arm64"
+    return bool({"avx512_bf16", "amx_bf16"} & flags) or apple_silicon
+
+def _int4_cpu_layout():
+    """torchao's CPU layout for int4 weights, or None when this torchao only has the CUDA one"""
+    try:
+        from torchao.dtypes import Int4CPULayout
+    except ImportError:
+        return None
+    return Int4CPULayout()
+
+def detect_supported_precisions() -> List[PrecisionMode]:
+    """
+    Detects which precision modes the host CPU can run efficiently.
+
+    bf16 is only reported when the CPU has native bf16 matmul support (AVX512-BF16 or
+    AMX, or Apple silicon); elsewhere it is emulated and slower than fp32. int4 weights
+    need torchao's CPU layout, whose kernels take bf16 activations, so it has the same
+    requirement; torchao's default int4 layout is CUDA-only.
+    """
+    supported = [PrecisionMode.FP32]
+
+    native_bf16 = _has_native_bf16(_cpu_flags())
+    if native_bf16:
+        supported.append(PrecisionMode.BF16)
+
+    engines = torch.backends.quantized.supported_engines
+    if any(engine in engines for engine in ("x86", "fbgemm", "qnnpack")):
+        supported.append(PrecisionMode.INT8_DYNAMIC)
+
+    if importlib.util.find_spec("torchao") is not None:
+        supported.append(PrecisionMode.INT8_WEIGHT_ONLY)
+        if native_bf16 and _int4_cpu_layout() is not None:
+            supported.append(PrecisionMode.INT4_WEIGHT_ONLY)
+
+    return supported
+
+def default_quantized_precision(supported: List[PrecisionMode] = None) -> PrecisionMode:
+    """Pick the fastest reduced-precision mode the host supports"""
+    supported = supported if supported is not None else detect_supported_precisions()
+    for mode in (PrecisionMode.BF16, PrecisionMode.INT8_DYNAMIC):
+        if mode in supported:
+            return mode
+    return PrecisionMode.FP32
+
 class ModelHandler:
-    def __init__(self, model_name: str, quantize: bool = False):
+    def __init__(self, model_name: str, quantize: bool = False, precision: Union[PrecisionMode, str, None] = None,
+                 execution_profile: Union[ExecutionProfile, str, None] = None):
         """
         Initialization of class arguments.
 
         1. model_name -> str -> Hugging face repo id.\n
-        2. quantize -> bool -> Whether to not quantize the model.\n
+        2. quantize -> bool -> Whether to quantize the model, using the fastest mode the CPU supports.\n
+        3. precision -> PrecisionMode | str | None -> Explicit precision mode, overrides quantize.\n
+        4. execution_profile -> ExecutionProfile | str | None -> Attention backend and torch.compile choice, defaults to SDPA.\n
         """
         self.model_name = model_name
         self.quantize = quantize
-    
+        self.requested_precision = PrecisionMode(precision) if precision is not None else None
+        if isinstance(execution_profile, str):
+            execution_profile = ExecutionProfile.parse(execution_profile)
+        self.requested_execution_profile = execution_profile or ExecutionProfile()
+        self.supported_precisions = []
+        self.precision = None
+        self.execution_profile = None
+
+    def resolve_precision(self) -> PrecisionMode:
+        """
+        Resolves the precision mode to load with, falling back to fp32 when the
+        requested mode is not supported by this host.
+        """
+        self.supported_precisions = detect_supported_precisions()
+
+        if self.requested_precision is not None:
+            if self.requested_precision in self.supported_precisions:
+                return self.requested_precision
+            logger.warning(
+                f"Precision {self.requested_precision.value} is not supported on this host "
+                f"(supported: {', '.join(mode.value for mode in self.supported_precisions)}); using fp32"
+            )
+            return PrecisionMode.FP32
+
+        if self.quantize:
+            return default_quantized_precision(self.supported_precisions)
+
+        return PrecisionMode.FP32
+
     def load_model(self):
         """
         Loads the tokenizer and model according to the initialization parameters.
 
+        The attention backend and compilation fall back to slower choices the host or
+        model supports; self.execution_profile records what was actually used.
+
         Returns:
             model: The loaded AutoModelForCausalLM on the specified device.
             tokenizer: The corresponding AutoTokenizer.
         """
+        self.precision = self.resolve_precision()
+
         tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=True)
-        if self.quantize:
-            model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
-                low_cpu_mem_usage=True,
-                torch_dtype=torch.float16,
-                device_map="cpu",
+        model, attention = self._load_weights()
+
+        if self.precision == PrecisionMode.INT8_DYNAMIC:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
             )
-        else:
-            model = AutoModelForCausalLM.from_pretrained(
-                    self.model_name,
-                    low_cpu_mem_usage=True,
-                    device_map="cpu",
-                )
-        
+        elif self.precision in (PrecisionMode.INT8_WEIGHT_ONLY, PrecisionMode.INT4_WEIGHT_ONLY):
+            try:
+                model = self._apply_weight_only_quantization(model)
+            except Exception as e:
+                # quantize_ swaps modules one by one, so a failure can leave a half-quantized model
+                logger.warning(f"{self.precision.value} quantization failed, reloading in fp32: {str(e)}")
+                self.precision = PrecisionMode.FP32
+                model, attention = self._load_weights()
+
+        # Compiled last, so the graphs capture the quantized modules
+        model, compiled = compile_model(model, self.requested_execution_profile)
+        self.execution_profile = resolved_profile(self.requested_execution_profile, attention, compiled)
         return model, tokenizer
+
+    def _load_weights(self):
+        """Load the model in the dtype its precision mode computes in; returns it and the attention backend"""
+        load_kwargs = {"low_cpu_mem_usage": True, "device_map": "cpu"}
+        if self.precision in (PrecisionMode.BF16, PrecisionMode.INT4_WEIGHT_ONLY):
+            load_kwargs["torch_dtype"] = torch.bfloat16
+        else:
+            load_kwargs["torch_dtype"] = torch.float32
+
+        model, attention = load_with_attention_fallback(
+            lambda attn_implementation: AutoModelForCausalLM.from_pretrained(
+                self.model_name, attn_implementation=attn_implementation, **load_kwargs
+            ),
+            self.requested_execution_profile,
+            device="cpu",
+        )
+        model.eval()
+        return model, attention
+
+    def _apply_weight_only_quantization(self, model):
+        """Quantize linear weights in place with torchao, keeping activations in floating point"""
+        from torchao.quantization import int4_weight_only, int8_weight_only, quantize_
+
+        if self.precision == PrecisionMode.INT4_WEIGHT_ONLY:
+            quantize_(model, int4_weight_only(layout=_int4_cpu_layout()))
+        else:
+            quantize_(model, int8_weight_only())
+        return model
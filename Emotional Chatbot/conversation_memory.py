@@ -0,0 +1,129 @@
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+TURN_TEMPLATE = "Student's message: {user_input}\nDetected emotion: {emotion_label}\n\nResponse: {response}\n\n"
+SUMMARY_HEADER = "Earlier in this conversation:\n"
+HISTORY_HEADER = "Conversation so far:\n"
+
+def _first_sentence(text: str, max_words: int) -> str:
+    """Shorten text to its first sentence, capped at max_words words"""
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + "..."
+    return sentence
+
+class ConversationMemory:
+    def __init__(self, token_budget: int = 384, summary_budget: int = 96, compact_ratio: float = 0.5):
+        """
+        Initialization of class arguments.
+
+        1. token_budget -> int -> Maximum prompt tokens spent on earlier turns (summaries included).\n
+        2. summary_budget -> int -> Share of the budget reserved for summaries of compacted turns.\n
+        3. compact_ratio -> float -> Fraction of the verbatim budget kept after a compaction.\n
+        """
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.compact_ratio = compact_ratio
+        self.turns: List[Dict] = []
+        self.summaries: List[str] = []
+
+    def add_turn(self, user_input: str, emotion_analysis: Dict, response: str):
+        """Record a finished turn"""
+        self.turns.append({
+            'user_input': user_input.strip(),
+            'emotion_label': emotion_analysis.get('primary_emotion', 'neutral'),
+            'educational_context': emotion_analysis.get('educational_context', 'general'),
+            'response': response.strip(),
+            'tokens': None,
+        })
+
+    def _summarize(self, turn: Dict) -> str:
+        """Cheap extractive one-line summary of a turn, no model call"""
+        line = f"- Student ({turn['emotion_label']}): {_first_sentence(turn['user_input'], 20)}"
+        if turn['educational_context'] != 'general':
+            line += f" [{turn['educational_context']}]"
+        return line + f" / Tutor: {_first_sentence(turn['response'], 15)}"
+
+    def _turn_tokens(self, turn: Dict, count_tokens: Callable[[str], int]) -> int:
+        if turn['tokens'] is None:
+            turn['tokens'] = count_tokens(TURN_TEMPLATE.format(**turn))
+        return turn['tokens']
+
+    def _compact(self, count_tokens: Callable[[str], int]):
+        """
+        Move the oldest verbatim turns into summaries.
+
+        Compaction drops well below the budget rather than just under it, so the rendered
+        history stays append-only (and its KV cache reusable) for several turns in a row.
+        """
+        verbatim_budget = self.token_budget - self.summary_budget
+        used = sum(self._turn_tokens(turn, count_tokens) for turn in self.turns)
+        if used <= verbatim_budget:
+            return
+
+        target = int(verbatim_budget * self.compact_ratio)
+        while self.turns and used > target:
+            turn = self.turns.pop(0)
+            used -= turn['tokens']
+            self.summaries.append(self._summarize(turn))
+
+        while self.summaries and count_tokens("\n".join(self.summaries)) > self.summary_budget:
+            self.summaries.pop(0)
+
+    def render(self, count_tokens: Callable[[str], int]) -> str:
+        """Return the history block to place before the current student message"""
+        self._compact(count_tokens)
+        if not self.turns and not self.summaries:
+            return ""
+
+        parts = []
+        if self.summaries:
+            parts.append(SUMMARY_HEADER + "\n".join(self.summaries) + "\n\n")
+        parts.append(HISTORY_HEADER)
+        parts.extend(TURN_TEMPLATE.format(**turn) for turn in self.turns)
+        return "".join(parts)
+
+class ConversationSession:
+    def __init__(self, token_budget: int = 384):
+        """
+        Initialization of class arguments.
+
+        1. token_budget -> int -> Prompt token budget for earlier turns.\n
+        """
+        self.memory = ConversationMemory(token_budget=token_budget)
+        self.lock = threading.Lock()
+        self.cached_ids = None
+        self.past_key_values = None
+
+    def remember_cache(self, sequence_ids, past_key_values):
+        """Keep the KV cache of the last generate() call for reuse by the next turn"""
+        self.cached_ids = sequence_ids
+        self.past_key_values = past_key_values
+
+    def reusable_cache(self, input_ids, min_prefix: int) -> Optional[object]:
+        """
+        Return this session's KV cache cropped to the longest prefix shared with input_ids.
+
+        Returns None when less than min_prefix tokens are shared, e.g. after the
+        template changed or the history was compacted.
+        """
+        if self.past_key_values is None or self.cached_ids is None:
+            return None
+
+        cached_length = min(self.past_key_values.get_seq_length(), self.cached_ids.shape[-1])
+        limit = min(cached_length, input_ids.shape[-1] - 1)
+        mismatch = (self.cached_ids[:limit] != input_ids[0, :limit]).nonzero()
+        common = int(mismatch[0]) if len(mismatch) else limit
+
+        if common < min_prefix:
+            return None
+
+        self.past_key_values.crop(common)
+        return self.past_key_values
+
+    def reset_cache(self):
+        """Drop the cached KV state"""
+        self.cached_ids = None
+        self.past_key_values = None
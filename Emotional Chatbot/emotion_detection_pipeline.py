@@ -1,21 +1,53 @@
 from sequence_model_handler import SequenceModelHandler
 from transformers import pipeline
+import os
 import re
 from typing import Dict, Tuple, List
-from logger import Logger
+from shared.cpu_layout import get_cpu_layout
+from shared.logger import Logger
+from shared.model_registry import get_model_registry
+from shared.profiling import get_profiler
+from shared.tracing import get_tracer
 import warnings
 
 warnings.filterwarnings("ignore")
 
 logger = Logger(name="Enhanced Emotion Detection", log_file_needed=True, log_file='Logs/emotion_detection.log', level='DEV')
+tracer = get_tracer("chatbot")
+profiler = get_profiler()
+cpu_layout = get_cpu_layout()
+
+WINDOW_AGGREGATIONS = ('max', 'mean', 'recency')
 
 class EmotionDetector:
-    def __init__(self, model_name="bhadresh-savani/bert-base-uncased-emotion"):
+    def __init__(self, model_name="bhadresh-savani/bert-base-uncased-emotion", window_tokens=None,
+                 window_overlap=None, max_windows=None, aggregation=None, recency_decay=0.7):
+        """
+        Initialization of class arguments.
+
+        1. model_name -> str -> Hugging face repo id of the emotion classifier.\n
+        2. window_tokens -> int -> Messages longer than this are classified in overlapping windows (EMOTION_WINDOW_TOKENS, 256).\n
+        3. window_overlap -> int -> Tokens shared by neighbouring windows (EMOTION_WINDOW_OVERLAP, 64).\n
+        4. max_windows -> int -> Upper bound on windows per message, keeping the first and last (EMOTION_MAX_WINDOWS, 8).\n
+        5. aggregation -> str -> How window scores are combined: max, mean or recency (EMOTION_WINDOW_AGGREGATION, recency).\n
+        6. recency_decay -> float -> Weight ratio between a window and the one after it for recency aggregation.\n
+        """
         logger.debug(f"Initializing EnhancedEmotionDetector with model: {model_name}")
         try:
+            self.window_tokens = int(window_tokens or os.environ.get("EMOTION_WINDOW_TOKENS", 256))
+            self.window_overlap = int(window_overlap or os.environ.get("EMOTION_WINDOW_OVERLAP", 64))
+            self.max_windows = int(max_windows or os.environ.get("EMOTION_MAX_WINDOWS", 8))
+            self.aggregation = aggregation or os.environ.get("EMOTION_WINDOW_AGGREGATION", "recency")
+            self.recency_decay = recency_decay
+            if self.aggregation not in WINDOW_AGGREGATIONS:
+                raise ValueError(f"aggregation must be one of {', '.join(WINDOW_AGGREGATIONS)}")
+            if not 0 <= self.window_overlap < self.window_tokens:
+                raise ValueError("window_overlap must be smaller than window_tokens")
+            
             self.model_handler = SequenceModelHandler(model_name)
             loaded_model, corresponding_tokenizer = self.model_handler.load_sequence_model()
             
+            self.tokenizer = corresponding_tokenizer
             self.emotion_classifier = pipeline(
                 task="text-classification",
                 model=loaded_model,
@@ -57,57 +89,168 @@ class EmotionDetector:
             logger.error(f"Failed to load enhanced emotion detection model: {str(e)}")
             raise
 
+    @profiler.profiled("detect_educational_emotion")
     def detect_educational_emotion(self, text: str, context: Dict = None) -> Dict:
         """
         Enhanced emotion detection with educational context awareness
         """
-        logger.debug(f"Starting enhanced emotion detection for text: '{text[:50]}...'")
+        logger.debug("Starting enhanced emotion detection for text: '%.50s...'", text)
         
         if not text or not text.strip():
             logger.warning("Empty text provided")
-            return {
-                'primary_emotion': 'neutral',
-                'confidence': 0.0,
-                'educational_context': 'unknown',
-                'special_needs_indicators': [],
-                'recommended_approach': 'standard'
-            }
+            return self._empty_result()
         
         try:
             base_emotion, confidence = self._detect_base_emotion(text)
             
-            educational_context = self._analyze_educational_context(text)
-            
-            special_needs = self._detect_special_needs_indicators(text)
-            
-            result = {
-                'primary_emotion': base_emotion,
-                'confidence': confidence,
-                'educational_context': educational_context,
-                'special_needs_indicators': special_needs,
-                'recommended_approach': self._get_recommended_approach(
-                    base_emotion, educational_context, special_needs
-                ),
-                'context_factors': context or {}
-            }
+            result = self._build_result(text, base_emotion, confidence, context)
             
-            logger.debug(f"Enhanced emotion analysis complete: {result}")
+            logger.debug("Enhanced emotion analysis complete: %s", result, sampled=True)
             return result
             
         except Exception as e:
             logger.error(f"Error in enhanced emotion detection: {str(e)}")
-            return {
-                'primary_emotion': 'neutral',
-                'confidence': 0.0,
-                'educational_context': 'error',
-                'special_needs_indicators': [],
-                'recommended_approach': 'supportive'
-            }
+            return self._error_result()
+    
+    def detect_educational_emotions(self, texts: List[str], batch_size: int = 32) -> List[Dict]:
+        """
+        Batched detect_educational_emotion for offline scoring of many messages.
+
+        The classifier sees the non-empty texts in batches of batch_size; the regex
+        analysis still runs per message. Results are in input order.
+        """
+        results = [self._empty_result() for _ in texts]
+        indices = [index for index, text in enumerate(texts) if text and text.strip()]
+        if not indices:
+            return results
+        
+        try:
+            predictions = self._classify([texts[index] for index in indices], batch_size)
+            for index, preds in zip(indices, predictions):
+                base_emotion, confidence = self._top_emotion(preds)
+                results[index] = self._build_result(texts[index], base_emotion, confidence)
+        except Exception as e:
+            logger.error(f"Error in batched emotion detection: {str(e)}")
+            for index in indices:
+                results[index] = self._error_result()
+        return results
+    
+    def _build_result(self, text: str, base_emotion: str, confidence: float, context: Dict = None) -> Dict:
+        """Combine the classifier output with the regex analysis of the message"""
+        with tracer.span("emotion.regex"):
+            educational_context = self._analyze_educational_context(text)
+            
+            special_needs = self._detect_special_needs_indicators(text)
+        
+        return {
+            'primary_emotion': base_emotion,
+            'confidence': confidence,
+            'educational_context': educational_context,
+            'special_needs_indicators': special_needs,
+            'recommended_approach': self._get_recommended_approach(
+                base_emotion, educational_context, special_needs
+            ),
+            'context_factors': context or {}
+        }
+    
+    def _empty_result(self) -> Dict:
+        return {
+            'primary_emotion': 'neutral',
+            'confidence': 0.0,
+            'educational_context': 'unknown',
+            'special_needs_indicators': [],
+            'recommended_approach': 'standard'
+        }
+    
+    def _error_result(self) -> Dict:
+        return {
+            'primary_emotion': 'neutral',
+            'confidence': 0.0,
+            'educational_context': 'error',
+            'special_needs_indicators': [],
+            'recommended_approach': 'supportive'
+        }
     
     def _detect_base_emotion(self, text: str) -> Tuple[str, float]:
         """Your existing emotion detection logic"""
-        preds = self.emotion_classifier(text)
+        return self._top_emotion(self._classify([text])[0])
+    
+    def _classify(self, texts: List[str], batch_size: int = 8) -> List[List[Dict]]:
+        """
+        Label scores for each text, sorted best first.
+
+        Long texts are split into overlapping windows; the windows of every text go
+        through the classifier as one batched call and their scores are aggregated back.
+        """
+        windows, owners = [], []
+        for owner, text in enumerate(texts):
+            for window in self._split_windows(text):
+                windows.append(window)
+                owners.append(owner)
         
+        with tracer.span("emotion.classifier", texts=len(texts), windows=len(windows)):
+            predictions = cpu_layout.run(
+                "emotion", self.emotion_classifier, windows, batch_size=batch_size, truncation=True
+            )
+        
+        grouped = [[] for _ in texts]
+        for owner, preds in zip(owners, predictions):
+            grouped[owner].append(preds if isinstance(preds, list) else [preds])
+        return [
+            window_preds[0] if len(window_preds) == 1 else self._aggregate_windows(window_preds)
+            for window_preds in grouped
+        ]
+    
+    def _split_windows(self, text: str) -> List[str]:
+        """Overlapping windows of at most window_tokens tokens, at most max_windows of them"""
+        # A token covers at least one character, so short messages skip tokenization entirely
+        if len(text) <= self.window_tokens:
+            return [text]
+        
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+        if len(offsets) <= self.window_tokens:
+            return [text]
+        
+        stride = self.window_tokens - self.window_overlap
+        # The last window is aligned to the end of the message so it is a full window too
+        starts = list(range(0, len(offsets) - self.window_tokens, stride)) + [len(offsets) - self.window_tokens]
+        if len(starts) > self.max_windows:
+            # Keep the first and last windows and spread the rest evenly, so cost stays bounded
+            # while the end of the message, often where the feeling is stated, is always seen
+            if self.max_windows == 1:
+                starts = starts[-1:]
+            else:
+                last = len(starts) - 1
+                starts = [starts[round(i * last / (self.max_windows - 1))] for i in range(self.max_windows)]
+        
+        windows = []
+        for start in starts:
+            end = start + self.window_tokens - 1
+            windows.append(text[offsets[start][0]:offsets[end][1]])
+        return windows
+    
+    def _aggregate_windows(self, window_preds: List[List[Dict]]) -> List[Dict]:
+        """Combine per-window label scores with the configured rule; windows are in message order"""
+        if self.aggregation == 'recency':
+            weights = [self.recency_decay ** (len(window_preds) - 1 - i) for i in range(len(window_preds))]
+        else:
+            weights = [1.0] * len(window_preds)
+        total_weight = sum(weights)
+        
+        combined = {}
+        for weight, preds in zip(weights, window_preds):
+            for pred in preds:
+                label, score = pred['label'], float(pred['score'])
+                if self.aggregation == 'max':
+                    combined[label] = max(combined.get(label, 0.0), score)
+                else:
+                    combined[label] = combined.get(label, 0.0) + weight * score / total_weight
+        
+        return sorted(({'label': label, 'score': score} for label, score in combined.items()),
+                      key=lambda pred: pred['score'], reverse=True)
+    
+    def _top_emotion(self, preds) -> Tuple[str, float]:
+        """Best label of one classifier output; low-confidence predictions count as neutral"""
         if isinstance(preds, list) and len(preds) > 0:
             batch = preds[0] if isinstance(preds[0], list) else preds
         else:
@@ -130,7 +273,7 @@ class EmotionDetector:
         for context_type, patterns in self.educational_patterns.items():
             for pattern in patterns:
                 if re.search(pattern, text):
-                    logger.debug(f"Educational context detected: {context_type}")
+                    logger.debug("Educational context detected: %s", context_type)
                     return context_type
         
         return 'general'
@@ -166,8 +309,18 @@ class EmotionDetector:
         else:
             return 'standard'
 
-emotion_detector = EmotionDetector()
+# Resident until the registry evicts it for memory or idleness; reloaded on the next use
+model_registry = get_model_registry()
+model_registry.register('emotion_detector', EmotionDetector)
+
+def get_emotion_detector() -> EmotionDetector:
+    """Return the shared EmotionDetector, loading the classifier on first use or after eviction"""
+    return model_registry.get('emotion_detector')
+
+def is_emotion_detector_loaded() -> bool:
+    """Whether the shared EmotionDetector is currently loaded"""
+    return model_registry.is_loaded('emotion_detector')
 
 def detect_enhanced_emotion(text: str, context: Dict = None) -> Dict:
     """Global function for enhanced emotion detection"""
-    return emotion_detector.detect_educational_emotion(text, context)
+    return get_emotion_detector().detect_educational_emotion(text, context)
@@ -1,45 +1,84 @@
 from causal_model_handler import ModelHandler
-from transformers import pipeline
-from langchain_huggingface import HuggingFacePipeline
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from typing import Dict
-from logger import Logger
+from generation_profiles import (
+    CancelCriteria,
+    DecodeTimer,
+    GenerationProfile,
+    SENTENCE_ENDINGS,
+    StopStringFilter,
+    build_stopping_criteria,
+    cut_at_sentence_boundary,
+    get_generation_profile,
+    truncate_at_stop_strings,
+)
+from conversation_memory import ConversationSession
+from prompt_cache import PromptPrefixCache
+from response_cache import response_cache_from_env
+from turn_metrics import turn_metrics
+from transformers import TextIteratorStreamer
+import contextlib
+import os
+import threading
+import time
+import torch
+from concurrent.futures import wait
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from shared.cpu_layout import get_cpu_layout
+from shared.logger import Logger
+from shared.model_registry import get_model_registry
+from shared.profiling import get_profiler
+from shared.tracing import get_tracer
 
 logger = Logger(name="Enhanced Generation", log_file_needed=True, log_file='Logs/enhanced_generation.log', level='DEV')
+tracer = get_tracer("chatbot")
+profiler = get_profiler()
+cpu_layout = get_cpu_layout()
+tracer.register_counter_source(turn_metrics.snapshot)
+tracer.register_counter_source(cpu_layout.counters)
+
+EMPTY_INPUT_RESPONSE = "I'm here to help you learn! What would you like to talk about or work on today?"
+RESPONSE_PREFIXES = ["Response:", "Assistant:", "AI:", "Bot:", "Tutor:"]
+
+# Characters held back before the first streamed chunk, enough to strip any role prefix
+STREAM_HOLDBACK_CHARS = 15
+# Seconds to wait for the next token before the stream is treated as stalled
+STREAM_TOKEN_TIMEOUT = 60.0
+# Default latency budget for one reply, overridable with CHATBOT_TURN_DEADLINE_S
+DEFAULT_TURN_DEADLINE = 12.0
+# Decoding stops this many seconds before the deadline to leave time for post-processing
+DEADLINE_MARGIN = 0.25
 
 class EducationalEmotionalResponseGenerator:
-    def __init__(self, model_name="meta-llama/Llama-3.2-1B-Instruct"):
+    def __init__(self, model_name="meta-llama/Llama-3.2-1B-Instruct", use_prefix_cache=True, precision=None,
+                 turn_deadline=None, execution_profile=None):
         logger.debug(f"Initializing EducationalEmotionalResponseGenerator with model: {model_name}")
         try:
-            self.handler = ModelHandler(model_name, True)
+            self.turn_deadline = float(
+                turn_deadline or os.environ.get("CHATBOT_TURN_DEADLINE_S", DEFAULT_TURN_DEADLINE)
+            )
+            self.response_cache = response_cache_from_env()
+            precision = precision or os.environ.get("CHATBOT_PRECISION") or None
+            execution_profile = execution_profile or os.environ.get("CHATBOT_EXECUTION_PROFILE") or None
+            self.handler = ModelHandler(model_name, True, precision=precision, execution_profile=execution_profile)
             model, tokenizer = self.handler.load_model()
-            
-            self.gen_pipe = pipeline(
-                task="text-generation",
-                model=model,
-                tokenizer=tokenizer,
-                max_new_tokens=150,
-                min_new_tokens=50,
-                temperature=0.3,
-                top_p=0.9,
-                top_k=50,
-                repetition_penalty=1.1,
-                do_sample=True,
-                return_full_text=False,
-                eos_token_id=tokenizer.eos_token_id,
-                pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+            logger.debug(
+                f"Causal model loaded with precision: {self.handler.precision.value} "
+                f"(supported: {', '.join(mode.value for mode in self.handler.supported_precisions)}), "
+                f"execution: {self.handler.execution_profile.name}"
             )
+            self.model = model
+            self.tokenizer = tokenizer
             
-            self.llm_chain = HuggingFacePipeline(pipeline=self.gen_pipe)
+            # Defaults follow the 'standard' profile; per-turn calls override them by approach
+            self.generation_kwargs = {
+                **get_generation_profile('standard').sampling_kwargs(),
+                'do_sample': True,
+                'eos_token_id': tokenizer.eos_token_id,
+                'pad_token_id': tokenizer.pad_token_id or tokenizer.eos_token_id,
+            }
             
             self.templates = {
                 'dyslexia_supportive': """You are a patient, understanding AI tutor specializing in helping children with dyslexia. You understand reading challenges and provide supportive assistance.
 
-Student's message: {user_input}
-Detected emotion: {emotion_label}
-Educational context: {educational_context}
-
 Guidelines:
 - Acknowledge their reading/writing challenges with empathy
 - Offer alternative learning methods (audio, visual, kinesthetic)
@@ -48,14 +87,14 @@ Guidelines:
 - Be patient and encouraging about progress
 - Break complex information into smaller chunks
 
+{conversation_history}Student's message: {user_input}
+Detected emotion: {emotion_label}
+Educational context: {educational_context}
+
 Response:""",
 
                 'adhd_supportive': """You are an energetic, understanding AI tutor who helps children with ADHD stay focused and engaged in learning.
 
-Student's message: {user_input}
-Detected emotion: {emotion_label}
-Educational context: {educational_context}
-
 Guidelines:
 - Acknowledge their attention challenges without judgment
 - Suggest movement breaks or fidget strategies
@@ -65,14 +104,14 @@ Guidelines:
 - Celebrate small wins and progress
 - Help them refocus when distracted
 
+{conversation_history}Student's message: {user_input}
+Detected emotion: {emotion_label}
+Educational context: {educational_context}
+
 Response:""",
 
                 'learning_supportive': """You are a compassionate AI tutor who helps children overcome learning difficulties with patience and creativity.
 
-Student's message: {user_input}
-Detected emotion: {emotion_label}
-Educational context: {educational_context}
-
 Guidelines:
 - Validate their feelings about learning challenges
 - Offer alternative explanations and approaches
@@ -82,14 +121,14 @@ Guidelines:
 - Remind them that everyone learns differently
 - Celebrate effort over perfection
 
+{conversation_history}Student's message: {user_input}
+Detected emotion: {emotion_label}
+Educational context: {educational_context}
+
 Response:""",
 
                 'confidence_building': """You are an encouraging AI tutor focused on building student confidence and self-esteem.
 
-Student's message: {user_input}
-Detected emotion: {emotion_label}
-Educational context: {educational_context}
-
 Guidelines:
 - Address negative self-talk with gentle correction
 - Highlight their strengths and past successes
@@ -99,13 +138,14 @@ Guidelines:
 - Be enthusiastic about their potential
 - Ask about their interests to build connections
 
+{conversation_history}Student's message: {user_input}
+Detected emotion: {emotion_label}
+Educational context: {educational_context}
+
 Response:""",
 
                 'standard': """You are a friendly, supportive AI tutor who helps children with their learning in an encouraging way.
 
-Student's message: {user_input}
-Detected emotion: {emotion_label}
-
 Guidelines:
 - Be warm, patient, and age-appropriate
 - Acknowledge their emotions with empathy
@@ -115,65 +155,475 @@ Guidelines:
 - Celebrate learning moments
 - Ask follow-up questions when appropriate
 
+{conversation_history}Student's message: {user_input}
+Detected emotion: {emotion_label}
+
 Response:"""
             }
             
+            # Prefill each template's fixed guideline header once; turns only prefill their own suffix.
+            # Without it every turn prefills its whole prompt, with the same profile and deadline.
+            self.prefix_cache = None
+            if use_prefix_cache:
+                try:
+                    self.prefix_cache = PromptPrefixCache(model, tokenizer, self.templates)
+                    logger.debug("Prompt prefix KV cache prepared for all templates")
+                except Exception as e:
+                    logger.warning(f"Prompt prefix caching disabled: {str(e)}")
+            
             logger.debug("Educational response generation pipeline loaded successfully")
             
         except Exception as e:
             logger.error(f"Failed to load enhanced generation model: {str(e)}")
             raise
 
-    def generate_educational_response(self, user_input: str, emotion_analysis: Dict) -> str:
+    @profiler.profiled("generate_educational_response")
+    def generate_educational_response(self, user_input: str, emotion_analysis: Dict,
+                                      session: Optional[ConversationSession] = None,
+                                      deadline: Optional[float] = None) -> str:
         """
         Generate context-aware educational response
+
+        When a session is given, its earlier turns are included in the prompt and the
+        turn is recorded in it afterwards. deadline is a time.monotonic() value; when
+        decoding runs into it, the partial reply is cut at its last sentence, or the
+        emotion-appropriate fallback is returned.
         """
-        logger.debug(f"Generating educational response for emotion analysis: {emotion_analysis}")
+        logger.debug("Generating educational response for emotion analysis: %s", emotion_analysis, sampled=True)
         
         try:
             if not user_input or not user_input.strip():
-                return "I'm here to help you learn! What would you like to talk about or work on today?"
+                return EMPTY_INPUT_RESPONSE
             
-            recommended_approach = emotion_analysis.get('recommended_approach', 'standard')
-            template_key = recommended_approach if recommended_approach in self.templates else 'standard'
+            turn_metrics.increment('turns')
+            decode_deadline = self._decode_deadline(deadline)
+            template_key, inputs, profile = self._prepare_generation(user_input, emotion_analysis, session)
             
-            logger.debug(f"Using template: {template_key}")
+            cache_key, cached_reply = self._cached_reply(user_input, emotion_analysis, inputs, session)
+            if cached_reply is not None:
+                if session is not None:
+                    session.memory.add_turn(user_input, emotion_analysis, cached_reply)
+                return cached_reply
             
-            template = self.templates[template_key]
-            prompt = PromptTemplate.from_template(template)
-            chain = prompt | self.llm_chain | StrOutputParser()
+            result = self._generate_raw(template_key, inputs, profile, session, decode_deadline)
             
-            inputs = {
-                "user_input": user_input.strip(),
-                "emotion_label": emotion_analysis.get('primary_emotion', 'neutral'),
-            }
+            if time.monotonic() >= decode_deadline:
+                response = self._deadline_response(result, emotion_analysis, profile)
+            else:
+                response = self._postprocess_response(result, emotion_analysis, profile)
+                self._remember_reply(cache_key, inputs, emotion_analysis, response)
+            if session is not None:
+                session.memory.add_turn(user_input, emotion_analysis, response)
             
-            if 'educational_context' in emotion_analysis:
-                inputs["educational_context"] = emotion_analysis['educational_context']
+            logger.debug("Generated educational response: %d characters", len(response))
+            return response
             
-            logger.debug("Invoking enhanced generation chain")
-            result = chain.invoke(inputs)
+        except Exception as e:
+            logger.error(f"Error generating educational response: {str(e)}")
+            turn_metrics.increment('generation_errors')
+            return self._get_educational_fallback(emotion_analysis)
+    
+    @profiler.profiled("stream_educational_response")
+    def stream_educational_response(self, user_input: str, emotion_analysis: Dict,
+                                    session: Optional[ConversationSession] = None,
+                                    deadline: Optional[float] = None) -> Iterator[str]:
+        """
+        Stream a context-aware educational response chunk by chunk.
+
+        The first few characters are held back until role prefixes can be stripped and
+        the reply is known to be long enough; the special-needs suffix is yielded last.
+        Concatenating the chunks gives the same text generate_educational_response would.
+        """
+        logger.debug("Streaming educational response for emotion analysis: %s", emotion_analysis, sampled=True)
+        
+        yield from self.postprocess_stream(
+            lambda template_key, inputs, profile, decode_deadline: self._stream_raw(
+                template_key, inputs, profile, session, decode_deadline
+            ),
+            user_input, emotion_analysis, session, deadline,
+        )
+    
+    def postprocess_stream(self, raw_stream: Callable[[str, Dict, GenerationProfile, float], Iterator[str]],
+                           user_input: str, emotion_analysis: Dict,
+                           session: Optional[ConversationSession] = None,
+                           deadline: Optional[float] = None) -> Iterator[str]:
+        """
+        Apply prefix stripping, stop strings, special-needs tips and fallbacks to a raw token stream.
+
+        raw_stream is called with the selected template key, its inputs, the generation
+        profile and the time.monotonic() value at which decoding must stop, and must yield
+        decoded text; it lets other generation backends (such as the batching scheduler)
+        share the streaming post-processing. Text already shown cannot be cut back when
+        the deadline hits, so an interrupted sentence is closed with an ellipsis instead.
+        """
+        chunks = self._postprocess_stream(raw_stream, user_input, emotion_analysis, session, deadline)
+        started = time.perf_counter()
+        first_chunk = True
+        try:
+            for chunk in chunks:
+                if first_chunk:
+                    first_chunk = False
+                    tracer.record_stage("chat.first_chunk", started, time.perf_counter() - started)
+                yield chunk
+        finally:
+            # Closing hands an abandoned stream on to the post-processing so it is counted as cancelled
+            chunks.close()
+            tracer.record_stage("chat.stream", started, time.perf_counter() - started)
+    
+    def _postprocess_stream(self, raw_stream: Callable[[str, Dict, GenerationProfile, float], Iterator[str]],
+                            user_input: str, emotion_analysis: Dict,
+                            session: Optional[ConversationSession] = None,
+                            deadline: Optional[float] = None) -> Iterator[str]:
+        """Post-processing behind postprocess_stream, which adds the stream timings"""
+        if not user_input or not user_input.strip():
+            yield EMPTY_INPUT_RESPONSE
+            return
+        
+        buffer = ""
+        streamed = ""
+        flushed = False
+        try:
+            turn_metrics.increment('turns')
+            decode_deadline = self._decode_deadline(deadline)
+            template_key, inputs, profile = self._prepare_generation(user_input, emotion_analysis, session)
+            stop_filter = StopStringFilter(profile.stop_strings)
             
-            response = result.strip()
+            cache_key, cached_reply = self._cached_reply(user_input, emotion_analysis, inputs, session)
+            if cached_reply is not None:
+                if session is not None:
+                    session.memory.add_turn(user_input, emotion_analysis, cached_reply)
+                streamed = cached_reply
+                yield cached_reply
+                return
             
-            prefixes_to_remove = ["Response:", "Assistant:", "AI:", "Bot:", "Tutor:"]
-            for prefix in prefixes_to_remove:
-                if response.startswith(prefix):
-                    response = response[len(prefix):].strip()
+            for chunk in raw_stream(template_key, inputs, profile, decode_deadline):
+                if not flushed:
+                    buffer += chunk
+                    stripped = self._strip_response_prefixes(buffer.lstrip())
+                    if len(stripped) < STREAM_HOLDBACK_CHARS:
+                        continue
+                    flushed = True
+                    chunk = stripped
+                
+                for safe_text in stop_filter.feed(chunk):
+                    streamed += safe_text
+                    yield safe_text
+                if stop_filter.stopped:
+                    break
             
-            response = self._enhance_response_for_special_needs(
-                response, emotion_analysis.get('special_needs_indicators', [])
-            )
+            deadline_hit = time.monotonic() >= decode_deadline
             
-            if len(response) < 15:
-                return self._get_educational_fallback(emotion_analysis)
+            if not flushed:
+                # Reply ended before the hold-back threshold; apply the regular post-processing
+                if deadline_hit:
+                    response = self._deadline_response(buffer, emotion_analysis, profile)
+                else:
+                    response = self._postprocess_response(buffer, emotion_analysis, profile)
+                    self._remember_reply(cache_key, inputs, emotion_analysis, response)
+                if session is not None:
+                    session.memory.add_turn(user_input, emotion_analysis, response)
+                yield response
+                return
             
-            logger.debug(f"Generated educational response: {len(response)} characters")
-            return response
+            for safe_text in stop_filter.flush():
+                streamed += safe_text
+                yield safe_text
+            
+            if not streamed.strip():
+                yield self._get_educational_fallback(emotion_analysis)
+                return
             
+            streamed = streamed.rstrip()
+            if deadline_hit:
+                turn_metrics.increment('deadline_misses')
+                turn_metrics.increment('deadline_partial_replies')
+                if not streamed.endswith(SENTENCE_ENDINGS):
+                    yield "..."
+                    streamed += "..."
+            enhanced = self._enhance_response_for_special_needs(
+                streamed, emotion_analysis.get('special_needs_indicators', [])
+            )
+            if session is not None:
+                session.memory.add_turn(user_input, emotion_analysis, enhanced)
+            if not deadline_hit:
+                self._remember_reply(cache_key, inputs, emotion_analysis, enhanced)
+            if len(enhanced) > len(streamed):
+                yield enhanced[len(streamed):]
+            
+        except GeneratorExit:
+            # The consumer went away (e.g. the student closed the page); generation is abandoned
+            turn_metrics.increment('generation_cancellations')
+            raise
         except Exception as e:
-            logger.error(f"Error generating educational response: {str(e)}")
+            logger.error(f"Error streaming educational response: {str(e)}")
+            turn_metrics.increment('generation_errors')
+            if not streamed:
+                yield self._get_educational_fallback(emotion_analysis)
+    
+    @staticmethod
+    def _depends_on_history(inputs: Dict, session: Optional[ConversationSession] = None) -> bool:
+        """Whether earlier turns shape this turn's reply, so a cached first-turn reply does not fit it"""
+        return bool(inputs.get('conversation_history')
+                    or (session is not None and (session.memory.turns or session.memory.summaries)))
+    
+    def _cached_reply(self, user_input: str, emotion_analysis: Dict, inputs: Dict,
+                      session: Optional[ConversationSession] = None) -> Tuple[Optional[tuple], Optional[str]]:
+        """
+        Look the turn up in the response cache; returns the cache key and a reply on a hit.
+
+        Turns of an ongoing conversation are never served from the cache: a short "yes" or
+        "I don't get it" means something different after every reply.
+        """
+        if self.response_cache is None or self._depends_on_history(inputs, session):
+            return None, None
+        cache_key = self.response_cache.make_key(emotion_analysis, user_input)
+        cached_reply = self.response_cache.get(cache_key)
+        if cached_reply is not None:
+            turn_metrics.increment('response_cache_hits')
+            logger.debug("Serving reply from response cache")
+        return cache_key, cached_reply
+    
+    def _remember_reply(self, cache_key: Optional[tuple], inputs: Dict, emotion_analysis: Dict, response: str):
+        """
+        Add a generated reply to the response cache.
+
+        Replies that depended on earlier turns or are canned fallbacks are not reusable.
+        """
+        if self.response_cache is None or cache_key is None or self._depends_on_history(inputs):
+            return
+        if response == self._get_educational_fallback(emotion_analysis):
+            return
+        self.response_cache.add(cache_key, response)
+    
+    def _decode_deadline(self, deadline: Optional[float]) -> float:
+        """Monotonic time at which decoding must stop for this turn"""
+        if deadline is None:
+            deadline = time.monotonic() + self.turn_deadline
+        return deadline - DEADLINE_MARGIN
+    
+    def _deadline_response(self, result: str, emotion_analysis: Dict, profile: GenerationProfile) -> str:
+        """Reply for a turn whose decoding ran into the deadline: complete sentences only, else the fallback"""
+        turn_metrics.increment('deadline_misses')
+        
+        response = self._strip_response_prefixes(result.strip())
+        response = truncate_at_stop_strings(response, profile.stop_strings)
+        partial = cut_at_sentence_boundary(response).strip()
+        
+        if len(partial) < 15:
+            turn_metrics.increment('deadline_fallback_replies')
+            return self._get_educational_fallback(emotion_analysis)
+        
+        turn_metrics.increment('deadline_partial_replies')
+        logger.debug("Deadline reached, returning %d characters of partial reply", len(partial))
+        return self._postprocess_response(partial, emotion_analysis, profile)
+    
+    def _prepare_generation(self, user_input: str, emotion_analysis: Dict,
+                            session: Optional[ConversationSession] = None) -> Tuple[str, Dict, GenerationProfile]:
+        """Select the template and generation profile and build the template's input variables"""
+        recommended_approach = emotion_analysis.get('recommended_approach', 'standard')
+        template_key = recommended_approach if recommended_approach in self.templates else 'standard'
+        profile = get_generation_profile(recommended_approach)
+        
+        logger.debug("Using template: %s (max_new_tokens=%d)", template_key, profile.max_new_tokens)
+        
+        inputs = {
+            "user_input": user_input.strip(),
+            "emotion_label": emotion_analysis.get('primary_emotion', 'neutral'),
+            "conversation_history": session.memory.render(self._count_tokens) if session is not None else "",
+        }
+        
+        if 'educational_context' in emotion_analysis:
+            inputs["educational_context"] = emotion_analysis['educational_context']
+        
+        return template_key, inputs, profile
+    
+    def _strip_response_prefixes(self, response: str) -> str:
+        """Remove role prefixes the model sometimes echoes at the start of a reply"""
+        for prefix in RESPONSE_PREFIXES:
+            if response.startswith(prefix):
+                response = response[len(prefix):].strip()
+        return response
+    
+    def _postprocess_response(self, result: str, emotion_analysis: Dict, profile: GenerationProfile) -> str:
+        """Strip prefixes and stop strings, add special-needs tips and fall back when the reply is too short"""
+        response = self._strip_response_prefixes(result.strip())
+        response = truncate_at_stop_strings(response, profile.stop_strings).strip()
+        
+        response = self._enhance_response_for_special_needs(
+            response, emotion_analysis.get('special_needs_indicators', [])
+        )
+        
+        if len(response) < 15:
             return self._get_educational_fallback(emotion_analysis)
+        
+        return response
+    
+    def _profile_generation_kwargs(self, profile: GenerationProfile, prompt_length: int,
+                                   decode_deadline: Optional[float] = None,
+                                   timer: Optional[DecodeTimer] = None) -> Dict:
+        """generate() arguments for one turn: shared token ids plus the profile's budget, sampling and stops"""
+        kwargs = dict(self.generation_kwargs)
+        kwargs.update(profile.sampling_kwargs())
+        kwargs['stopping_criteria'] = build_stopping_criteria(
+            self.tokenizer, prompt_length, profile, decode_deadline, timer
+        )
+        return kwargs
+    
+    def _record_decode_timing(self, timer: DecodeTimer, prompt_length: int, cached_length: int):
+        """
+        Export prefill and decode spans plus token throughput for a finished generate() call.
+
+        Only the prompt tokens not already covered by the reused KV cache are prefilled.
+        """
+        if timer.first_token_at is None:
+            return
+        tracer.record_stage(
+            "generation.prefill", timer.started, timer.first_token_at - timer.started,
+            tokens=prompt_length - cached_length, cached_tokens=cached_length,
+        )
+        decode_seconds = timer.last_token_at - timer.first_token_at
+        tracer.record_stage("generation.decode", timer.first_token_at, decode_seconds, tokens=timer.tokens)
+        # The first token comes out of the prefill pass, the rest are decode steps
+        tracer.record_tokens("generation", prompt_length, timer.tokens, decode_seconds if timer.tokens > 1 else 0.0)
+    
+    def prompt_ids(self, template_key: str, inputs: Dict):
+        """Token ids of the full prompt for a turn, without any KV cache"""
+        if self.prefix_cache is not None:
+            return self.prefix_cache.build_inputs(template_key, inputs, with_cache=False)['input_ids']
+        prompt = self.templates[template_key].format(**inputs)
+        return self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.model.device)
+    
+    def _cached_length(self, model_inputs: Dict) -> int:
+        """Number of prompt tokens already held by the KV cache attached to the model inputs"""
+        past_key_values = model_inputs.get('past_key_values')
+        return 0 if past_key_values is None else past_key_values.get_seq_length()
+    
+    def _count_tokens(self, text: str) -> int:
+        """Token count used for conversation memory budgets"""
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+    
+    def _build_model_inputs(self, template_key: str, inputs: Dict,
+                            session: Optional[ConversationSession] = None) -> Dict:
+        """
+        Tokenize the turn and attach the best available KV cache.
+
+        A session's cache from its previous turn is cropped to the tokens it shares with
+        this prompt, so only the new turn is prefilled; otherwise the template's
+        prefilled prefix is copied. Without a prefix cache the whole prompt is prefilled.
+        """
+        if self.prefix_cache is None:
+            with tracer.span("generation.tokenize"):
+                input_ids = self.prompt_ids(template_key, inputs)
+            return {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)}
+        
+        with tracer.span("generation.tokenize"):
+            model_inputs = self.prefix_cache.build_inputs(template_key, inputs, with_cache=False)
+        
+        past_key_values = None
+        if session is not None:
+            past_key_values = session.reusable_cache(
+                model_inputs['input_ids'], self.prefix_cache.prefix_length(template_key)
+            )
+        if past_key_values is None:
+            past_key_values = self.prefix_cache.copy_cache(template_key)
+        
+        if past_key_values is not None:
+            model_inputs['past_key_values'] = past_key_values
+        return model_inputs
+    
+    @torch.no_grad()
+    def _generate_raw(self, template_key: str, inputs: Dict, profile: GenerationProfile,
+                      session: Optional[ConversationSession] = None,
+                      decode_deadline: Optional[float] = None) -> str:
+        """Generate a reply, reusing the prefilled KV cache of the template prefix or the session when there is one"""
+        with session.lock if session is not None else contextlib.nullcontext():
+            model_inputs = self._build_model_inputs(template_key, inputs, session)
+            prompt_length = model_inputs['input_ids'].shape[-1]
+            cached_length = self._cached_length(model_inputs)
+            timer = DecodeTimer()
+            
+            try:
+                output_ids = cpu_layout.run(
+                    "generation", self.model.generate,
+                    **model_inputs, **self._profile_generation_kwargs(profile, prompt_length, decode_deadline, timer)
+                )
+            except Exception:
+                if session is not None:
+                    session.reset_cache()
+                raise
+            self._record_decode_timing(timer, prompt_length, cached_length)
+            if session is not None:
+                session.remember_cache(output_ids[0], model_inputs.get('past_key_values'))
+        
+        return self.tokenizer.decode(output_ids[0, prompt_length:], skip_special_tokens=True)
+    
+    def _stream_raw(self, template_key: str, inputs: Dict, profile: GenerationProfile,
+                    session: Optional[ConversationSession] = None,
+                    decode_deadline: Optional[float] = None) -> Iterator[str]:
+        """Yield raw decoded text as tokens are produced"""
+        if session is not None:
+            session.lock.acquire()
+        try:
+            yield from self._stream_with_cache(template_key, inputs, profile, session, decode_deadline)
+        finally:
+            if session is not None:
+                session.lock.release()
+    
+    def _stream_with_cache(self, template_key: str, inputs: Dict, profile: GenerationProfile,
+                           session: Optional[ConversationSession] = None,
+                           decode_deadline: Optional[float] = None) -> Iterator[str]:
+        """Run generate() in the background and yield decoded text from its streamer"""
+        model_inputs = self._build_model_inputs(template_key, inputs, session)
+        prompt_length = model_inputs['input_ids'].shape[-1]
+        cached_length = self._cached_length(model_inputs)
+        timer = DecodeTimer()
+        generate_kwargs = self._profile_generation_kwargs(profile, prompt_length, decode_deadline, timer)
+        # Set when the consumer goes away (a Streamlit rerun or disconnect) so generate() stops within a token
+        cancelled = threading.Event()
+        cancel_criteria = CancelCriteria(cancelled)
+        generate_kwargs['stopping_criteria'].append(cancel_criteria)
+        # Set when generate() outlives the wait below; the worker then leaves the session alone
+        abandoned = threading.Event()
+        streamer = TextIteratorStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT
+        )
+        errors = []
+        
+        def run_generation():
+            try:
+                with torch.no_grad():
+                    output_ids = self.model.generate(**model_inputs, **generate_kwargs, streamer=streamer)
+                self._record_decode_timing(timer, prompt_length, cached_length)
+                if session is not None and not abandoned.is_set():
+                    session.remember_cache(output_ids[0], model_inputs.get('past_key_values'))
+            except Exception as e:
+                errors.append(e)
+                if session is not None and not abandoned.is_set():
+                    session.reset_cache()
+                streamer.end()
+        
+        # Runs in a copy of this context so the worker's spans land in the caller's request trace
+        worker = cpu_layout.submit("generation", run_generation, thread_name="tutor-stream")
+        
+        try:
+            for chunk in streamer:
+                if chunk:
+                    yield chunk
+        finally:
+            # Also reached when the consumer stops early at a stop string or goes away
+            cancelled.set()
+            wait([worker], timeout=STREAM_TOKEN_TIMEOUT)
+            if cancel_criteria.stopped:
+                turn_metrics.increment('decode_cancellations')
+            if not worker.done():
+                # Still in a forward pass (e.g. a long prefill); the session lock is released after
+                # this, so the worker must not write the session cache it is growing in place
+                abandoned.set()
+                if session is not None:
+                    session.reset_cache()
+        
+        if errors:
+            raise errors[0]
     
     def _enhance_response_for_special_needs(self, response: str, indicators: list) -> str:
         """Add special formatting or suggestions based on special needs indicators"""
@@ -205,8 +655,30 @@ Response:"""
         
         return "I'm here to help you learn and grow! Every question you have is important. What would you like to explore together?"
 
-educational_response_generator = EducationalEmotionalResponseGenerator()
+# Resident until the registry evicts it for memory or idleness; reloaded on the next use
+model_registry = get_model_registry()
+model_registry.register('response_generator', EducationalEmotionalResponseGenerator)
 
-def generate_educational_response(user_input: str, emotion_analysis: Dict) -> str:
+def get_educational_response_generator() -> EducationalEmotionalResponseGenerator:
+    """Return the shared response generator, loading the causal model on first use or after eviction"""
+    return model_registry.get('response_generator')
+
+def is_educational_response_generator_loaded() -> bool:
+    """Whether the shared response generator is currently loaded"""
+    return model_registry.is_loaded('response_generator')
+
+def generate_educational_response(user_input: str, emotion_analysis: Dict,
+                                  session: Optional[ConversationSession] = None,
+                                  deadline: Optional[float] = None) -> str:
     """Global function for educational response generation"""
-    return educational_response_generator.generate_educational_response(user_input, emotion_analysis)
+    return get_educational_response_generator().generate_educational_response(
+        user_input, emotion_analysis, session, deadline
+    )
+
+def stream_educational_response(user_input: str, emotion_analysis: Dict,
+                                session: Optional[ConversationSession] = None,
+                                deadline: Optional[float] = None) -> Iterator[str]:
+    """Global function for streaming educational response generation"""
+    return get_educational_response_generator().stream_educational_response(
+        user_input, emotion_analysis, session, deadline
+    )
@@ -0,0 +1,230 @@
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+DEFAULT_STOP_STRINGS = (
+    "Student's message:",
+    "Detected emotion:",
+    "Educational context:",
+    "Guidelines:",
+    "Response:",
+    "\nStudent:",
+    "\nUser:",
+)
+
+SENTENCE_ENDINGS = (".", "!", "?")
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"[.!?](?:[\"')\]]*)(?=\s|$)")
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    max_new_tokens: int = 150
+    min_new_tokens: int = 50
+    temperature: float = 0.3
+    top_p: float = 0.9
+    top_k: int = 50
+    repetition_penalty: float = 1.1
+    stop_strings: Tuple[str, ...] = field(default=DEFAULT_STOP_STRINGS)
+    stop_at_sentence_end: bool = True
+
+    def sampling_kwargs(self) -> Dict:
+        """generate() keyword arguments controlled by this profile"""
+        return {
+            'max_new_tokens': self.max_new_tokens,
+            'min_new_tokens': self.min_new_tokens,
+            'temperature': self.temperature,
+            'top_p': self.top_p,
+            'top_k': self.top_k,
+            'repetition_penalty': self.repetition_penalty,
+        }
+
+# Keyed by the detector's recommended_approach; unknown approaches use 'standard'
+GENERATION_PROFILES: Dict[str, GenerationProfile] = {
+    'adhd_supportive': GenerationProfile(max_new_tokens=90, min_new_tokens=25, temperature=0.4),
+    'dyslexia_supportive': GenerationProfile(max_new_tokens=110, min_new_tokens=30),
+    'learning_supportive': GenerationProfile(max_new_tokens=150, min_new_tokens=40),
+    'confidence_building': GenerationProfile(max_new_tokens=130, min_new_tokens=40, temperature=0.4),
+    'encouraging': GenerationProfile(max_new_tokens=100, min_new_tokens=30, temperature=0.5),
+    'standard': GenerationProfile(),
+}
+
+def get_generation_profile(recommended_approach: str) -> GenerationProfile:
+    """Return the generation profile for an approach, defaulting to 'standard'"""
+    return GENERATION_PROFILES.get(recommended_approach, GENERATION_PROFILES['standard'])
+
+def find_stop_string(text: str, stop_strings: Iterable[str]) -> int:
+    """
+    Index of the earliest stop string that follows some reply text, or -1.
+
+    A stop string at the very start (e.g. an echoed "Response:") is a role prefix,
+    not the end of the reply, so it is skipped.
+    """
+    cut = -1
+    for stop in stop_strings:
+        index = text.find(stop)
+        while index != -1 and not text[:index].strip():
+            index = text.find(stop, index + 1)
+        if index != -1 and (cut == -1 or index < cut):
+            cut = index
+    return cut
+
+def truncate_at_stop_strings(text: str, stop_strings: Iterable[str]) -> str:
+    """Cut text at the earliest stop string, if any appears"""
+    cut = find_stop_string(text, stop_strings)
+    return text if cut == -1 else text[:cut]
+
+def cut_at_sentence_boundary(text: str) -> str:
+    """Cut text after its last complete sentence; empty when no sentence has ended yet"""
+    last_end = None
+    for match in SENTENCE_BOUNDARY_PATTERN.finditer(text):
+        last_end = match.end()
+    return text[:last_end] if last_end is not None else ""
+
+class DeadlineCriteria(StoppingCriteria):
+    def __init__(self, deadline: float):
+        """
+        Initialization of class arguments.
+
+        1. deadline -> float -> time.monotonic() value at which decoding must stop.\n
+        """
+        self.deadline = deadline
+        self.expired = False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if time.monotonic() >= self.deadline:
+            self.expired = True
+        return torch.full((input_ids.shape[0],), self.expired, dtype=torch.bool, device=input_ids.device)
+
+class CancelCriteria(StoppingCriteria):
+    def __init__(self, cancelled: threading.Event):
+        """
+        Initialization of class arguments.
+
+        1. cancelled -> threading.Event -> Set when nobody reads the output any more, e.g. a closed stream.
+
+        """
+        self.cancelled = cancelled
+        self.stopped = False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.cancelled.is_set():
+            self.stopped = True
+        return torch.full((input_ids.shape[0],), self.stopped, dtype=torch.bool, device=input_ids.device)
+
+class DecodeTimer(StoppingCriteria):
+    """
+    Never stops generation; timestamps decoding steps to split prefill from decode time.
+
+    Stopping criteria run once per generated token, so the first call marks the end of
+    the prefill forward pass and the call count is the number of tokens produced.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+        self.tokens = 0
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.tokens += 1
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+class StopSequenceCriteria(StoppingCriteria):
+    def __init__(self, tokenizer, prompt_length: int, profile: GenerationProfile, lookback_tokens: int = 16):
+        """
+        Initialization of class arguments.
+
+        1. tokenizer -> AutoTokenizer -> Tokenizer used to decode the generated tail.\n
+        2. prompt_length -> int -> Number of prompt tokens preceding the generated ones.\n
+        3. profile -> GenerationProfile -> Supplies the stop strings and minimum length.\n
+        4. lookback_tokens -> int -> How many trailing tokens to decode on each step.\n
+        """
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.profile = profile
+        self.lookback_tokens = lookback_tokens
+
+    def _should_stop(self, generated_ids) -> bool:
+        """Decide for a single sequence whether decoding can end"""
+        generated = generated_ids.shape[-1]
+        if generated == 0:
+            return False
+
+        tail = self.tokenizer.decode(generated_ids[-self.lookback_tokens:], skip_special_tokens=True)
+        if generated > self.lookback_tokens:
+            if any(stop in tail for stop in self.profile.stop_strings):
+                return True
+        elif find_stop_string(tail, self.profile.stop_strings) != -1:
+            return True
+
+        if self.profile.stop_at_sentence_end and generated >= self.profile.min_new_tokens:
+            return tail.rstrip().endswith(SENTENCE_ENDINGS)
+
+        return False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        flags = [self._should_stop(sequence[self.prompt_length:]) for sequence in input_ids]
+        return torch.tensor(flags, dtype=torch.bool, device=input_ids.device)
+
+def build_stopping_criteria(tokenizer, prompt_length: int, profile: GenerationProfile,
+                            deadline: float = None, timer: DecodeTimer = None) -> StoppingCriteriaList:
+    """Stopping criteria list for a single generate() call"""
+    criteria = StoppingCriteriaList([StopSequenceCriteria(tokenizer, prompt_length, profile)])
+    if deadline is not None:
+        criteria.append(DeadlineCriteria(deadline))
+    if timer is not None:
+        criteria.append(timer)
+    return criteria
+
+class StopStringFilter:
+    def __init__(self, stop_strings: Iterable[str]):
+        """
+        Initialization of class arguments.
+
+        1. stop_strings -> Iterable[str] -> Strings that end the streamed reply.\n
+        """
+        self.stop_strings = list(stop_strings)
+        self.holdback = max((len(stop) for stop in self.stop_strings), default=0)
+        self.pending = ""
+        self.stopped = False
+
+    def feed(self, chunk: str) -> Iterator[str]:
+        """
+        Yield the part of the stream that can no longer turn into a stop string.
+
+        Up to the length of the longest stop string is kept back so a stop string
+        split across chunks is never shown to the student.
+        """
+        if self.stopped:
+            return
+        self.pending += chunk
+
+        cut = -1
+        for stop in self.stop_strings:
+            index = self.pending.find(stop)
+            if index != -1 and (cut == -1 or index < cut):
+                cut = index
+        if cut != -1:
+            self.stopped = True
+            truncated, self.pending = self.pending[:cut], ""
+            if truncated:
+                yield truncated
+            return
+
+        safe_length = len(self.pending) - self.holdback
+        if safe_length > 0:
+            yield self.pending[:safe_length]
+            self.pending = self.pending[safe_length:]
+
+    def flush(self) -> List[str]:
+        """Release whatever is still held back once the stream ends"""
+        remaining, self.pending = self.pending, ""
+        return [remaining] if remaining and not self.stopped else []
@@ -0,0 +1,368 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+from conversation_memory import ConversationSession
+from generation_pipeline import STREAM_TOKEN_TIMEOUT, get_educational_response_generator
+from generation_profiles import DecodeTimer, GenerationProfile, StopSequenceCriteria
+from shared.cpu_layout import get_cpu_layout
+from shared.logger import Logger
+from shared.tracing import get_tracer
+from turn_metrics import turn_metrics
+
+logger = Logger(name="Generation Scheduler", log_file_needed=True, log_file='Logs/generation_scheduler.log', level='DEV')
+tracer = get_tracer("chatbot")
+cpu_layout = get_cpu_layout()
+
+BATCHING_ENABLED = os.environ.get("CHATBOT_BATCHING", "0") == "1"
+
+_END_OF_STREAM = object()
+
+class BatchRequest:
+    def __init__(self, prompt_ids: torch.Tensor, profile: GenerationProfile, deadline: Optional[float] = None):
+        """
+        Initialization of class arguments.
+
+        1. prompt_ids -> torch.Tensor -> 1D token ids of the full prompt.\n
+        2. profile -> GenerationProfile -> Token budget, sampling and stop settings.\n
+        3. deadline -> float | None -> time.monotonic() value at which this row must stop decoding.\n
+        """
+        self.prompt_ids = prompt_ids
+        self.profile = profile
+        self.deadline = deadline
+        self.chunks = queue.Queue()
+        self.enqueued_at = time.monotonic()
+        self.closed = False
+        # Set when the consumer stops reading, so the batch stops decoding this row
+        self.cancelled = threading.Event()
+
+    def close(self, error: Optional[BaseException] = None):
+        """End this request's stream; with an error, its consumer raises it instead of ending normally"""
+        if not self.closed:
+            self.closed = True
+            self.chunks.put(_END_OF_STREAM if error is None else error)
+
+    def batch_key(self) -> tuple:
+        """Requests can share a batch only if their sampling settings match"""
+        kwargs = self.profile.sampling_kwargs()
+        return (kwargs['temperature'], kwargs['top_p'], kwargs['top_k'], kwargs['repetition_penalty'])
+
+    def iter_chunks(self) -> Iterator[str]:
+        """Yield decoded text for this request until its row of the batch finishes or the reader goes away"""
+        try:
+            while True:
+                item = self.chunks.get(timeout=STREAM_TOKEN_TIMEOUT)
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.cancelled.set()
+
+class BatchStreamer(BaseStreamer):
+    def __init__(self, tokenizer, requests: List[BatchRequest], eos_token_ids: set):
+        """
+        Initialization of class arguments.
+
+        1. tokenizer -> AutoTokenizer -> Used to decode each row incrementally.\n
+        2. requests -> List[BatchRequest] -> One request per batch row.\n
+        3. eos_token_ids -> set -> Token ids that end a row.\n
+        """
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.eos_token_ids = eos_token_ids
+        self.tokens = [[] for _ in requests]
+        self.sent = ["" for _ in requests]
+        self.finished = [False for _ in requests]
+        self.prompt_seen = False
+
+    def put(self, value):
+        """Receive the newly sampled token of every row and forward each row's new text"""
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+
+        value = value.reshape(len(self.requests), -1)
+        for row, request in enumerate(self.requests):
+            if self.finished[row]:
+                continue
+            token = int(value[row, -1])
+            if token in self.eos_token_ids:
+                self.finish(row)
+                continue
+
+            self.tokens[row].append(token)
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            if text.endswith("�"):
+                # Incomplete multi-byte character, wait for the next token
+                continue
+            delta = text[len(self.sent[row]):]
+            if delta:
+                self.sent[row] = text
+                request.chunks.put(delta)
+
+    def finish(self, row: int):
+        """Close the stream of one row"""
+        if not self.finished[row]:
+            self.finished[row] = True
+            self.requests[row].close()
+
+    def end(self):
+        for row in range(len(self.requests)):
+            self.finish(row)
+
+    def fail(self, error: BaseException):
+        """Hand a failed generate() to every row still streaming, so its caller falls back and counts it"""
+        for row, request in enumerate(self.requests):
+            if not self.finished[row]:
+                self.finished[row] = True
+                request.close(error)
+
+class BatchStopCriteria(StoppingCriteria):
+    def __init__(self, tokenizer, prompt_length: int, requests: List[BatchRequest], streamer: BatchStreamer):
+        """
+        Initialization of class arguments.
+
+        1. tokenizer -> AutoTokenizer -> Used by the per-row stop string checks.\n
+        2. prompt_length -> int -> Padded prompt length shared by every row.\n
+        3. requests -> List[BatchRequest] -> One request per batch row, each with its own profile.\n
+        4. streamer -> BatchStreamer -> Notified when a row finishes so its caller returns immediately.\n
+        """
+        self.prompt_length = prompt_length
+        self.requests = requests
+        self.streamer = streamer
+        self.row_criteria = [
+            StopSequenceCriteria(tokenizer, prompt_length, request.profile) for request in requests
+        ]
+        self.done = [False for _ in requests]
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        now = time.monotonic()
+        for row, sequence in enumerate(input_ids):
+            if self.done[row]:
+                continue
+            request = self.requests[row]
+            generated = sequence[self.prompt_length:]
+            if request.cancelled.is_set() and not self.streamer.finished[row]:
+                turn_metrics.increment('decode_cancellations')
+                self.done[row] = True
+                self.streamer.finish(row)
+                continue
+            if (self.streamer.finished[row]
+                    or generated.shape[-1] >= request.profile.max_new_tokens
+                    or (request.deadline is not None and now >= request.deadline)
+                    or self.row_criteria[row]._should_stop(generated)):
+                self.done[row] = True
+                self.streamer.finish(row)
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+class BatchMinNewTokens(LogitsProcessor):
+    def __init__(self, prompt_length: int, requests: List[BatchRequest], eos_token_ids: set):
+        """
+        Initialization of class arguments.
+
+        1. prompt_length -> int -> Padded prompt length shared by every row.\n
+        2. requests -> List[BatchRequest] -> One request per batch row, each with its own min_new_tokens.\n
+        3. eos_token_ids -> set -> Token ids suppressed until a row reaches its minimum.\n
+        """
+        self.prompt_length = prompt_length
+        self.min_new_tokens = [request.profile.min_new_tokens for request in requests]
+        self.eos_token_ids = sorted(eos_token_ids)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        generated = input_ids.shape[-1] - self.prompt_length
+        for row, minimum in enumerate(self.min_new_tokens):
+            if generated < minimum:
+                scores[row, self.eos_token_ids] = -float("inf")
+        return scores
+
+class GenerationScheduler:
+    def __init__(self, generator=None, max_batch_size: int = 8, max_wait_ms: float = 25.0):
+        """
+        Initialization of class arguments.
+
+        1. generator -> EducationalEmotionalResponseGenerator -> Shared generator, loaded lazily when None.\n
+        2. max_batch_size -> int -> Maximum number of chat turns decoded together.\n
+        3. max_wait_ms -> float -> Longest time the first request of a batch waits for company.\n
+        """
+        self._generator = generator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self._deferred: List[BatchRequest] = []
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batch_sizes = deque(maxlen=1000)
+
+    @property
+    def generator(self):
+        # Not cached, so the scheduler never pins a generator the model registry has evicted
+        if self._generator is None:
+            return get_educational_response_generator()
+        return self._generator
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+                self._worker.start()
+
+    def stream(self, user_input: str, emotion_analysis: Dict,
+               session: Optional[ConversationSession] = None,
+               deadline: Optional[float] = None) -> Iterator[str]:
+        """Stream one chat turn through the shared batch; post-processing matches stream_educational_response"""
+        generator = self.generator
+
+        def raw_stream(template_key: str, inputs: Dict, profile: GenerationProfile,
+                       decode_deadline: float) -> Iterator[str]:
+            prompt_ids = generator.prompt_ids(template_key, inputs)[0]
+            request = BatchRequest(prompt_ids, profile, decode_deadline)
+            self._ensure_worker()
+            self.requests.put(request)
+            return request.iter_chunks()
+
+        return generator.postprocess_stream(raw_stream, user_input, emotion_analysis, session, deadline)
+
+    def generate(self, user_input: str, emotion_analysis: Dict,
+                 session: Optional[ConversationSession] = None,
+                 deadline: Optional[float] = None) -> str:
+        """Blocking variant of stream()"""
+        return "".join(self.stream(user_input, emotion_analysis, session, deadline))
+
+    def _collect_batch(self) -> List[BatchRequest]:
+        """
+        Gather up to max_batch_size compatible requests, waiting at most max_wait after the first.
+
+        Requests with different sampling settings are deferred to the next batch in arrival order.
+        """
+        first = self._deferred.pop(0) if self._deferred else self.requests.get()
+        batch = [first]
+        key = first.batch_key()
+
+        still_deferred = []
+        for request in self._deferred:
+            if len(batch) < self.max_batch_size and request.batch_key() == key:
+                batch.append(request)
+            else:
+                still_deferred.append(request)
+        self._deferred = still_deferred
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request.batch_key() == key:
+                batch.append(request)
+            else:
+                self._deferred.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._generate_batch(batch)
+            except Exception as e:
+                logger.error(f"Batched generation failed for {len(batch)} requests: {str(e)}")
+                for request in batch:
+                    request.close(e)
+
+    @torch.no_grad()
+    def _generate_batch(self, batch: List[BatchRequest]):
+        """Left-pad the prompts and decode the whole batch in one generate() call"""
+        generator = self.generator
+        now = time.monotonic()
+        expired = [request for request in batch
+                   if request.cancelled.is_set() or (request.deadline is not None and now >= request.deadline)]
+        for request in expired:
+            # Out of time or abandoned while queued; the caller, if any, falls back without any decoding
+            request.close()
+        batch = [request for request in batch if request not in expired]
+        if not batch:
+            return
+
+        tokenizer = generator.tokenizer
+        pad_token_id = generator.generation_kwargs['pad_token_id']
+
+        prompt_length = max(request.prompt_ids.shape[-1] for request in batch)
+        input_ids = torch.full((len(batch), prompt_length), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), prompt_length), dtype=torch.long)
+        for row, request in enumerate(batch):
+            length = request.prompt_ids.shape[-1]
+            input_ids[row, prompt_length - length:] = request.prompt_ids
+            attention_mask[row, prompt_length - length:] = 1
+        input_ids = input_ids.to(generator.model.device)
+        attention_mask = attention_mask.to(generator.model.device)
+
+        eos_token_ids = generator.generation_kwargs['eos_token_id']
+        if not isinstance(eos_token_ids, (list, tuple, set)):
+            eos_token_ids = [eos_token_ids]
+        streamer = BatchStreamer(tokenizer, batch, set(eos_token_ids))
+        stopping = BatchStopCriteria(tokenizer, prompt_length, batch, streamer)
+        timer = DecodeTimer()
+
+        generate_kwargs = dict(generator.generation_kwargs)
+        generate_kwargs.update(batch[0].profile.sampling_kwargs())
+        generate_kwargs['max_new_tokens'] = max(request.profile.max_new_tokens for request in batch)
+        # Each row keeps its own profile's minimum; a batch-wide one would let rows end early at EOS
+        generate_kwargs.pop('min_new_tokens', None)
+
+        waited = time.monotonic() - min(request.enqueued_at for request in batch)
+        logger.debug("Decoding batch of %d (oldest waited %.0f ms)", len(batch), waited * 1000)
+        self.batch_sizes.append(len(batch))
+
+        try:
+            cpu_layout.run(
+                "generation", generator.model.generate,
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                stopping_criteria=StoppingCriteriaList([stopping, timer]),
+                logits_processor=LogitsProcessorList([BatchMinNewTokens(prompt_length, batch, set(eos_token_ids))]),
+                streamer=streamer,
+                **generate_kwargs,
+            )
+        except BaseException as e:
+            # Rows still streaming get the error, not an end marker that would read as an empty reply
+            streamer.fail(e)
+            raise
+        streamer.end()
+        
+        if timer.first_token_at is not None:
+            tracer.record_stage("batch.prefill", timer.started, timer.first_token_at - timer.started,
+                                batch_size=len(batch))
+            decode_seconds = timer.last_token_at - timer.first_token_at
+            tracer.record_stage("batch.decode", timer.first_token_at, decode_seconds, batch_size=len(batch))
+            # Steps advance every row at once, so throughput counts the tokens of the whole batch
+            tracer.record_tokens(
+                "batch",
+                sum(request.prompt_ids.shape[-1] for request in batch),
+                sum(len(tokens) for tokens in streamer.tokens),
+                decode_seconds,
+            )
+
+_generation_scheduler = None
+_generation_scheduler_lock = threading.Lock()
+
+def get_generation_scheduler() -> GenerationScheduler:
+    """Return the process-wide scheduler shared by every chat session"""
+    global _generation_scheduler
+    with _generation_scheduler_lock:
+        if _generation_scheduler is None:
+            _generation_scheduler = GenerationScheduler(
+                max_batch_size=int(os.environ.get("CHATBOT_MAX_BATCH_SIZE", "8")),
+                max_wait_ms=float(os.environ.get("CHATBOT_MAX_BATCH_WAIT_MS", "25")),
+            )
+    return _generation_scheduler
@@ -0,0 +1,385 @@
+"""
+Replay student messages against emotion detection plus reply generation under concurrent load.
+
+Usage:
+    # Fully offline against tiny randomly initialised stand-in models
+    python load_test.py --stand-in Logs/stand_in_models --concurrency 8 --rate 4 --requests 200
+
+    # Against the real models, with recorded messages (JSONL with a "text" field, or one message per line)
+    python load_test.py --corpus Logs/messages.jsonl --concurrency 16 --rate 2 --duration 300 --json
+
+--rate is the mean arrival rate in requests/s (Poisson arrivals); 0 runs a closed loop where every
+worker sends its next message as soon as the previous reply arrives. Latency is measured from the
+scheduled arrival, so time spent queueing for a free worker counts. Set CPU_LAYOUT (see
+shared/cpu_layout.py) to compare core partitions; the report then includes per-pool utilization.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_precision import current_rss_mb
+from conversation_memory import ConversationSession
+from emotion_detection_pipeline import EmotionDetector
+from generation_pipeline import EducationalEmotionalResponseGenerator
+from shared.cpu_layout import get_cpu_layout
+from turn_metrics import turn_metrics
+
+# Synthetic messages covering every educational context and special-needs pattern the detector knows
+SYNTHETIC_CORPUS = {
+    'frustration': [
+        "I don't understand fractions at all, this is too hard",
+        "I'm stuck on this math problem and I want to give up",
+        "this homework is impossible and I hate it",
+        "I keep getting confused with long division",
+    ],
+    'anxiety': [
+        "I'm really nervous about the spelling test tomorrow",
+        "what if I fail my science exam",
+        "I'm scared to try reading out loud in class",
+        "I'm worried my grade will be bad",
+    ],
+    'confidence': [
+        "I'm not smart like everyone else in my class",
+        "I'm bad at math, I can't do it",
+        "everyone else is better than me at reading",
+    ],
+    'engagement': [
+        "I love learning about planets, can you show me more?",
+        "dinosaurs are so cool, I want to learn about them",
+        "that experiment was awesome, what else can we try?",
+    ],
+    'adhd': [
+        "this is boring and I can't sit still anymore",
+        "I keep forgetting what the question was, my mind keeps wandering",
+        "I lost focus again, I need to move around",
+    ],
+    'dyslexia': [
+        "the letters are jumbled and the words are moving",
+        "it's hard to read this page, letters are backwards",
+        "the words are mixed up when I try to read",
+    ],
+    'neutral': [
+        "hi",
+        "can you help me with my homework?",
+        "what is photosynthesis?",
+        "how do I find the area of a rectangle?",
+        "thank you",
+    ],
+}
+
+EMOTION_LABELS = ["sadness", "joy", "love", "anger", "fear", "surprise"]
+
+def load_corpus(path: str = "") -> List[str]:
+    """Messages to replay: the synthetic mix, or a JSONL/text file of recorded messages"""
+    if not path:
+        return [message for messages in SYNTHETIC_CORPUS.values() for message in messages]
+
+    messages = []
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line).get("text", "")
+            if line:
+                messages.append(line)
+    return messages
+
+def build_stand_in_models(directory: str, corpus: List[str]) -> Dict[str, str]:
+    """
+    Create tiny randomly initialised chat and emotion models that load without any download.
+
+    Both share a word-level tokenizer trained on the corpus; replies are gibberish, but every
+    code path (prefix cache, stopping criteria, streaming, classification) runs as in production.
+    """
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import (
+        BertConfig,
+        BertForSequenceClassification,
+        LlamaConfig,
+        LlamaForCausalLM,
+        PreTrainedTokenizerFast,
+    )
+
+    chat_dir = os.path.join(directory, "chat")
+    emotion_dir = os.path.join(directory, "emotion")
+    if os.path.exists(os.path.join(chat_dir, "config.json")) and os.path.exists(os.path.join(emotion_dir, "config.json")):
+        return {'chat': chat_dir, 'emotion': emotion_dir}
+
+    special_tokens = ["[UNK]", "[PAD]", "[CLS]", "[SEP]", "[MASK]", "<s>", "</s>"]
+    word_tokenizer = Tokenizer(models.WordLevel(unk_token="[UNK]"))
+    word_tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    word_tokenizer.decoder = decoders.WordPiece(prefix="##")
+    training_text = corpus + [
+        "Student's message: Detected emotion: Educational context: Response: Guidelines:",
+        "You are a friendly, supportive AI tutor who helps children with their learning.",
+    ]
+    word_tokenizer.train_from_iterator(training_text, trainers.WordLevelTrainer(special_tokens=special_tokens))
+
+    chat_tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=word_tokenizer, unk_token="[UNK]", pad_token="[PAD]", bos_token="<s>", eos_token="</s>"
+    )
+    chat_model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=len(chat_tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=2048,
+        bos_token_id=chat_tokenizer.bos_token_id, eos_token_id=chat_tokenizer.eos_token_id,
+        pad_token_id=chat_tokenizer.pad_token_id,
+    ))
+    chat_model.save_pretrained(chat_dir)
+    chat_tokenizer.save_pretrained(chat_dir)
+
+    emotion_tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=word_tokenizer, unk_token="[UNK]", pad_token="[PAD]", cls_token="[CLS]",
+        sep_token="[SEP]", mask_token="[MASK]", model_max_length=512,
+    )
+    emotion_model = BertForSequenceClassification(BertConfig(
+        vocab_size=len(emotion_tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_labels=len(EMOTION_LABELS),
+        id2label=dict(enumerate(EMOTION_LABELS)), label2id={label: index for index, label in enumerate(EMOTION_LABELS)},
+    ))
+    emotion_model.save_pretrained(emotion_dir)
+    emotion_tokenizer.save_pretrained(emotion_dir)
+
+    return {'chat': chat_dir, 'emotion': emotion_dir}
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def cpu_seconds() -> float:
+    """User plus system CPU time of this process"""
+    times = os.times()
+    return times.user + times.system
+
+class ResourceSampler:
+    def __init__(self, interval: float = 1.0):
+        """
+        Initialization of class arguments.
+
+        1. interval -> float -> Seconds between CPU and RSS samples.\n
+        """
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="load-test-sampler", daemon=True)
+
+    def _run(self):
+        started = time.monotonic()
+        last_time, last_cpu = started, cpu_seconds()
+        while not self._stop.wait(self.interval):
+            now, cpu = time.monotonic(), cpu_seconds()
+            self.samples.append({
+                'elapsed_s': round(now - started, 2),
+                # 100% is one fully busy core
+                'cpu_percent': round(100.0 * (cpu - last_cpu) / (now - last_time), 1),
+                'rss_mb': round(current_rss_mb(), 1),
+            })
+            last_time, last_cpu = now, cpu
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+class LoadTest:
+    def __init__(self, detector: EmotionDetector, generator: EducationalEmotionalResponseGenerator,
+                 corpus: List[str], concurrency: int = 4, rate: float = 0.0, students: int = 0,
+                 scheduler=None, seed: int = 0):
+        """
+        Initialization of class arguments.
+
+        1. detector / generator -> Loaded pipeline objects, real or stand-in.\n
+        2. corpus -> List[str] -> Messages replayed in random order.\n
+        3. concurrency -> int -> Number of requests in flight at most.\n
+        4. rate -> float -> Mean arrivals per second (Poisson); 0 runs a closed loop.\n
+        5. students -> int -> Simulated students with their own conversation memory; 0 sends stateless turns.\n
+        6. scheduler -> GenerationScheduler | None -> Route generation through the batching scheduler.\n
+        7. seed -> int -> Seed for message order and arrival times.\n
+        """
+        self.detector = detector
+        self.generator = generator
+        self.corpus = corpus
+        self.concurrency = concurrency
+        self.rate = rate
+        self.scheduler = scheduler
+        self.random = random.Random(seed)
+        self.sessions = [ConversationSession() for _ in range(students)]
+        self.results = []
+        self._lock = threading.Lock()
+
+    def _request(self, index: int, message: str, scheduled_at: float):
+        started = time.monotonic()
+        record = {'index': index, 'queued_s': started - scheduled_at, 'error': False, 'fallback': False}
+        session = self.sessions[index % len(self.sessions)] if self.sessions else None
+        try:
+            emotion_analysis = self.detector.detect_educational_emotion(message)
+            detected = time.monotonic()
+            record['detect_s'] = detected - started
+            record['error'] = emotion_analysis.get('educational_context') == 'error'
+
+            if self.scheduler is not None:
+                reply = self.scheduler.generate(message, emotion_analysis, session)
+            else:
+                reply = self.generator.generate_educational_response(message, emotion_analysis, session)
+            record['generate_s'] = time.monotonic() - detected
+            record['fallback'] = reply == self.generator._get_educational_fallback(emotion_analysis)
+        except Exception:
+            record['error'] = True
+        record['latency_s'] = time.monotonic() - scheduled_at
+        with self._lock:
+            self.results.append(record)
+
+    def run(self, requests: int = 0, duration: float = 0.0) -> float:
+        """Send requests until the request count or duration is reached; returns the wall time"""
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load-test") as pool:
+            if self.rate > 0:
+                next_arrival = started
+                index = 0
+                while (not requests or index < requests) and (not duration or next_arrival - started < duration):
+                    delay = next_arrival - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(self._request, index, self.random.choice(self.corpus), next_arrival)
+                    index += 1
+                    next_arrival += self.random.expovariate(self.rate)
+            else:
+                counter = iter(range(requests or 10 ** 9))
+                counter_lock = threading.Lock()
+
+                def closed_loop():
+                    while not duration or time.monotonic() - started < duration:
+                        with counter_lock:
+                            index = next(counter, None)
+                            message = self.random.choice(self.corpus)
+                        if index is None:
+                            return
+                        self._request(index, message, time.monotonic())
+
+                for _ in range(self.concurrency):
+                    pool.submit(closed_loop)
+        return time.monotonic() - started
+
+    def report(self, wall_seconds: float, samples: List[Dict]) -> Dict:
+        latencies = [record['latency_s'] for record in self.results]
+        detect = [record['detect_s'] for record in self.results if 'detect_s' in record]
+        generate = [record['generate_s'] for record in self.results if 'generate_s' in record]
+        total = len(self.results)
+
+        def summary(values: List[float]) -> Dict:
+            return {
+                name: None if value is None else round(value, 3)
+                for name, value in (
+                    ('p50', percentile(values, 0.50)),
+                    ('p95', percentile(values, 0.95)),
+                    ('p99', percentile(values, 0.99)),
+                    ('max', max(values) if values else None),
+                )
+            }
+
+        return {
+            'requests': total,
+            'wall_seconds': round(wall_seconds, 2),
+            'throughput_rps': round(total / wall_seconds, 3) if wall_seconds else 0.0,
+            'latency_s': summary(latencies),
+            'detect_s': summary(detect),
+            'generate_s': summary(generate),
+            'queued_s': summary([record['queued_s'] for record in self.results]),
+            'error_rate': round(sum(record['error'] for record in self.results) / total, 4) if total else 0.0,
+            'fallback_rate': round(sum(record['fallback'] for record in self.results) / total, 4) if total else 0.0,
+            'turn_metrics': turn_metrics.snapshot(),
+            'cpu_pools': get_cpu_layout().stats(),
+            'cpu_percent_avg': round(sum(s['cpu_percent'] for s in samples) / len(samples), 1) if samples else None,
+            'cpu_percent_max': max((s['cpu_percent'] for s in samples), default=None),
+            'rss_mb_peak': max((s['rss_mb'] for s in samples), default=None),
+            'timeline': samples,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of emotion detection plus reply generation")
+    parser.add_argument("--corpus", default="", help="JSONL (\"text\" field) or text file of messages, defaults to the synthetic mix")
+    parser.add_argument("--stand-in", default="", help="Directory for tiny offline stand-in models (created if missing)")
+    parser.add_argument("--chat-model", default="meta-llama/Llama-3.2-1B-Instruct")
+    parser.add_argument("--emotion-model", default="bhadresh-savani/bert-base-uncased-emotion")
+    parser.add_argument("--precision", default=None, help="Causal model precision mode, see benchmark_precision.py")
+    parser.add_argument("--execution-profile", default=None, help="e.g. sdpa+compile, see benchmark_execution.py")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.0, help="Mean arrivals per second; 0 runs a closed loop")
+    parser.add_argument("--requests", type=int, default=100, help="Stop after this many requests (0: no limit)")
+    parser.add_argument("--duration", type=float, default=0.0, help="Stop sending after this many seconds (0: no limit)")
+    parser.add_argument("--students", type=int, default=0, help="Simulated students with conversation memory")
+    parser.add_argument("--batching", action="store_true", help="Generate through the batching scheduler")
+    parser.add_argument("--deadline", type=float, default=None, help="Per-turn deadline in seconds")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args()
+
+    if not args.requests and not args.duration:
+        parser.error("set --requests or --duration")
+
+    corpus = load_corpus(args.corpus)
+    chat_model, emotion_model = args.chat_model, args.emotion_model
+    if args.stand_in:
+        stand_ins = build_stand_in_models(args.stand_in, corpus)
+        chat_model, emotion_model = stand_ins['chat'], stand_ins['emotion']
+
+    load_started = time.monotonic()
+    detector = EmotionDetector(emotion_model)
+    generator = EducationalEmotionalResponseGenerator(chat_model, precision=args.precision, turn_deadline=args.deadline,
+                                                      execution_profile=args.execution_profile)
+    print(f"Models loaded in {time.monotonic() - load_started:.1f} s, RSS {current_rss_mb():.0f} MB")
+
+    scheduler = None
+    if args.batching:
+        from generation_scheduler import GenerationScheduler
+        scheduler = GenerationScheduler(generator=generator, max_batch_size=max(args.concurrency, 1))
+
+    turn_metrics.reset()
+    load_test = LoadTest(detector, generator, corpus, args.concurrency, args.rate, args.students, scheduler, args.seed)
+    sampler = ResourceSampler(args.sample_interval)
+    sampler.start()
+    try:
+        wall_seconds = load_test.run(args.requests, args.duration)
+    finally:
+        sampler.stop()
+    report = load_test.report(wall_seconds, sampler.samples)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"\n{report['requests']} requests in {report['wall_seconds']} s "
+          f"({report['throughput_rps']} req/s, concurrency {args.concurrency}, "
+          f"{'closed loop' if args.rate <= 0 else f'{args.rate} req/s offered'})")
+    print(f"{'':<12}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name in ('latency_s', 'queued_s', 'detect_s', 'generate_s'):
+        row = report[name]
+        print(f"{name:<12}" + "".join(f"{'-' if row[key] is None else row[key]:>9}" for key in ('p50', 'p95', 'p99', 'max')))
+    print(f"error rate {report['error_rate']:.2%}, fallback rate {report['fallback_rate']:.2%}")
+    print(f"CPU avg {report['cpu_percent_avg']}% / max {report['cpu_percent_max']}% (100% = one core), "
+          f"peak RSS {report['rss_mb_peak']} MB")
+    for name, pool in report['cpu_pools'].items():
+        print(f"pool {name}: CPUs {pool['cpus']}, {pool['calls']} calls, slots busy {pool['slot_utilization']:.0%}, "
+              f"cores busy {'-' if pool['core_utilization'] is None else format(pool['core_utilization'], '.0%')}, "
+              f"queued {pool['queue_seconds']} s")
+
+if __name__ == "__main__":
+    main()
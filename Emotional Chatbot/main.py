@@ -1,15 +1,26 @@
 # enhanced_main.py
-from emotion_detection_pipeline import detect_enhanced_emotion
-from generation_pipeline import generate_educational_response
-from logger import Logger
+import os
 import sys
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emotion_detection_pipeline import detect_enhanced_emotion
+from generation_pipeline import stream_educational_response
+from startup_loader import start_background_loading
+from conversation_memory import ConversationSession
+from shared.logger import Logger
+from shared.tracing import get_tracer
 from typing import Dict
 
 logger = Logger(name="Educational ChatBot", log_file_needed=True, log_file='Logs/educational_chatbot.log', level='DEV')
+tracer = get_tracer("chatbot")
 
 class EducationalChatbot:
     def __init__(self):
+        self.model_loader = start_background_loading()
         self.conversation_history = []
+        self.session = ConversationSession()
         self.student_profile = {
             'session_count': 0,
             'identified_needs': set(),
@@ -31,8 +42,17 @@ class EducationalChatbot:
         print("\nI understand that everyone learns differently, and I'm here to support you!")
         print("=" * 50)
         print("\nCommands: 'exit', 'quit', 'help', or 'profile' to see your learning profile")
+        self.display_model_status()
         print()
 
+    def display_model_status(self):
+        """Show whether the models are still loading in the background"""
+        status = self.model_loader.status()
+        if all(state == 'ready' for state in status.values()):
+            return
+        status_text = ', '.join(f"{name.replace('_', ' ')}: {state}" for name, state in status.items())
+        print(f"[Models warming up - {status_text}. Your first reply may take a moment.]")
+
     def display_help(self):
         """Display educational help"""
         logger.debug("User requested educational help information")
@@ -93,7 +113,7 @@ class EducationalChatbot:
                 try:
                     # Get user input
                     user_input = input("You: ").strip()
-                    logger.debug(f"User input: '{user_input[:50]}...'")
+                    logger.debug("User input: '%.50s...'", user_input)
                     
                     # Handle commands
                     if user_input.lower() in ("exit", "quit", "bye", "goodbye"):
@@ -114,66 +134,76 @@ class EducationalChatbot:
                         print("Feel free to ask me anything about learning, homework, or how you're feeling about school!\n")
                         continue
                     
-                    self.student_profile['session_count'] += 1
+                    # One request ID covers detection and generation of this turn
+                    with tracer.request(name="chat.turn"):
+                        self.student_profile['session_count'] += 1
+                    
+                        if not self.model_loader.is_ready():
+                            print("[Still getting ready, one moment...]")
                     
-                    # Enhanced emotion detection
-                    try:
-                        emotion_analysis = detect_enhanced_emotion(user_input, {
-                            'conversation_history': self.conversation_history[-3:],
-                            'student_profile': self.student_profile
-                        })
+                        # Enhanced emotion detection
+                        try:
+                            emotion_analysis = detect_enhanced_emotion(user_input, {
+                                'conversation_history': self.conversation_history[-3:],
+                                'student_profile': self.student_profile
+                            })
                         
-                        # Display emotion with educational context
-                        emotion_display = f"{emotion_analysis['primary_emotion'].title()}"
-                        if emotion_analysis['educational_context'] != 'general':
-                            emotion_display += f" (Learning context: {emotion_analysis['educational_context']})"
+                            # Display emotion with educational context
+                            emotion_display = f"{emotion_analysis['primary_emotion'].title()}"
+                            if emotion_analysis['educational_context'] != 'general':
+                                emotion_display += f" (Learning context: {emotion_analysis['educational_context']})"
                         
-                        confidence = emotion_analysis.get('confidence', 0.0)
-                        print(f"[Detected: {emotion_display} - {confidence:.1%} confidence]")
+                            confidence = emotion_analysis.get('confidence', 0.0)
+                            print(f"[Detected: {emotion_display} - {confidence:.1%} confidence]")
                         
-                        # Show special needs indicators if detected
-                        if emotion_analysis.get('special_needs_indicators'):
-                            indicators_text = ', '.join(emotion_analysis['special_needs_indicators']).replace('_', ' ')
-                            print(f"[Learning pattern noted: {indicators_text}]")
+                            # Show special needs indicators if detected
+                            if emotion_analysis.get('special_needs_indicators'):
+                                indicators_text = ', '.join(emotion_analysis['special_needs_indicators']).replace('_', ' ')
+                                print(f"[Learning pattern noted: {indicators_text}]")
                         
-                        logger.debug(f"Enhanced emotion analysis: {emotion_analysis}")
+                            logger.debug("Enhanced emotion analysis: %s", emotion_analysis, sampled=True)
                         
-                    except Exception as e:
-                        logger.error(f"Enhanced emotion detection failed: {str(e)}")
-                        emotion_analysis = {
-                            'primary_emotion': 'neutral',
-                            'confidence': 0.5,
-                            'educational_context': 'general',
-                            'special_needs_indicators': [],
-                            'recommended_approach': 'standard'
-                        }
-                        print("[Using standard response mode]")
+                        except Exception as e:
+                            logger.error(f"Enhanced emotion detection failed: {str(e)}")
+                            emotion_analysis = {
+                                'primary_emotion': 'neutral',
+                                'confidence': 0.5,
+                                'educational_context': 'general',
+                                'special_needs_indicators': [],
+                                'recommended_approach': 'standard'
+                            }
+                            print("[Using standard response mode]")
                     
-                    # Generate educational response
-                    try:
-                        response = generate_educational_response(user_input, emotion_analysis)
-                        print(f"AI Tutor: {response}\n")
+                        # Generate educational response
+                        try:
+                            print("AI Tutor: ", end="", flush=True)
+                            chunks = []
+                            for chunk in stream_educational_response(user_input, emotion_analysis, self.session):
+                                chunks.append(chunk)
+                                print(chunk, end="", flush=True)
+                            print("\n")
+                            response = "".join(chunks)
                         
-                        # Update student profile
-                        self.update_student_profile(emotion_analysis, user_input)
+                            # Update student profile
+                            self.update_student_profile(emotion_analysis, user_input)
                         
-                        # Add to conversation history
-                        self.conversation_history.append({
-                            'user_input': user_input,
-                            'emotion_analysis': emotion_analysis,
-                            'response': response
-                        })
+                            # Add to conversation history
+                            self.conversation_history.append({
+                                'user_input': user_input,
+                                'emotion_analysis': emotion_analysis,
+                                'response': response
+                            })
                         
-                        # Keep history manageable
-                        if len(self.conversation_history) > 10:
-                            self.conversation_history = self.conversation_history[-10:]
+                            # Keep history manageable
+                            if len(self.conversation_history) > 10:
+                                self.conversation_history = self.conversation_history[-10:]
                         
-                        logger.debug("Educational response generated successfully")
+                            logger.debug("Educational response generated successfully")
                         
-                    except Exception as e:
-                        logger.error(f"Educational response generation failed: {str(e)}")
-                        fallback = "I'm having trouble generating a response right now. Could you try rephrasing your question or telling me more about what you're working on?"
-                        print(f"AI Tutor: {fallback}\n")
+                        except Exception as e:
+                            logger.error(f"Educational response generation failed: {str(e)}")
+                            fallback = "I'm having trouble generating a response right now. Could you try rephrasing your question or telling me more about what you're working on?"
+                            print(f"AI Tutor: {fallback}\n")
                     
                 except KeyboardInterrupt:
                     logger.debug("Chat interrupted by user")
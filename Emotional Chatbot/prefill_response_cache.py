@@ -0,0 +1,39 @@
+"""
+Generate reply pools for common short student messages and save them for the response cache.
+
+Usage:
+    python prefill_response_cache.py --output Logs/response_cache.json --pool-size 4
+Then start the app with CHATBOT_RESPONSE_CACHE=1 CHATBOT_RESPONSE_CACHE_FILE=Logs/response_cache.json
+"""
+import argparse
+import os
+import sys
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from emotion_detection_pipeline import detect_enhanced_emotion
+from generation_pipeline import generate_educational_response
+from response_cache import COMMON_INTENTS, ResponseCache, prefill_pools
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefill the chatbot response cache offline")
+    parser.add_argument("--output", default="Logs/response_cache.json")
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--intents-file", default="", help="Optional file with one message per line")
+    args = parser.parse_args()
+
+    intents = COMMON_INTENTS
+    if args.intents_file:
+        with open(args.intents_file, encoding="utf-8") as source:
+            intents = [line.strip() for line in source if line.strip()]
+
+    cache = ResponseCache(capacity=max(len(intents), 1), ttl_seconds=None, pool_size=args.pool_size)
+    filled = prefill_pools(cache, detect_enhanced_emotion, generate_educational_response, intents)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    cache.save(args.output)
+    print(f"Prefilled {filled} intents into {args.output}")
+
+if __name__ == "__main__":
+    main()
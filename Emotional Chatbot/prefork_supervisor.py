@@ -0,0 +1,224 @@
+"""
+Run several Streamlit chatbot workers that share one copy of the model weights.
+
+Usage:
+    python prefork_supervisor.py --workers 4 --base-port 8501
+
+The supervisor loads the emotion classifier and the causal model (including the
+prefilled prompt prefixes) once, then forks one worker per port. Forked workers
+share the weight pages copy-on-write; inference never writes to them, so each
+worker's private memory is mostly its KV caches and Python objects. The models
+are already in sys.modules when streamlit_app.py runs in a worker, so its lazy
+accessors return them instantly. A crashed worker is re-forked from the
+supervisor, which still holds the loaded weights, so nothing is read from disk.
+Put a load balancer with sticky sessions in front of the ports. With --pin-workers each
+worker is pinned to its own share of the physical cores, and CPU_LAYOUT pools inside a
+worker are carved out of that share.
+"""
+import argparse
+import gc
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+
+from shared.cpu_layout import detect_topology, partition_cores
+from shared.logger import Logger, shutdown_logging
+
+logger = Logger(name="Prefork Supervisor", log_file_needed=True, log_file='Logs/prefork_supervisor.log', level='DEV')
+
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+# A slot that crashes this often within RESTART_WINDOW seconds is restarted with a back-off
+MAX_RAPID_RESTARTS = 5
+RESTART_WINDOW = 60.0
+
+def preload_models():
+    """Load both models in the supervisor so every worker inherits them"""
+    from emotion_detection_pipeline import get_emotion_detector
+    from generation_pipeline import get_educational_response_generator
+
+    # GNU OpenMP is not fork-safe once its thread team exists, so the supervisor stays single-threaded
+    torch.set_num_threads(1)
+    torch.set_grad_enabled(False)
+
+    started = time.monotonic()
+    get_emotion_detector()
+    get_educational_response_generator()
+    logger.info(f"Models loaded in supervisor in {time.monotonic() - started:.1f}s")
+
+    # Move every object that exists now out of the collector's reach, so collections in the
+    # workers do not touch (and therefore copy) the pages holding them
+    gc.collect()
+    gc.freeze()
+
+def memory_breakdown(pid: int) -> Dict[str, float]:
+    """Shared and private memory of a process in MB (Linux smaps_rollup)"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            for line in smaps:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty",
+                                                                 "Private_Clean", "Private_Dirty"):
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        pass
+    return fields
+
+def run_worker(port: int, threads: int, streamlit_args: List[str], cpus: Optional[List[int]] = None):
+    """Body of a forked worker: serve streamlit_app.py on its own port"""
+    from streamlit.web import bootstrap
+
+    if cpus:
+        # Threads started from here on, including torch's OpenMP team, inherit the mask
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    flag_options = {'server.port': port, 'server.headless': True}
+    bootstrap.load_config_options(flag_options=flag_options)
+    bootstrap.run(APP_SCRIPT, False, streamlit_args, flag_options)
+
+class PreforkSupervisor:
+    def __init__(self, workers: int, base_port: int = 8501, threads_per_worker: int = None,
+                 streamlit_args: List[str] = None, pin_workers: bool = False):
+        """
+        Initialization of class arguments.
+
+        1. workers -> int -> Number of worker processes, each on its own port.\n
+        2. base_port -> int -> Port of the first worker; worker i listens on base_port + i.\n
+        3. threads_per_worker -> int -> torch intra-op threads per worker, defaults to cores / workers.\n
+        4. streamlit_args -> List[str] -> Extra arguments passed to the app script.\n
+        5. pin_workers -> bool -> Pin every worker to its own contiguous group of physical cores.\n
+        """
+        self.workers = workers
+        self.base_port = base_port
+        self.core_groups = partition_cores(detect_topology(), workers) if pin_workers else []
+        if self.core_groups:
+            default_threads = max(1, min(len(group) for group in self.core_groups))
+        else:
+            default_threads = max(1, (os.cpu_count() or 1) // workers)
+        self.threads_per_worker = threads_per_worker or default_threads
+        self.streamlit_args = streamlit_args or []
+        self.slots: Dict[int, int] = {}
+        self.restarts: Dict[int, List[float]] = {slot: [] for slot in range(workers)}
+        self.delayed: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self, slot: int):
+        """Fork the worker for one slot"""
+        port = self.base_port + slot
+        cpus = None
+        if self.core_groups:
+            # More workers than physical cores wrap around and share groups
+            cpus = sorted(cpu for core in self.core_groups[slot % len(self.core_groups)] for cpu in core)
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                run_worker(port, self.threads_per_worker, self.streamlit_args, cpus)
+            except BaseException as e:
+                logger.error(f"Worker on port {port} failed: {str(e)}")
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                shutdown_logging()
+            # Never return into the supervisor's loop in the child
+            os._exit(exit_code)
+
+        self.slots[slot] = pid
+        logger.info(f"Worker {slot} started on port {port} (pid {pid}, {self.threads_per_worker} threads"
+                    f"{f', CPUs {cpus}' if cpus else ''})")
+
+    def _handle_exit(self, pid: int, status: int):
+        slot = next((slot for slot, worker_pid in self.slots.items() if worker_pid == pid), None)
+        if slot is None:
+            return
+        del self.slots[slot]
+        if self.stopping:
+            return
+
+        code = os.waitstatus_to_exitcode(status)
+        logger.warning(f"Worker {slot} (pid {pid}) exited with {code}; restarting from the loaded weights")
+
+        now = time.monotonic()
+        recent = [moment for moment in self.restarts[slot] if now - moment < RESTART_WINDOW] + [now]
+        self.restarts[slot] = recent
+        if len(recent) > MAX_RAPID_RESTARTS:
+            logger.error(f"Worker {slot} is crash-looping; waiting {RESTART_WINDOW:.0f}s before restarting it")
+            self.restarts[slot] = []
+            self.delayed[slot] = now + RESTART_WINDOW
+            return
+        self.spawn(slot)
+
+    def stop(self, signum=None, frame=None):
+        """Forward termination to every worker"""
+        self.stopping = True
+        self.delayed.clear()
+        for pid in list(self.slots.values()):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report_memory(self):
+        """Log how much of each worker's memory is shared with its siblings"""
+        supervisor = memory_breakdown(os.getpid())
+        logger.info(f"Supervisor RSS {supervisor.get('Rss', 0):.0f} MB")
+        for slot, pid in sorted(self.slots.items()):
+            memory = memory_breakdown(pid)
+            logger.info(
+                f"Worker {slot} (pid {pid}): RSS {memory.get('Rss', 0):.0f} MB, PSS {memory.get('Pss', 0):.0f} MB, "
+                f"shared {memory.get('Shared_Clean', 0) + memory.get('Shared_Dirty', 0):.0f} MB, "
+                f"private {memory.get('Private_Clean', 0) + memory.get('Private_Dirty', 0):.0f} MB"
+            )
+
+    def run(self, report_interval: float = 300.0):
+        """Start every worker and supervise them until SIGTERM or SIGINT"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        next_report = time.monotonic() + report_interval
+        while self.slots or self.delayed:
+            pid, status = os.waitpid(-1, os.WNOHANG) if self.slots else (0, 0)
+            if pid:
+                self._handle_exit(pid, status)
+                continue
+            for slot, restart_at in list(self.delayed.items()):
+                if time.monotonic() >= restart_at:
+                    del self.delayed[slot]
+                    self.spawn(slot)
+            if report_interval and time.monotonic() >= next_report:
+                self.report_memory()
+                next_report = time.monotonic() + report_interval
+            time.sleep(0.5)
+        logger.info("All workers stopped")
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the chatbot from forked workers sharing one copy of the models")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--base-port", type=int, default=8501)
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--pin-workers", action="store_true", help="Give every worker its own physical cores")
+    parser.add_argument("--report-interval", type=float, default=300.0, help="Seconds between memory reports (0: off)")
+    args, streamlit_args = parser.parse_known_args()
+
+    if not hasattr(os, "fork"):
+        parser.error("the pre-fork supervisor needs a platform with fork() (Linux or macOS)")
+
+    preload_models()
+    supervisor = PreforkSupervisor(args.workers, args.base_port, args.threads_per_worker, streamlit_args,
+                                   args.pin_workers)
+    supervisor.run(args.report_interval)
+
+if __name__ == "__main__":
+    main()
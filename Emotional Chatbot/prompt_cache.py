@@ -0,0 +1,86 @@
+import copy
+import re
+import torch
+from typing import Dict, Tuple
+
+PLACEHOLDER_PATTERN = re.compile(r"\{[A-Za-z_]+\}")
+
+def split_template(template: str) -> Tuple[str, str]:
+    """
+    Splits a prompt template into its static system prefix and the per-turn suffix.
+
+    The prefix ends at the start of the first line containing a template variable, so
+    it can be prefilled once and reused on every turn.
+    """
+    match = PLACEHOLDER_PATTERN.search(template)
+    if match is None:
+        return template, ""
+    index = template.rfind("\n", 0, match.start()) + 1
+    return template[:index], template[index:]
+
+class PromptPrefixCache:
+    def __init__(self, model, tokenizer, templates: Dict[str, str]):
+        """
+        Initialization of class arguments.
+
+        1. model -> AutoModelForCausalLM -> Model used to prefill the static prefixes.\n
+        2. tokenizer -> AutoTokenizer -> Tokenizer matching the model.\n
+        3. templates -> Dict[str, str] -> Prompt templates keyed by template name.\n
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.entries = {}
+
+        for key, template in templates.items():
+            self.entries[key] = self._prefill(template)
+
+    @torch.no_grad()
+    def _prefill(self, template: str) -> Dict:
+        """Tokenize and prefill the static prefix of a single template"""
+        prefix, suffix_template = split_template(template)
+        if not prefix:
+            return {'prefix_ids': None, 'past_key_values': None, 'suffix_template': suffix_template}
+
+        prefix_ids = self.tokenizer(prefix, return_tensors="pt").input_ids.to(self.model.device)
+        outputs = self.model(input_ids=prefix_ids, use_cache=True)
+
+        return {
+            'prefix_ids': prefix_ids,
+            'past_key_values': outputs.past_key_values,
+            'suffix_template': suffix_template,
+        }
+
+    def build_inputs(self, template_key: str, inputs: Dict, with_cache: bool = True) -> Dict:
+        """
+        Builds generate() keyword arguments for a turn.
+
+        Only the formatted suffix (history, student's message and emotion fields) is new;
+        with_cache adds a private copy of the prefilled prefix so that concurrent or later
+        turns never see each other's cache entries.
+        """
+        entry = self.entries[template_key]
+        suffix = entry['suffix_template'].format(**inputs)
+
+        if entry['prefix_ids'] is None:
+            input_ids = self.tokenizer(suffix, return_tensors="pt").input_ids.to(self.model.device)
+            return {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)}
+
+        suffix_ids = self.tokenizer(
+            suffix, add_special_tokens=False, return_tensors="pt"
+        ).input_ids.to(self.model.device)
+        input_ids = torch.cat([entry['prefix_ids'], suffix_ids], dim=-1)
+
+        model_inputs = {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)}
+        if with_cache:
+            model_inputs['past_key_values'] = self.copy_cache(template_key)
+        return model_inputs
+
+    def copy_cache(self, template_key: str):
+        """Private copy of a template's prefilled prefix cache"""
+        past_key_values = self.entries[template_key]['past_key_values']
+        return None if past_key_values is None else copy.deepcopy(past_key_values)
+
+    def prefix_length(self, template_key: str) -> int:
+        """Number of prefilled tokens for a template"""
+        prefix_ids = self.entries[template_key]['prefix_ids']
+        return 0 if prefix_ids is None else prefix_ids.shape[-1]
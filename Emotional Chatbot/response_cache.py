@@ -0,0 +1,174 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Common short student messages whose reply pools are generated offline (see prefill_response_cache.py)
+COMMON_INTENTS = [
+    "hi",
+    "hello",
+    "help me",
+    "i need help",
+    "i'm bored",
+    "i don't get it",
+    "this is too hard",
+    "i can't do this",
+    "i'm confused",
+    "thank you",
+    "i'm scared of the test",
+    "i hate math",
+    "reading is hard",
+    "i can't focus",
+]
+
+def normalize_input(text: str) -> str:
+    """Lowercase, drop apostrophes and punctuation, and collapse whitespace so trivial variants share a key"""
+    text = text.lower().replace("'", "").replace("’", "")
+    text = re.sub(r"[^a-z0-9\s]", " ", text)
+    return " ".join(text.split())
+
+class ResponseCache:
+    def __init__(self, capacity: int = 512, ttl_seconds: Optional[float] = 3600.0, pool_size: int = 4,
+                 max_input_words: int = 6):
+        """
+        Initialization of class arguments.
+
+        1. capacity -> int -> Maximum number of keys kept, least recently used evicted first.\n
+        2. ttl_seconds -> float | None -> Lifetime of generated pools; None keeps them until evicted.\n
+        3. pool_size -> int -> Number of varied replies collected per key before it starts serving hits.\n
+        4. max_input_words -> int -> Only messages up to this many words are cached.\n
+        """
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.pool_size = pool_size
+        self.max_input_words = max_input_words
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, emotion_analysis: Dict, user_input: str) -> Optional[Tuple]:
+        """Cache key for a turn, or None when the message is too long to be a repeated intent"""
+        normalized = normalize_input(user_input)
+        if not normalized or len(normalized.split()) > self.max_input_words:
+            return None
+        return (
+            emotion_analysis.get('recommended_approach', 'standard'),
+            emotion_analysis.get('primary_emotion', 'neutral'),
+            emotion_analysis.get('educational_context', 'general'),
+            normalized,
+        )
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        return entry['expires_at'] is not None and now >= entry['expires_at']
+
+    def get(self, key: Optional[Tuple]) -> Optional[str]:
+        """
+        Return a cached reply once the key's pool is full.
+
+        While a pool is still filling, every lookup is a miss so the caller generates
+        another variant; afterwards replies rotate so the student rarely sees a repeat.
+        """
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is None or len(entry['replies']) < self.pool_size:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            choices = [index for index in range(len(entry['replies'])) if index != entry['last_served']]
+            index = random.choice(choices or [0])
+            entry['last_served'] = index
+            self.hits += 1
+            return entry['replies'][index]
+
+    def add(self, key: Optional[Tuple], reply: str, pinned: bool = False):
+        """Add a generated reply to the key's pool"""
+        if key is None or not reply:
+            return
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry, now):
+                expires_at = None if pinned or self.ttl_seconds is None else now + self.ttl_seconds
+                entry = {'replies': [], 'expires_at': expires_at, 'last_served': None}
+                self._entries[key] = entry
+            if reply not in entry['replies'] and len(entry['replies']) < self.pool_size:
+                entry['replies'].append(reply)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def pool_length(self, key: Optional[Tuple]) -> int:
+        """Number of replies collected so far for a key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return 0 if entry is None else len(entry['replies'])
+
+    def save(self, path: str):
+        """Write every pool to a JSON file"""
+        with self._lock:
+            records = [
+                {'key': list(key), 'replies': entry['replies']}
+                for key, entry in self._entries.items()
+            ]
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(records, output, indent=2, ensure_ascii=False)
+
+    def load(self, path: str, pinned: bool = True) -> int:
+        """Load pools written by save(); prefilled pools are pinned (no TTL) by default"""
+        with open(path, encoding="utf-8") as source:
+            records = json.load(source)
+        for record in records:
+            key = tuple(record['key'])
+            for reply in record['replies']:
+                self.add(key, reply, pinned=pinned)
+        return len(records)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'keys': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """Build the response cache when CHATBOT_RESPONSE_CACHE=1, loading prefilled pools if configured"""
+    if os.environ.get("CHATBOT_RESPONSE_CACHE", "0") != "1":
+        return None
+    cache = ResponseCache(
+        capacity=int(os.environ.get("CHATBOT_RESPONSE_CACHE_CAPACITY", "512")),
+        ttl_seconds=float(os.environ.get("CHATBOT_RESPONSE_CACHE_TTL_S", "3600")),
+        pool_size=int(os.environ.get("CHATBOT_RESPONSE_CACHE_POOL_SIZE", "4")),
+    )
+    prefill_path = os.environ.get("CHATBOT_RESPONSE_CACHE_FILE", "")
+    if prefill_path and os.path.exists(prefill_path):
+        cache.load(prefill_path)
+    return cache
+
+def prefill_pools(cache: ResponseCache, detect, generate, intents: List[str] = None) -> int:
+    """
+    Fill the pool of every common intent offline.
+
+    detect(text) -> emotion analysis and generate(text, emotion_analysis) -> reply are the
+    regular pipeline functions; pools are pinned so they never expire.
+    """
+    filled = 0
+    for intent in intents or COMMON_INTENTS:
+        emotion_analysis = detect(intent)
+        key = cache.make_key(emotion_analysis, intent)
+        attempts = 0
+        # Sampling can repeat a reply, so allow a few extra attempts to reach a full pool
+        while key is not None and cache.pool_length(key) < cache.pool_size and attempts < cache.pool_size * 2:
+            attempts += 1
+            cache.add(key, generate(intent, emotion_analysis), pinned=True)
+        filled += 1
+    return filled
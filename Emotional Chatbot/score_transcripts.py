@@ -0,0 +1,236 @@
+"""
+Tag historical chat transcripts with emotion and special-needs results in bulk.
+
+Usage:
+    python score_transcripts.py --input exports/school_a.jsonl --output Logs/scored/school_a --workers 8
+    python score_transcripts.py --input exports/school_b.csv --text-field message --id-field message_id --format arrow
+
+The input is streamed in fixed-size chunks and every chunk is scored by a worker process that
+loaded the classifier once. Each chunk is written as its own Parquet (or Arrow IPC) part file in
+the output directory, which together form one dataset (pyarrow.dataset / pandas.read_parquet).
+Re-running the same command after an interruption skips the chunks whose part files exist; a
+chunk the classifier failed on gets no part file, so the next run scores it again. Input lines that
+are not JSON objects are skipped and counted.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Worker processes import the classifier, and with it the shared package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MANIFEST_NAME = "_job.json"
+
+# Set in each worker process by _init_worker
+_worker_detector = None
+_worker_batch_size = 32
+
+def result_schema():
+    """Arrow schema of the scored output: source row, message id, optionally the text, then every result field"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('source_row', pa.int64()),
+        ('message_id', pa.string()),
+        ('text', pa.string()),
+        ('primary_emotion', pa.string()),
+        ('confidence', pa.float32()),
+        ('educational_context', pa.string()),
+        ('special_needs_indicators', pa.list_(pa.string())),
+        ('recommended_approach', pa.string()),
+    ])
+
+def _json_rows(source) -> Iterator[Optional[Dict]]:
+    """One parsed object per JSONL line, None for a line that is not a JSON object"""
+    for line in source:
+        if not line.strip():
+            yield {}
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+def read_messages(path: str, text_field: str, id_field: str, input_format: str = "",
+                  skipped: Optional[List[int]] = None) -> Iterator[Tuple[int, str, str]]:
+    """
+    Stream (source row, message id, text) from a JSONL or CSV file without loading it whole.
+
+    Lines that are not JSON objects are left out and their row numbers added to skipped;
+    texts that are not strings are converted, so no row can fail its chunk on every run.
+    """
+    input_format = input_format or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    with open(path, encoding="utf-8", newline="") as source:
+        rows = csv.DictReader(source) if input_format == "csv" else _json_rows(source)
+        for row_number, row in enumerate(rows):
+            if row is None:
+                print(f"row {row_number} skipped: not a JSON object", flush=True)
+                if skipped is not None:
+                    skipped.append(row_number)
+                continue
+            message_id, text = row.get(id_field), row.get(text_field)
+            yield (row_number, str(row_number if message_id in (None, "") else message_id),
+                   "" if text is None else str(text))
+
+def iter_chunks(messages: Iterator[Tuple[int, str, str]], chunk_size: int) -> Iterator[Tuple[int, List]]:
+    """Number the input in fixed-size chunks; the numbering is what makes resuming possible"""
+    chunk_index = 0
+    while True:
+        chunk = list(islice(messages, chunk_size))
+        if not chunk:
+            return
+        yield chunk_index, chunk
+        chunk_index += 1
+
+def _init_worker(model_name: str, batch_size: int, threads: int):
+    """Load the classifier once per worker process"""
+    global _worker_detector, _worker_batch_size
+    import torch
+
+    torch.set_num_threads(threads)
+    from emotion_detection_pipeline import EmotionDetector
+
+    _worker_detector = EmotionDetector(model_name)
+    _worker_batch_size = batch_size
+
+def _score_chunk(chunk_index: int, chunk: List[Tuple[int, str, str]], output_dir: str, output_format: str,
+                 include_text: bool) -> Tuple[int, int]:
+    """Score one chunk and write it as a part file; returns the chunk index and row count"""
+    import pyarrow as pa
+
+    results = _worker_detector.detect_educational_emotions([text for _, _, text in chunk], _worker_batch_size)
+    # The detector turns a failed batch into 'error' rows; written out, resuming would never retry them
+    if any(result['educational_context'] == 'error' for result in results):
+        raise RuntimeError(f"classifier failed on chunk {chunk_index}")
+    table = pa.Table.from_pydict({
+        'source_row': [row for row, _, _ in chunk],
+        'message_id': [message_id for _, message_id, _ in chunk],
+        'text': [text if include_text else None for _, _, text in chunk],
+        'primary_emotion': [result['primary_emotion'] for result in results],
+        'confidence': [result['confidence'] for result in results],
+        'educational_context': [result['educational_context'] for result in results],
+        'special_needs_indicators': [result['special_needs_indicators'] for result in results],
+        'recommended_approach': [result['recommended_approach'] for result in results],
+    }, schema=result_schema())
+
+    final_path = part_path(output_dir, chunk_index, output_format)
+    temporary_path = final_path + ".tmp"
+    if output_format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, temporary_path, compression="zstd")
+    else:
+        with pa.OSFile(temporary_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    # Rename last so a part file only exists once it is complete
+    os.replace(temporary_path, final_path)
+    return chunk_index, len(chunk)
+
+def part_path(output_dir: str, chunk_index: int, output_format: str) -> str:
+    extension = "parquet" if output_format == "parquet" else "arrow"
+    return os.path.join(output_dir, f"part-{chunk_index:06d}.{extension}")
+
+def check_manifest(output_dir: str, settings: Dict):
+    """Record the job settings, or refuse to resume a job that was started with different ones"""
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as source:
+            previous = json.load(source)
+        if previous != settings:
+            raise SystemExit(
+                f"{output_dir} holds a job with different settings ({previous}); use a new --output directory"
+            )
+        return
+    with open(manifest_path, "w", encoding="utf-8") as output:
+        json.dump(settings, output, indent=2)
+
+def run_job(input_path: str, output_dir: str, model_name: str, workers: int, chunk_size: int, batch_size: int,
+            output_format: str = "parquet", text_field: str = "text", id_field: str = "id",
+            input_format: str = "", include_text: bool = False) -> Dict:
+    """Score every chunk without a part file; at most two chunks per worker are held in memory"""
+    os.makedirs(output_dir, exist_ok=True)
+    check_manifest(output_dir, {
+        'input': os.path.abspath(input_path), 'model': model_name, 'chunk_size': chunk_size,
+        'format': output_format, 'text_field': text_field, 'id_field': id_field, 'include_text': include_text,
+    })
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    started = time.monotonic()
+    scored_rows = skipped_chunks = failed_chunks = 0
+    skipped_rows: List[int] = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, batch_size, threads)) as pool:
+        pending = set()
+        messages = read_messages(input_path, text_field, id_field, input_format, skipped_rows)
+        for chunk_index, chunk in iter_chunks(messages, chunk_size):
+            if os.path.exists(part_path(output_dir, chunk_index, output_format)):
+                skipped_chunks += 1
+                continue
+            pending.add(pool.submit(_score_chunk, chunk_index, chunk, output_dir, output_format, include_text))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                rows, failed = _collect(done, started, scored_rows)
+                scored_rows, failed_chunks = scored_rows + rows, failed_chunks + failed
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            rows, failed = _collect(done, started, scored_rows)
+            scored_rows, failed_chunks = scored_rows + rows, failed_chunks + failed
+
+    elapsed = time.monotonic() - started
+    return {
+        'scored_rows': scored_rows,
+        'skipped_chunks': skipped_chunks,
+        # Malformed input lines, left out of every chunk
+        'skipped_rows': len(skipped_rows),
+        # Re-run the same command to retry these
+        'failed_chunks': failed_chunks,
+        'seconds': round(elapsed, 1),
+        'rows_per_second': round(scored_rows / elapsed, 1) if elapsed else 0.0,
+    }
+
+def _collect(done, started: float, scored_rows: int) -> Tuple[int, int]:
+    """Rows scored and chunks failed among finished futures; a failed chunk does not stop the job"""
+    rows = failed = 0
+    for future in done:
+        try:
+            chunk_index, count = future.result()
+        except Exception as e:
+            print(f"chunk failed, it is retried on the next run: {e}", flush=True)
+            failed += 1
+            continue
+        rows += count
+        total = scored_rows + rows
+        print(f"scored {total} rows ({total / max(time.monotonic() - started, 1e-9):.0f} rows/s), "
+              f"last chunk {chunk_index}", flush=True)
+    return rows, failed
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Score transcript exports with the emotion detector in bulk")
+    parser.add_argument("--input", required=True, help="JSONL or CSV file of messages")
+    parser.add_argument("--output", required=True, help="Output directory for the part files")
+    parser.add_argument("--input-format", choices=["jsonl", "csv"], default="", help="Defaults to the file extension")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--id-field", default="id", help="Row number is used when the field is missing")
+    parser.add_argument("--include-text", action="store_true", help="Copy the message text into the output")
+    parser.add_argument("--model", default="bhadresh-savani/bert-base-uncased-emotion")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--chunk-size", type=int, default=2048, help="Messages per part file")
+    parser.add_argument("--batch-size", type=int, default=64, help="Messages per classifier forward pass")
+    args = parser.parse_args(argv)
+
+    summary = run_job(
+        args.input, args.output, args.model, args.workers, args.chunk_size, args.batch_size,
+        args.format, args.text_field, args.id_field, args.input_format, args.include_text,
+    )
+    print(json.dumps(summary))
+
+if __name__ == "__main__":
+    main()
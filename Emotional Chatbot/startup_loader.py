@@ -0,0 +1,96 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+import threading
+import time
+
+from emotion_detection_pipeline import get_emotion_detector
+from generation_pipeline import get_educational_response_generator
+from shared.logger import Logger
+
+logger = Logger(name="Startup Loader", log_file_needed=True, log_file='Logs/startup_loader.log', level='DEV')
+
+MODEL_ACCESSORS: Dict[str, Callable] = {
+    'emotion_detector': get_emotion_detector,
+    'response_generator': get_educational_response_generator,
+}
+
+class BackgroundModelLoader:
+    def __init__(self, accessors: Dict[str, Callable] = None):
+        """
+        Initialization of class arguments.
+
+        1. accessors -> Dict[str, Callable] -> Lazy model accessors keyed by display name.\n
+        """
+        self.accessors = accessors or MODEL_ACCESSORS
+        self.futures: Dict[str, Future] = {}
+        self.load_times: Dict[str, float] = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "BackgroundModelLoader":
+        """Submit every accessor to a thread pool so the models load concurrently"""
+        with self._lock:
+            if self._executor is not None:
+                return self
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(self.accessors), thread_name_prefix="model-loader"
+            )
+            for name, accessor in self.accessors.items():
+                self.futures[name] = self._executor.submit(self._load, name, accessor)
+            self._executor.shutdown(wait=False)
+        logger.debug(f"Background loading started for: {', '.join(self.accessors)}")
+        return self
+
+    def _load(self, name: str, accessor: Callable):
+        """Run one accessor and record how long it took"""
+        started = time.monotonic()
+        try:
+            result = accessor()
+        except Exception as e:
+            logger.error(f"Background loading of {name} failed: {str(e)}")
+            raise
+        self.load_times[name] = time.monotonic() - started
+        logger.info(f"{name} ready in {self.load_times[name]:.1f}s")
+        return result
+
+    def status(self) -> Dict[str, str]:
+        """Return 'pending', 'loading', 'ready' or 'failed' for every model"""
+        statuses = {}
+        for name in self.accessors:
+            future = self.futures.get(name)
+            if future is None:
+                statuses[name] = 'pending'
+            elif not future.done():
+                statuses[name] = 'loading'
+            elif future.exception() is not None:
+                statuses[name] = 'failed'
+            else:
+                statuses[name] = 'ready'
+        return statuses
+
+    def is_ready(self) -> bool:
+        """Whether every model finished loading successfully"""
+        return all(state == 'ready' for state in self.status().values())
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until every model is loaded; returns False if the timeout expired first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for future in self.futures.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                future.result(timeout=remaining)
+            except Exception:
+                if not future.done():
+                    return False
+        return self.is_ready()
+
+_background_loader = None
+_background_loader_lock = threading.Lock()
+
+def start_background_loading() -> BackgroundModelLoader:
+    """Start (once per process) concurrent loading of the classifier and the causal model"""
+    global _background_loader
+    with _background_loader_lock:
+        if _background_loader is None:
+            _background_loader = BackgroundModelLoader().start()
+    return _background_loader
@@ -1,8 +1,19 @@
+import os
+import sys
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import streamlit as st
 
 from emotion_detection_pipeline import detect_enhanced_emotion
-from generation_pipeline import generate_educational_response
-from logger import Logger
+from generation_pipeline import stream_educational_response
+from startup_loader import start_background_loading
+from conversation_memory import ConversationSession
+from generation_scheduler import BATCHING_ENABLED, get_generation_scheduler
+from shared.logger import Logger
+from shared.profiling import get_profiler
+from shared.tracing import get_tracer
 
 logger = Logger(
     name="Educational ChatBot-UI",
@@ -10,11 +21,18 @@ logger = Logger(
     log_file="Logs/educational_chatbot_ui.log",
     level="DEV"
 )
+tracer = get_tracer("chatbot")
 
 st.set_page_config(page_title="🎓 Educational Support Chatbot", page_icon="🎓")
 
+# Loading runs in a background thread pool shared by every session, so the page renders immediately
+model_loader = start_background_loading()
+
 if "conversation" not in st.session_state:
     st.session_state.conversation = []
+if "chat_session" not in st.session_state:
+    # Token-budgeted prompt history plus the KV cache reused across this student's turns
+    st.session_state.chat_session = ConversationSession()
 if "profile" not in st.session_state:
     st.session_state.profile = {
         "session_count": 0,
@@ -33,6 +51,27 @@ with st.sidebar:
             f"- **Recent emotions:** {', '.join(profile['emotional_patterns'][-5:])}"
         )
 
+    st.markdown("---")
+    model_status = model_loader.status()
+    if model_loader.is_ready():
+        st.success("✅ Tutor ready")
+    else:
+        st.info(
+            "⏳ Getting ready: "
+            + ", ".join(f"{name.replace('_', ' ')} {state}" for name, state in model_status.items())
+        )
+        if st.button("Refresh status"):
+            st.rerun()
+
+    if os.environ.get("ADMIN_MODE", "0") == "1":
+        # Process-wide, so the setting applies to every session served by this process
+        profiler = get_profiler()
+        with st.expander("🛠️ Profiling", expanded=False):
+            sample_rate = st.slider("Profiled share of requests", 0.0, 1.0, float(profiler.sample_rate), 0.05)
+            if sample_rate != profiler.sample_rate:
+                profiler.set_sample_rate(sample_rate)
+            st.caption(f"Profiles are written to {profiler.profiles_dir}/")
+
     st.markdown("---")
     with st.expander("ℹ️ Help", expanded=False):
         st.write(
@@ -64,20 +103,33 @@ for turn in st.session_state.conversation:
 user_input = st.chat_input("Type your question or feeling …")
 
 if user_input:
-    logger.debug(f"User: {user_input}")
-
-    emotion = detect_enhanced_emotion(
-        user_input,
-        {
-            "conversation_history": st.session_state.conversation[-3:],
-            "student_profile": st.session_state.profile,
-        },
-    )
+    logger.debug("User: %s", user_input)
+
+    with st.chat_message("user"):
+        st.markdown(user_input)
+
+    # One request ID covers detection and generation of this turn, and appears in the JSON logs
+    with tracer.request(name="chat.turn") as request_id:
+        with st.chat_message("assistant"):
+            with st.spinner("Thinking..." if model_loader.is_ready() else "Almost ready, finishing model loading..."):
+                emotion = detect_enhanced_emotion(
+                    user_input,
+                    {
+                        "conversation_history": st.session_state.conversation[-3:],
+                        "student_profile": st.session_state.profile,
+                    },
+                )
 
-    bot_reply = generate_educational_response(user_input, emotion)
+            # Render the reply token by token inside the assistant bubble; with batching enabled,
+            # turns from concurrent sessions are decoded together by the shared scheduler
+            if BATCHING_ENABLED:
+                reply_stream = get_generation_scheduler().stream(user_input, emotion, st.session_state.chat_session)
+            else:
+                reply_stream = stream_educational_response(user_input, emotion, st.session_state.chat_session)
+            bot_reply = st.write_stream(reply_stream)
 
     st.session_state.conversation.append(
-        {"user": user_input, "bot": bot_reply, "emotion": emotion}
+        {"user": user_input, "bot": bot_reply, "emotion": emotion, "request_id": request_id}
     )
     profile = st.session_state.profile
     profile["session_count"] += 1
@@ -0,0 +1,26 @@
+import threading
+from collections import Counter
+from typing import Dict
+
+class TurnMetrics:
+    """Thread-safe counters for chat turn outcomes (deadline misses, cancellations, fallbacks)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def increment(self, name: str, amount: int = 1):
+        """Add amount to a named counter"""
+        with self._lock:
+            self._counters[name] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        """Copy of every counter"""
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+turn_metrics = TurnMetrics()
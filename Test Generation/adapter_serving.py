@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional
+
+import torch
+from peft import PeftModel
+
+from kv_cache import KVCacheMonitor
+from shared.cpu_layout import get_cpu_layout
+from shared.logger import Logger
+from shared.tracing import get_tracer
+
+logger = Logger(name="Adapter Serving", log_file_needed=True, log_file_path="Logs/adapter_serving.log", level="DEV")
+tracer = get_tracer("test_generation")
+cpu_layout = get_cpu_layout()
+
+# PEFT's name for "no adapter" in a mixed batch
+BASE_ADAPTER = "__base__"
+
+def parse_adapter_spec(spec: str) -> Dict[str, str]:
+    """Parse "past=llama3.2-past-lora,past-v2=adapters/past-v2" into adapter name -> path"""
+    adapters = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, separator, path = item.partition("=")
+        if not separator or not name.strip() or not path.strip():
+            raise ValueError(f"Invalid adapter entry '{item}', expected name=path")
+        adapters[name.strip()] = path.strip()
+    return adapters
+
+def adapter_base_model(path: str) -> Optional[str]:
+    """Base model an adapter was trained on, from its adapter_config.json"""
+    try:
+        with open(os.path.join(path, "adapter_config.json"), encoding="utf-8") as config_file:
+            return json.load(config_file).get("base_model_name_or_path")
+    except (OSError, ValueError):
+        return None
+
+def same_base_model(first: Optional[str], second: str) -> bool:
+    """Compare repo ids or local copies of them by their final path component"""
+    if first is None:
+        return True
+    return first.rstrip("/").split("/")[-1].lower() == second.rstrip("/").split("/")[-1].lower()
+
+def choose_adapter(experiments: Dict[str, Dict[str, float]], class_level: str, student_key: str = "",
+                   available: Optional[Iterable[str]] = None) -> Optional[str]:
+    """
+    Pick the adapter for a request from per-grade A/B weights.
+
+    experiments maps a class level (or "*" for every other level) to adapter weights,
+    e.g. {"1st Grade": {"past": 50, "past-v2": 50}, "*": {"past": 100}}. The choice is a
+    hash of the student and class level, so a student keeps the same arm across retries.
+    Arms missing from available, such as adapters skipped at load, are left out.
+    """
+    weights = experiments.get(class_level) or experiments.get("*")
+    if weights and available is not None:
+        available = set(available)
+        weights = {adapter: weight for adapter, weight in weights.items() if adapter in available}
+    if not weights:
+        return None
+    total = sum(weights.values())
+    digest = hashlib.sha256(f"{student_key}|{class_level}".encode("utf-8")).digest()
+    point = int.from_bytes(digest[:8], "big") / 2 ** 64 * total
+    for adapter, weight in sorted(weights.items()):
+        point -= weight
+        if point < 0:
+            return adapter
+    return sorted(weights)[-1]
+
+class AdapterRequest:
+    def __init__(self, prompt: str, adapter: str, max_new_tokens: Optional[int] = None):
+        self.prompt = prompt
+        self.adapter = adapter
+        # None uses the server's generation_kwargs budget
+        self.max_new_tokens = max_new_tokens
+        self.future = Future()
+        # Filled in by the server once decoded: batch size and this request's share of the KV cache
+        self.stats: Dict = {}
+
+class AdapterServer:
+    """
+    One resident base model with several unmerged LoRA adapters attached.
+
+    Each request names its adapter and is decoded with PEFT's per-row adapter_names, so no
+    adapter is ever "active" process-wide and concurrent requests cannot swap each other's
+    weights. Requests that arrive together are decoded as one left-padded batch even when
+    they use different adapters. Adapters can be added and removed while serving.
+    """
+
+    def __init__(self, base_model, tokenizer, base_model_name: str, adapters: Dict[str, str],
+                 generation_kwargs: Dict, max_batch_size: int = 4, max_wait_ms: float = 50.0,
+                 kv_cache_monitor: Optional[KVCacheMonitor] = None):
+        """
+        Initialization of class arguments.
+
+        1. base_model -> PreTrainedModel -> Loaded base model; the adapters are attached to it in place.\n
+        2. tokenizer -> AutoTokenizer -> Tokenizer of the base model.\n
+        3. base_model_name -> str -> Repo id or path of the base model, used to reject adapters trained on another base.\n
+        4. adapters -> Dict[str, str] -> Adapter name to adapter directory.\n
+        5. generation_kwargs -> Dict -> generate() arguments shared by every request.\n
+        6. max_batch_size -> int -> Maximum number of requests decoded together.\n
+        7. max_wait_ms -> float -> Longest time the first request of a batch waits for company.\n
+        8. kv_cache_monitor -> KVCacheMonitor | None -> Hooked on the base model to measure each batch's KV cache.\n
+        """
+        self.tokenizer = tokenizer
+        self.base_model_name = base_model_name
+        self.generation_kwargs = generation_kwargs
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.kv_cache_monitor = kv_cache_monitor
+        self.adapter_paths: Dict[str, str] = {}
+        self.model = None
+        self._base_model = base_model
+        # Held while decoding so an adapter cannot be deleted mid-generation
+        self._adapters_lock = threading.Lock()
+        self._worker_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self._worker = None
+
+        for name, path in adapters.items():
+            try:
+                self.add_adapter(name, path)
+            except ValueError as e:
+                logger.warning(f"Skipping adapter {name}: {str(e)}")
+        if self.model is None:
+            raise ValueError(f"None of the adapters {sorted(adapters)} fit base model {base_model_name}")
+
+    @property
+    def adapters(self) -> List[str]:
+        return sorted(self.adapter_paths)
+
+    @property
+    def default_adapter(self) -> str:
+        """The first adapter attached, used when a request names none"""
+        return next(iter(self.adapter_paths))
+
+    def add_adapter(self, name: str, path: str) -> float:
+        """Attach an adapter without touching the base weights; returns the seconds it took"""
+        trained_on = adapter_base_model(path)
+        if not same_base_model(trained_on, self.base_model_name):
+            raise ValueError(f"Adapter {name} was trained on {trained_on}, not {self.base_model_name}")
+
+        started = time.monotonic()
+        with self._adapters_lock:
+            if self.model is None:
+                self.model = PeftModel.from_pretrained(self._base_model, path, adapter_name=name)
+                self.model.eval()
+            else:
+                self.model.load_adapter(path, adapter_name=name)
+            self.adapter_paths[name] = path
+        seconds = time.monotonic() - started
+        logger.info(f"Adapter {name} attached from {path} in {seconds * 1000:.0f} ms "
+                    f"({self.adapter_memory_mb(name):.1f} MB)")
+        return seconds
+
+    def remove_adapter(self, name: str):
+        """Detach an adapter and free its weights; waits for the batch being decoded"""
+        with self._adapters_lock:
+            if name not in self.adapter_paths:
+                raise KeyError(name)
+            if len(self.adapter_paths) == 1:
+                raise ValueError("Cannot remove the last adapter")
+            self.model.delete_adapter(name)
+            del self.adapter_paths[name]
+        logger.info(f"Adapter {name} removed")
+
+    def adapter_memory_mb(self, name: str) -> float:
+        """Weight memory of one adapter's LoRA matrices"""
+        marker = f".{name}."
+        total = sum(
+            parameter.numel() * parameter.element_size()
+            for parameter_name, parameter in self.model.named_parameters()
+            if marker in parameter_name
+        )
+        return total / (1024 * 1024)
+
+    def submit(self, prompt: str, adapter: Optional[str] = None, max_new_tokens: Optional[int] = None) -> AdapterRequest:
+        """
+        Queue one prompt; the request's future resolves to the generated text without the prompt.
+
+        adapter defaults to default_adapter; BASE_ADAPTER decodes with the bare base model.
+        """
+        adapter = adapter or self.default_adapter
+        if adapter != BASE_ADAPTER and adapter not in self.adapter_paths:
+            raise KeyError(f"Unknown adapter {adapter}; loaded: {', '.join(self.adapters)}")
+        request = AdapterRequest(prompt, adapter, max_new_tokens)
+        self._ensure_worker()
+        self.requests.put(request)
+        return request
+
+    def generate(self, prompt: str, adapter: Optional[str] = None, max_new_tokens: Optional[int] = None) -> str:
+        """Blocking variant of submit()"""
+        return self.submit(prompt, adapter, max_new_tokens).future.result()
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="adapter-server", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> List[AdapterRequest]:
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [request for request in batch if request.future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                replies = self._generate_batch(batch)
+            except Exception as e:
+                logger.error(f"Adapter batch of {len(batch)} failed: {str(e)}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            for request, reply in zip(batch, replies):
+                request.future.set_result(reply)
+
+    @torch.no_grad()
+    def _generate_batch(self, batch: List[AdapterRequest]) -> List[str]:
+        """Decode prompts for different adapters together; PEFT routes each row through its own LoRA"""
+        adapter_names = [request.adapter for request in batch]
+        self.tokenizer.padding_side = "left"
+        inputs = self.tokenizer([request.prompt for request in batch], return_tensors="pt", padding=True)
+        inputs = inputs.to(self.model.device)
+        generation_kwargs = dict(self.generation_kwargs)
+        budgets = [request.max_new_tokens for request in batch if request.max_new_tokens is not None]
+        if len(budgets) == len(batch):
+            # The batch decodes until its longest budget; shorter rows stop at their EOS
+            generation_kwargs['max_new_tokens'] = max(budgets)
+
+        meter_scope = self.kv_cache_monitor.track() if self.kv_cache_monitor is not None else nullcontext({})
+        with tracer.span("test.adapter_batch", batch_size=len(batch), adapters=sorted(set(adapter_names))), \
+                meter_scope as kv_meter, self._adapters_lock:
+            output_ids = cpu_layout.run(
+                "generation", self.model.generate, **inputs, adapter_names=adapter_names, **generation_kwargs
+            )
+
+        # The rows share one cache, so each request is charged an equal part of its peak
+        kv_cache_mb = kv_meter.get('peak_bytes', 0) / (1024 * 1024) / len(batch)
+        for request in batch:
+            request.stats.update(batch_size=len(batch), kv_cache_mb=kv_cache_mb)
+        prompt_length = inputs['input_ids'].shape[-1]
+        return self.tokenizer.batch_decode(output_ids[:, prompt_length:], skip_special_tokens=True)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Path and weight memory of every attached adapter"""
+        return {
+            name: {'path': path, 'memory_mb': round(self.adapter_memory_mb(name), 1)}
+            for name, path in sorted(self.adapter_paths.items())
+        }
@@ -4,17 +4,48 @@ from model_loading import ModelLoader
 from transformers import pipeline
 from peft import PeftModel
 import warnings
-import streamlit as st
 from langchain.prompts import PromptTemplate
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
 from langchain_community.llms import HuggingFacePipeline
-from logger import Logger
+from adapter_serving import AdapterServer, choose_adapter, parse_adapter_spec
+from kv_cache import KVCacheMonitor, kv_cache_generate_kwargs, resolve_kv_cache_mode
+from math_items import MathQuestionEngine
+from phonics_items import PhonicsItemEngine
+from phonics_lexicon import get_phonics_lexicon
+from procedural_items import merge_items, split_instructions
+from section_routing import ESCALATION_TIER, SECTIONS, SectionRouter, model_tiers_from_env
+from shared.cpu_layout import get_cpu_layout
+from shared.logger import Logger
+from shared.model_registry import get_model_registry
+from shared.profiling import get_profiler
+from shared.tracing import get_tracer
+import hashlib
+import json
+import os
 import re
+import secrets
+import time
 
 warnings.filterwarnings("ignore")
 
+# Written next to the merged weights: the base model and adapter they were merged from
+MERGE_SOURCE_FILE = "merge_source.json"
+
+tracer = get_tracer("test_generation")
+profiler = get_profiler()
+cpu_layout = get_cpu_layout()
+
 class TestGenerator:
-    def __init__(self):
+    def __init__(self, base_model: str = None, lora_path: str = None, merged_model_dir: str = None,
+                 adapters: dict = None):
+        """
+        Initialization of class arguments.
+
+        1. base_model -> str | None -> Base model repo id, defaults to the 3B Llama.\n
+        2. lora_path -> str | None -> LoRA adapter merged into the base model.\n
+        3. merged_model_dir -> str | None -> Where the merged weights are cached, defaults to TEST_MODEL_MERGED_DIR.\n
+        4. adapters -> dict | None -> Adapters to serve unmerged, defaults to TEST_ADAPTERS.\n
+        """
         self.logger = Logger(
             name="TestGenerator",
             log_file_needed=True,
@@ -23,9 +54,35 @@ class TestGenerator:
         )
         self.logger.debug("Initializing TestGenerator")
 
-        self.BASE_MODEL = "meta-llama/Llama-3.2-3B-Instruct"
-        self.LORA_PATH = "llama3.2-past-lora"
+        self.BASE_MODEL = base_model or "meta-llama/Llama-3.2-3B-Instruct"
+        self.LORA_PATH = lora_path or "llama3.2-past-lora"
+        # The LoRA-merged weights are saved here once so reloads skip the PEFT merge
+        self.MERGED_MODEL_DIR = merged_model_dir or os.environ.get("TEST_MODEL_MERGED_DIR", "Models/llama3.2-past-merged")
         self.DEVICE = "mps"
+        # TEST_KV_CACHE: dynamic, static (preallocated for prompt + budget), int8 or int4 (quantized)
+        self.KV_CACHE_MODE = os.environ.get("TEST_KV_CACHE", "dynamic")
+        # A static cache is sized by this budget, so it is worth setting close to a real test's length
+        self.MAX_NEW_TOKENS = int(os.environ.get("TEST_MAX_NEW_TOKENS", "8000"))
+        self.kv_cache_monitor = None
+        self.last_kv_cache_mb = None
+        # TEST_ADAPTERS, e.g. "past=llama3.2-past-lora,past-v2=adapters/past-v2", serves the base model with
+        # these LoRA adapters attached unmerged instead of one merged model
+        self.ADAPTERS = adapters if adapters is not None else parse_adapter_spec(os.environ.get("TEST_ADAPTERS", ""))
+        # TEST_ADAPTER_EXPERIMENTS: per-grade adapter weights for A/B tests, see adapter_serving.choose_adapter
+        self.ADAPTER_EXPERIMENTS = json.loads(os.environ.get("TEST_ADAPTER_EXPERIMENTS") or "{}")
+        self.adapter_server = None
+        self.tokenizer = None
+        # Set on the default generator when TEST_SECTION_ROUTING is on, see section_routing.py
+        self.section_router = None
+        # TEST_PROCEDURAL_MATH=0 / TEST_PROCEDURAL_PHONICS=0 let the model write those items again;
+        # otherwise they come from math_items and phonics_items with computed answers
+        self.PROCEDURAL_MATH = os.environ.get("TEST_PROCEDURAL_MATH", "1") == "1"
+        self.PROCEDURAL_PHONICS = os.environ.get("TEST_PROCEDURAL_PHONICS", "1") == "1"
+        # Prompt bullet topics generated locally, in the order their items are added to a section
+        self.procedural_topics = [topic for topic, enabled in (("phonological", self.PROCEDURAL_PHONICS),
+                                                               ("mathematics", self.PROCEDURAL_MATH)) if enabled]
+        # Items per topic and section taken out of the prompt
+        self.procedural_counts = {}
         self.model_loaded = False
         self.gen_pipe = None
         self.langchain_llm = None
@@ -118,9 +175,12 @@ d) [Option 4]
 
 Generate the complete test with ALL questions in MCQ format:
 """
+        if self.procedural_topics:
+            template, self.procedural_counts = split_instructions(template, self.procedural_topics)
         self.prompt_template = PromptTemplate(
             template=template,
-            input_variables=["class_level", "reading_level", "math_complexity"]
+            input_variables=[variable for variable in ("class_level", "reading_level", "math_complexity")
+                             if "{" + variable + "}" in template]
         )
         self.logger.debug("Enhanced prompt template configured")
 
@@ -131,27 +191,40 @@ Generate the complete test with ALL questions in MCQ format:
             return
 
         try:
-            self.logger.debug(f"Loading base model: {self.BASE_MODEL} on device: {self.DEVICE}")
-            loader = ModelLoader(self.BASE_MODEL, quantize=False, device=self.DEVICE)
-            base_model, tokenizer, device = loader.load_model()
+            self.KV_CACHE_MODE = resolve_kv_cache_mode(self.KV_CACHE_MODE)
+            if self.ADAPTERS:
+                self._load_adapter_server()
+                return
+
+            if self._merged_model_current():
+                # Fastest path: memory-mapped safetensors of the already merged model
+                self.logger.debug(f"Loading merged model from {self.MERGED_MODEL_DIR} on device: {self.DEVICE}")
+                loader = ModelLoader(self.MERGED_MODEL_DIR, quantize=False, device=self.DEVICE)
+                model, tokenizer, device = loader.load_model()
+            else:
+                self.logger.debug(f"Loading base model: {self.BASE_MODEL} on device: {self.DEVICE}")
+                loader = ModelLoader(self.BASE_MODEL, quantize=False, device=self.DEVICE)
+                base_model, tokenizer, device = loader.load_model()
+
+                self.logger.debug("Loading and merging LoRA weights")
+                model = PeftModel.from_pretrained(base_model, self.LORA_PATH)
+                model = model.merge_and_unload()
+                self._save_merged_model(model, tokenizer)
+
+            model = loader.optimize(model)
+            self.logger.debug(f"Execution profile: {loader.execution_profile.name}")
 
-            self.logger.debug("Loading and merging LoRA weights")
-            model = PeftModel.from_pretrained(base_model, self.LORA_PATH)
-            model = model.merge_and_unload()
+            self.kv_cache_monitor = KVCacheMonitor(model)
+            self.tokenizer = tokenizer
+            self.logger.debug(f"KV cache mode: {self.KV_CACHE_MODE}, budget {self.MAX_NEW_TOKENS} new tokens")
 
             self.logger.debug("Creating HuggingFace text-generation pipeline")
             self.gen_pipe = pipeline(
                 "text-generation",
                 model=model,
                 tokenizer=tokenizer,
-                max_new_tokens=8000,
-                do_sample=True,
-                temperature=0.1,
-                top_p=None,
-                eos_token_id=tokenizer.eos_token_id,
-                pad_token_id=tokenizer.eos_token_id,
                 return_full_text=False,
-                repetition_penalty=1.02,
+                **self._generation_kwargs(tokenizer),
             )
             self.langchain_llm = HuggingFacePipeline(pipeline=self.gen_pipe)
 
@@ -161,9 +234,88 @@ Generate the complete test with ALL questions in MCQ format:
             self.logger.error(f"load_model failed: {e}")
             raise
 
+    def _load_adapter_server(self):
+        """Keep the base model resident with every configured adapter attached, unmerged"""
+        self.logger.debug(f"Loading base model {self.BASE_MODEL} for adapters: {', '.join(self.ADAPTERS)}")
+        loader = ModelLoader(self.BASE_MODEL, quantize=False, device=self.DEVICE)
+        base_model, tokenizer, device = loader.load_model()
+        # Not compiled: the per-row LoRA routing changes the graph from batch to batch
+        self.kv_cache_monitor = KVCacheMonitor(base_model)
+        self.tokenizer = tokenizer
+        self.adapter_server = AdapterServer(
+            base_model, tokenizer, self.BASE_MODEL, self.ADAPTERS, self._generation_kwargs(tokenizer),
+            max_batch_size=int(os.environ.get("TEST_ADAPTER_BATCH_SIZE", "4")),
+            kv_cache_monitor=self.kv_cache_monitor,
+        )
+        self.model_loaded = True
+        self.logger.debug(f"Adapter server ready with {', '.join(self.adapter_server.adapters)}")
+
+    def _generation_kwargs(self, tokenizer) -> dict:
+        """Sampling settings and KV cache of every test generation"""
+        return {
+            "max_new_tokens": self.MAX_NEW_TOKENS,
+            "do_sample": True,
+            "temperature": 0.1,
+            "top_p": None,
+            "eos_token_id": tokenizer.eos_token_id,
+            "pad_token_id": tokenizer.eos_token_id,
+            "repetition_penalty": 1.02,
+            **kv_cache_generate_kwargs(self.KV_CACHE_MODE),
+        }
+
+    def _merge_source(self) -> dict:
+        """
+        What the merged weights are built from. A local adapter is identified by the hash of
+        its config and the size and modification time of its other files, so retraining
+        it in place is noticed without hashing the weights.
+        """
+        adapter = hashlib.sha256()
+        if os.path.isdir(self.LORA_PATH):
+            for name in sorted(os.listdir(self.LORA_PATH)):
+                path = os.path.join(self.LORA_PATH, name)
+                if name == "adapter_config.json":
+                    with open(path, "rb") as config:
+                        adapter.update(config.read())
+                elif os.path.isfile(path):
+                    stat = os.stat(path)
+                    adapter.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return {
+            "base_model": self.BASE_MODEL,
+            "lora_path": os.path.abspath(self.LORA_PATH) if os.path.isdir(self.LORA_PATH) else self.LORA_PATH,
+            "adapter_hash": adapter.hexdigest(),
+        }
+
+    def _merged_model_current(self) -> bool:
+        """Whether MERGED_MODEL_DIR holds a merge of the configured base model and adapter"""
+        if not os.path.exists(os.path.join(self.MERGED_MODEL_DIR, "config.json")):
+            return False
+        try:
+            with open(os.path.join(self.MERGED_MODEL_DIR, MERGE_SOURCE_FILE)) as source:
+                recorded = json.load(source)
+        except (OSError, ValueError):
+            recorded = None
+        if recorded != self._merge_source():
+            self.logger.info(f"Merged model in {self.MERGED_MODEL_DIR} is stale or unlabelled; merging again")
+            return False
+        return True
+
+    def _save_merged_model(self, model, tokenizer):
+        """Keep the merged weights as safetensors for the next reload; failures only cost speed"""
+        size_gb = sum(parameter.numel() * parameter.element_size() for parameter in model.parameters()) / 1024 ** 3
+        self.logger.info(f"Saving the merged model ({size_gb:.1f} GB) to {self.MERGED_MODEL_DIR}")
+        try:
+            model.save_pretrained(self.MERGED_MODEL_DIR, safe_serialization=True)
+            tokenizer.save_pretrained(self.MERGED_MODEL_DIR)
+            # Written last, so an interrupted save is never taken for a current one
+            with open(os.path.join(self.MERGED_MODEL_DIR, MERGE_SOURCE_FILE), "w") as source:
+                json.dump(self._merge_source(), source, indent=2)
+            self.logger.info(f"Merged model saved to {self.MERGED_MODEL_DIR}")
+        except Exception as e:
+            self.logger.warning(f"Could not save merged model: {e}")
+
     def get_class_parameters(self, class_level: str) -> dict:
         """Return reading and math complexity for a given grade"""
-        self.logger.debug(f"Determining parameters for class_level='{class_level}'")
+        self.logger.debug("Determining parameters for class_level='%s'", class_level)
         if class_level in ["1st Grade", "2nd Grade"]:
             params = {"reading_level": "1st-grade", "math_complexity": "single-digit"}
         elif class_level in ["3rd Grade", "4th Grade"]:
@@ -174,13 +326,17 @@ Generate the complete test with ALL questions in MCQ format:
             params = {"reading_level": "4th-grade", "math_complexity": "three-digit"}
         else:  # High school
             params = {"reading_level": "5th-grade", "math_complexity": "multi-digit"}
-        self.logger.debug(f"Class parameters: {params}")
+        self.logger.debug("Class parameters: %s", params)
         return params
 
     def parse_generated_output(self, raw_output: str) -> str:
         """Parse raw text into formatted markdown for the test"""
         self.logger.debug("Parsing generated output")
-        return self._direct_format_output(raw_output)
+        with tracer.span("test.parse"):
+            return self._direct_format_output(raw_output)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
 
     def _direct_format_output(self, raw_output: str) -> str:
         """Enhanced formatting with interactive MCQ structure and proper headings"""
@@ -253,23 +409,40 @@ Generate the complete test with ALL questions in MCQ format:
         
         return "\n".join(formatted)
 
-    def generate_test(self, class_level: str) -> str:
-        """Generate and return the formatted MCQ test for the given grade"""
-        self.logger.debug(f"generate_test called for class_level='{class_level}'")
+    @profiler.profiled("generate_test")
+    def generate_test(self, class_level: str, adapter: str = None, student_key: str = "",
+                      item_seed: int = None) -> str:
+        """
+        Generate and return the formatted MCQ test for the given grade
+
+        With adapter serving, adapter picks the LoRA adapter; otherwise it is chosen from the
+        A/B weights for the grade, sticky per student_key. item_seed reproduces the procedural
+        phonological and mathematics items, answer key included; callers that need to rebuild a
+        test pass one and keep it with the test, as rosters do. Without it a random seed is used.
+        """
+        self.logger.debug("generate_test called for class_level='%s'", class_level)
         if not self.model_loaded:
             self.load_model()
 
         params = self.get_class_parameters(class_level)
-        prompt = self.prompt_template.format(
-            class_level=class_level,
-            reading_level=params["reading_level"],
-            math_complexity=params["math_complexity"]
-        )
-        self.logger.debug(f"Formatted prompt (first 200 chars): {prompt[:200]}")
 
         try:
-            response = self.langchain_llm(prompt)
-            self.logger.debug(f"Raw response length: {len(response)}")
+            if self.section_router is not None:
+                # The router builds and generates one prompt per section
+                response = self.section_router.generate_test(class_level, params, student_key)
+            else:
+                with tracer.span("test.prompt", class_level=class_level):
+                    prompt = self.prompt_template.format(
+                        class_level=class_level,
+                        reading_level=params["reading_level"],
+                        math_complexity=params["math_complexity"]
+                    )
+                self.logger.debug("Formatted prompt (first 200 chars): %.200s", prompt)
+                response = self.generate_raw(prompt, "test.generate", adapter=adapter, student_key=student_key,
+                                             class_level=class_level)
+            if self.procedural_topics:
+                response = self.add_procedural_items(response, params, item_seed)
+            self.logger.debug("Raw response length: %d", len(response))
             test_md = self.parse_generated_output(response)
             self.logger.debug("Test generation and parsing succeeded")
             return test_md
@@ -277,15 +450,106 @@ Generate the complete test with ALL questions in MCQ format:
             self.logger.error(f"generate_test failed: {e}")
             raise
 
+    def generate_raw(self, prompt: str, stage: str, max_new_tokens: int = None, adapter: str = None,
+                     student_key: str = "", class_level: str = "", **attributes) -> str:
+        """
+        Generate text for one prompt, recording latency, tokens and KV cache under the span `stage`.
+
+        max_new_tokens overrides the test-wide budget, e.g. for a single section.
+        """
+        started = time.perf_counter()
+        with tracer.span(stage, class_level=class_level, kv_cache=self.KV_CACHE_MODE, **attributes) as span:
+            if self.adapter_server is not None:
+                adapter = (adapter
+                           or choose_adapter(self.ADAPTER_EXPERIMENTS, class_level, student_key,
+                                             available=self.adapter_server.adapters)
+                           or self.adapter_server.default_adapter)
+                span['adapter'] = adapter
+                request = self.adapter_server.submit(prompt, adapter, max_new_tokens)
+                response = request.future.result()
+                self.last_kv_cache_mb = request.stats.get('kv_cache_mb', 0.0)
+                span['batch_size'] = request.stats.get('batch_size')
+            else:
+                with self.kv_cache_monitor.track() as kv_meter:
+                    if max_new_tokens is None:
+                        response = cpu_layout.run("generation", self.langchain_llm, prompt)
+                    else:
+                        response = cpu_layout.run("generation", self._pipeline_text, prompt, max_new_tokens)
+                self.last_kv_cache_mb = kv_meter['peak_bytes'] / (1024 * 1024)
+            span['kv_cache_peak_mb'] = round(self.last_kv_cache_mb, 1)
+        generate_seconds = time.perf_counter() - started
+        tracer.record_memory(stage + ".kv_cache", self.last_kv_cache_mb)
+        self.logger.info(f"Peak KV cache for {stage}: {self.last_kv_cache_mb:.1f} MB ({self.KV_CACHE_MODE})")
+        if tracer.enabled:
+            # Counted after the fact; the prompt and reply are re-tokenized outside the timed span
+            tracer.record_tokens(stage, self.count_tokens(prompt), self.count_tokens(response), generate_seconds)
+        return response
+
+    def add_procedural_items(self, response: str, params: dict, seed: int = None) -> str:
+        """Merge locally generated phonological and mathematics items into the sections of a generated test"""
+        seed = secrets.randbits(32) if seed is None else seed
+        engines = {
+            "phonological": lambda: PhonicsItemEngine(get_phonics_lexicon(), seed).section_items(
+                params["reading_level"], self.procedural_counts.get("phonological", {})),
+            "mathematics": lambda: MathQuestionEngine(seed).section_items(
+                params["math_complexity"], self.procedural_counts.get("mathematics", {})),
+        }
+        items = {}
+        with tracer.span("test.procedural_items", seed=seed, **params) as span:
+            for topic in self.procedural_topics:
+                for section, section_items in engines[topic]().items():
+                    items.setdefault(section, []).extend(section_items)
+            span['items'] = sum(len(section_items) for section_items in items.values())
+            merged = merge_items(response, items, {section: SECTIONS[section][0] for section in items})
+        expected = sum(sum(counts.values()) for counts in self.procedural_counts.values())
+        if span['items'] < expected:
+            self.logger.warning(f"Only {span['items']} of {expected} procedural items could be built for {params}")
+        self.logger.info(f"Added {span['items']} procedural items with seed {seed}")
+        return merged
+
+    def _pipeline_text(self, prompt: str, max_new_tokens: int) -> str:
+        return self.gen_pipe(prompt, max_new_tokens=max_new_tokens)[0]['generated_text']
+
 def generate_screening_test() -> str:
     """Generate a default screening test for 6th grade"""
     gen = TestGenerator()
     return gen.generate_test("6th Grade")
 
-# For Streamlit caching
-@st.cache_resource
-def get_test_generator() -> TestGenerator:
-    """Return a cached TestGenerator instance"""
+# TEST_SECTION_ROUTING=1 generates each section on the model tier chosen in section_routing.py
+SECTION_ROUTING = os.environ.get("TEST_SECTION_ROUTING", "0") == "1"
+
+def _load_test_generator() -> TestGenerator:
     gen = TestGenerator()
     gen.load_model()
+    if SECTION_ROUTING:
+        gen.section_router = SectionRouter(get_tier_generator, procedural_topics=gen.procedural_topics)
     return gen
+
+def _tier_loader(tier: str, config: dict):
+    # Never the default generator's TEST_MODEL_MERGED_DIR, which holds another model's merged weights
+    merged_model_dir = config.get("merged_model_dir") or os.path.join("Models", f"test-generator-{tier}-merged")
+
+    def load() -> TestGenerator:
+        # Smaller tiers always run one merged model; adapter serving stays on the default generator
+        gen = TestGenerator(config["base_model"], config["lora_path"], merged_model_dir, adapters={})
+        gen.load_model()
+        return gen
+    return load
+
+# Shared by every Streamlit session; the registry may evict it between bursts of tests
+model_registry = get_model_registry()
+model_registry.register('test_generator', _load_test_generator)
+if SECTION_ROUTING:
+    for tier, tier_config in model_tiers_from_env().items():
+        if tier != ESCALATION_TIER:
+            model_registry.register(f'test_generator_{tier}', _tier_loader(tier, tier_config))
+
+def get_tier_generator(tier: str) -> TestGenerator:
+    """The loaded generator of a section-routing tier; ESCALATION_TIER is the default generator"""
+    if tier == ESCALATION_TIER:
+        return model_registry.get('test_generator')
+    return model_registry.get(f'test_generator_{tier}')
+
+def get_test_generator() -> TestGenerator:
+    """Return the shared TestGenerator, loading the model on first use or after eviction"""
+    return model_registry.get('test_generator')
@@ -0,0 +1,117 @@
+import contextvars
+import importlib.util
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import torch
+
+from shared.logger import Logger
+
+logger = Logger(name="KV Cache", log_file_needed=True, log_file_path="Logs/kv_cache.log", level="DEV")
+
+# dynamic: transformers' default cache, grown token by token
+# static: preallocated once for the prompt plus the token budget, no reallocation while decoding
+# int8 / int4: keys and values quantized, only the most recent tokens kept in full precision
+KV_CACHE_MODES = ("dynamic", "static", "int8", "int4")
+
+# Quantized-cache backends per mode, in order of preference; quanto has no 8-bit cache
+QUANTIZED_BACKENDS = {
+    "int8": [("HQQ", "hqq")],
+    "int4": [("quanto", "optimum.quanto"), ("HQQ", "hqq")],
+}
+
+_active_meter: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("kv_cache_meter", default=None)
+
+def _module_available(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+def resolve_kv_cache_mode(mode: str) -> str:
+    """The requested mode, or static when no quantized-cache backend is installed for it"""
+    if mode not in KV_CACHE_MODES:
+        raise ValueError(f"Unknown KV cache mode '{mode}', expected one of {', '.join(KV_CACHE_MODES)}")
+    if mode in QUANTIZED_BACKENDS and not any(_module_available(module) for _, module in QUANTIZED_BACKENDS[mode]):
+        packages = " or ".join(module for _, module in QUANTIZED_BACKENDS[mode])
+        logger.warning(f"KV cache mode {mode} needs {packages}; using a static cache instead")
+        return "static"
+    return mode
+
+def kv_cache_generate_kwargs(mode: str) -> Dict:
+    """generate() arguments selecting the cache for an already resolved mode"""
+    if mode == "static":
+        # transformers sizes the static cache to the prompt plus max_new_tokens
+        return {"cache_implementation": "static"}
+    if mode in QUANTIZED_BACKENDS:
+        backend = next(backend for backend, module in QUANTIZED_BACKENDS[mode] if _module_available(module))
+        return {
+            "cache_implementation": "quantized",
+            "cache_config": {"backend": backend, "nbits": 8 if mode == "int8" else 4},
+        }
+    return {}
+
+def tensor_nbytes(value, seen: set, depth: int = 0) -> int:
+    """
+    Bytes held by the tensors reachable from a cache object.
+
+    Shared storage is counted once. Quantized tensor subclasses are measured by the
+    packed data and scales they wrap, not by their logical shape.
+    """
+    if depth > 4 or value is None or isinstance(value, (str, bytes, int, float, bool)):
+        return 0
+    if isinstance(value, torch.Tensor):
+        if hasattr(value, "__tensor_flatten__") and type(value) is not torch.Tensor:
+            inner_names, _ = value.__tensor_flatten__()
+            return sum(tensor_nbytes(getattr(value, name), seen, depth + 1) for name in inner_names)
+        storage = value.untyped_storage()
+        if storage.data_ptr() in seen:
+            return 0
+        seen.add(storage.data_ptr())
+        return storage.nbytes()
+    if isinstance(value, dict):
+        children = value.values()
+    elif isinstance(value, (list, tuple)):
+        children = value
+    else:
+        children = getattr(value, "__dict__", {}).values()
+    return sum(tensor_nbytes(child, seen, depth + 1) for child in children)
+
+class KVCacheMonitor:
+    """
+    Records the peak KV cache size of each generation on a model.
+
+    A forward hook measures the cache every step; the measurements go to the meter of
+    the generation running in the current context, so concurrent requests do not mix.
+    """
+
+    def __init__(self, model: torch.nn.Module):
+        """
+        Initialization of class arguments.
+
+        1. model -> torch.nn.Module -> Causal model whose forward outputs carry past_key_values.\n
+        """
+        self._handle = model.register_forward_hook(self._after_forward)
+
+    def _after_forward(self, module, args, output):
+        meter = _active_meter.get()
+        if meter is None:
+            return
+        cache = getattr(output, "past_key_values", None)
+        if cache is None:
+            return
+        meter['steps'] += 1
+        meter['peak_bytes'] = max(meter['peak_bytes'], tensor_nbytes(cache, set()))
+
+    @contextmanager
+    def track(self):
+        """Scope of one generation; yields a dict whose peak_bytes is filled in while it runs"""
+        meter = {'peak_bytes': 0, 'steps': 0}
+        token = _active_meter.set(meter)
+        try:
+            yield meter
+        finally:
+            _active_meter.reset(token)
+
+    def remove(self):
+        self._handle.remove()
@@ -2,7 +2,19 @@
 
 import streamlit as st
 import datetime
+import os
+import secrets
+import sys
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from generation_pipeline import get_test_generator
+from roster import CLASS_OPTIONS, RosterStore, access_codes_csv, generate_roster_tests, parse_roster
+from shared.profiling import get_profiler
+from shared.tracing import get_tracer
+
+tracer = get_tracer("test_generation")
 
 # Page configuration
 st.set_page_config(
@@ -391,10 +403,7 @@ class StudentInfoManager:
     @staticmethod
     def get_class_options():
         """Return list of available class/grade options"""
-        return [
-            "1st Grade", "2nd Grade", "3rd Grade", "4th Grade", "5th Grade", "6th Grade",
-            "7th Grade", "8th Grade", "9th Grade", "10th Grade", "11th Grade", "12th Grade"
-        ]
+        return list(CLASS_OPTIONS)
     
     @staticmethod
     def validate_required_fields(first_name, last_name, class_level):
@@ -456,12 +465,35 @@ class UIComponents:
             st.markdown("### Your Information:")
             st.write(f"**Name:** {student_info['first_name']} {student_info['last_name']}")
             st.write(f"**Grade:** {student_info['class_level']}")
-            st.write(f"**Age:** {student_info['age']}")
+            st.write(f"**Age:** {student_info.get('age') or '—'}")
         
         with col2:
             st.markdown("### Test Details:")
             st.write(f"**Date:** {student_info['registration_date']}")
     
+    @staticmethod
+    def render_profiling_toggle():
+        """Admin-only sidebar control for request profiling (ADMIN_MODE=1)"""
+        if os.environ.get("ADMIN_MODE", "0") != "1":
+            return
+        profiler = get_profiler()
+        with st.sidebar.expander("🛠️ Profiling", expanded=False):
+            sample_rate = st.slider(
+                "Profiled share of test generations", 0.0, 1.0, float(profiler.sample_rate), 0.05
+            )
+            if sample_rate != profiler.sample_rate:
+                profiler.set_sample_rate(sample_rate)
+            st.caption(f"Profiles are written to {profiler.profiles_dir}/")
+
+    @staticmethod
+    def render_roster_link():
+        """Admin-only sidebar entry to the class roster import (ADMIN_MODE=1)"""
+        if os.environ.get("ADMIN_MODE", "0") != "1":
+            return
+        if st.sidebar.button("👩‍🏫 Import Class Roster", use_container_width=True):
+            st.session_state.page = 'roster'
+            st.rerun()
+
     @staticmethod
     def render_test_instructions():
         """Render test instructions"""
@@ -483,6 +515,7 @@ class PageManager:
     def __init__(self):
         self.info_manager = StudentInfoManager()
         self.ui = UIComponents()
+        self.roster_store = RosterStore()
         self.init_session_state()
     
     def init_session_state(self):
@@ -495,6 +528,26 @@ class PageManager:
             st.session_state.test_generated = False
         if 'test_content' not in st.session_state:
             st.session_state.test_content = ""
+        # A roster link opens its pre-generated test; the code is dropped from the URL so
+        # "Back to Home" does not reopen it
+        code = st.query_params.get("code")
+        if code:
+            del st.query_params["code"]
+            if not self.open_access_code(code):
+                st.error("This access code was not found. Please check the link with your teacher.")
+
+    def open_access_code(self, code):
+        """Load the student and pre-generated test of a roster access code"""
+        opened = self.roster_store.open_code(code)
+        if opened is None:
+            return False
+        student_info, test = opened
+        st.session_state.student_info = student_info
+        st.session_state.test_content = test["content"]
+        st.session_state.test_generated = True
+        st.session_state.test_item_seed = test.get("seed")
+        st.session_state.page = 'test_ready'
+        return True
     
     def render_signup_page(self):
         """Render the signup page"""
@@ -519,9 +572,62 @@ class PageManager:
                         st.rerun()
                     else:
                         st.error("Please fill in all required fields marked with *")
+            with st.form("access_code"):
+                st.subheader("Have an Access Code?")
+                code = st.text_input("Access Code", placeholder="ABCD-EFGH")
+                if st.form_submit_button("Open My Test"):
+                    if self.open_access_code(code):
+                        st.rerun()
+                    else:
+                        st.error("This access code was not found. Please check it with your teacher.")
         with col2:
             self.ui.render_info_panel()
     
+    def render_roster_page(self):
+        """Render the roster import: one shared test per grade band and variant, a code per student"""
+        st.markdown('<div class="section-header">Import a Class Roster</div>', unsafe_allow_html=True)
+        st.markdown(
+            "Upload a CSV or JSON roster with **first_name**, **last_name** and **class_level** (or **grade**) "
+            "for each student, and an optional **age**. Grades that share a difficulty band share their "
+            "tests, so a class costs one generation per band and variant."
+        )
+        uploaded = st.file_uploader("Roster file", type=["csv", "json"])
+        variants = st.number_input("Test variants per grade band", min_value=1, max_value=10, value=2)
+        if uploaded is not None and st.button("📝 Generate Tests", type="primary"):
+            try:
+                students, errors = parse_roster(uploaded.getvalue(), uploaded.name)
+            except ValueError as e:
+                st.error(f"Could not read the roster: {e}")
+                students, errors = [], []
+            for error in errors:
+                st.warning(error)
+            if students:
+                progress = st.progress(0.0)
+                with st.spinner(f"🤖 Generating tests for {len(students)} students..."):
+                    with tracer.request(name="roster.request"):
+                        st.session_state.roster_result = generate_roster_tests(
+                            get_test_generator(), students, int(variants), store=self.roster_store,
+                            progress=lambda done, total: progress.progress(done / total),
+                        )
+
+        result = st.session_state.get('roster_result')
+        if result:
+            issued = sum(1 for student in result["students"] if student["access_code"])
+            st.success(f"✅ {len(result['tests'])} tests generated for {len(result['students'])} students; "
+                       f"{issued} access codes issued.")
+            for error in result["errors"]:
+                st.error(error)
+            st.dataframe([
+                {key: student[key] for key in ("first_name", "last_name", "class_level", "access_code", "link")}
+                for student in result["students"]
+            ], use_container_width=True)
+            st.download_button("⬇️ Download Access Codes", access_codes_csv(result),
+                               file_name=f"access_codes_{result['roster_id']}.csv", mime="text/csv")
+
+        if st.button("🏠 Back to Home"):
+            st.session_state.page = 'signup'
+            st.rerun()
+    
     def render_test_ready_page(self):
         """Render the test ready page"""
         self.ui.render_welcome_message(
@@ -566,7 +672,18 @@ class PageManager:
             try:
                 with st.spinner("🤖 Loading model and generating your personalized MCQ test... This may take a moment."):
                     generator = get_test_generator()
-                    test_content = generator.generate_test(st.session_state.student_info['class_level'])
+                    # One request ID per generated test ties its stages and log lines together
+                    with tracer.request(name="test.request") as request_id:
+                        student_info = st.session_state.student_info
+                        # Kept with the test so its procedural items and answer key can be rebuilt
+                        item_seed = secrets.randbits(32)
+                        test_content = generator.generate_test(
+                            student_info['class_level'],
+                            student_key=f"{student_info['first_name']} {student_info['last_name']}",
+                            item_seed=item_seed,
+                        )
+                    st.session_state.test_request_id = request_id
+                    st.session_state.test_item_seed = item_seed
                     if test_content:
                         st.session_state.test_content = test_content
                         st.session_state.test_generated = True
@@ -711,10 +828,14 @@ class PageManager:
             self.render_test_ready_page()
         elif st.session_state.page == 'test':
             self.render_test_page()
+        elif st.session_state.page == 'roster':
+            self.render_roster_page()
 
 def main():
     """Main application function"""
     page_manager = PageManager()
+    UIComponents.render_profiling_toggle()
+    UIComponents.render_roster_link()
     page_manager.render_current_page()
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import random
+from typing import Callable, Dict, List, Tuple
+
+from procedural_items import McqItem
+
+# Operand range and operations per math_complexity from TestGenerator.get_class_parameters.
+# factor_range bounds the second operand of multiplication and division.
+COMPLEXITY_LEVELS = {
+    "single-digit": {"range": (1, 9), "factor_range": (2, 5), "operations": ("+", "-")},
+    "two-digit": {"range": (10, 99), "factor_range": (2, 9), "operations": ("+", "-", "×")},
+    "three-digit": {"range": (100, 999), "factor_range": (2, 9), "operations": ("+", "-", "×", "÷")},
+    "multi-digit": {"range": (1000, 9999), "factor_range": (11, 99), "operations": ("+", "-", "×", "÷")},
+}
+
+NAMES = ("Maya", "Leo", "Aisha", "Ben", "Priya", "Omar", "Lucy", "Kenji", "Sara", "Diego")
+THINGS = ("apples", "stickers", "marbles", "pencils", "books", "shells", "cards", "stamps", "beads", "cookies")
+
+class MathQuestionEngine:
+    """
+    Seedable generator of arithmetic and word-problem MCQs per complexity and Bloom level.
+
+    Every answer is computed with integer arithmetic and the distractors are the
+    mistakes students make on the same numbers: an off-by-one, a place-value slip,
+    the wrong operation or reversed digits. The same seed always yields the same items.
+    """
+
+    def __init__(self, seed: int):
+        """
+        Initialization of class arguments.
+
+        1. seed -> int -> Seed of the private random generator; record it to reproduce a test.\n
+        """
+        self.seed = seed
+        self.random = random.Random(seed)
+        self._builders: Dict[str, Callable[[str], McqItem]] = {
+            "L1": self._remembering,
+            "L2": self._understanding,
+            "L3": self._applying,
+            "L4": self._analyzing,
+        }
+
+    def generate(self, complexity: str, bloom_level: str, count: int) -> List[McqItem]:
+        """count distinct items; unknown complexities use the hardest level"""
+        if complexity not in COMPLEXITY_LEVELS:
+            complexity = "multi-digit"
+        build = self._builders[bloom_level]
+        items, questions = [], set()
+        for _ in range(count * 20):
+            if len(items) == count:
+                break
+            item = build(complexity)
+            if item.question not in questions:
+                questions.add(item.question)
+                items.append(item)
+        return items
+
+    def section_items(self, complexity: str, counts: Dict[str, int]) -> Dict[str, List[McqItem]]:
+        """Items for every section, e.g. counts={"L1": 2, "L2": 2, "L3": 3, "L4": 3}"""
+        return {section: self.generate(complexity, section, count) for section, count in counts.items() if count}
+
+    def _number(self, complexity: str) -> int:
+        return self.random.randint(*COMPLEXITY_LEVELS[complexity]["range"])
+
+    def _operation(self, complexity: str) -> Tuple[str, int, int, int]:
+        """An operation, its operands and its exact non-negative result"""
+        level = COMPLEXITY_LEVELS[complexity]
+        operation = self.random.choice(level["operations"])
+        if operation in ("×", "÷"):
+            factor = self.random.randint(*level["factor_range"])
+            # Keep products within the level by scaling the first operand down
+            low, high = level["range"]
+            first = self.random.randint(max(1, low // factor), max(2, high // factor))
+            if operation == "×":
+                return operation, first, factor, first * factor
+            return operation, first * factor, factor, first
+        first, second = self._number(complexity), self._number(complexity)
+        if operation == "-":
+            first, second = max(first, second), min(first, second)
+            return operation, first, second, first - second
+        return operation, first, second, first + second
+
+    def _distractors(self, answer: int, first: int = None, second: int = None) -> List[int]:
+        """Three wrong answers close to the right one"""
+        candidates = {answer + 1, answer - 1, answer + 10, answer - 10}
+        if first is not None and second is not None:
+            candidates.update({first + second, abs(first - second), first * second})
+        if answer >= 10 and answer % 10:
+            candidates.add(int(str(answer)[::-1]))
+        plausible = [value for value in sorted(candidates)
+                     if value != answer and value >= 0 and value <= 2 * answer + 10]
+        self.random.shuffle(plausible)
+        distractors = sorted(plausible[:3])
+        step = 2
+        while len(distractors) < 3:
+            value = answer + self.random.choice((-1, 1)) * step
+            if value >= 0 and value != answer and value not in distractors:
+                distractors.append(value)
+            step += 1
+        return distractors
+
+    def _item(self, question: str, answer, distractors: List, bloom_level: str, complexity: str) -> McqItem:
+        options = [str(answer)] + [str(value) for value in distractors]
+        self.random.shuffle(options)
+        return McqItem(question, tuple(options), options.index(str(answer)), bloom_level, complexity)
+
+    def _remembering(self, complexity: str) -> McqItem:
+        operation, first, second, result = self._operation(complexity)
+        return self._item(f"What is {first} {operation} {second}?", result,
+                          self._distractors(result, first, second), "L1", complexity)
+
+    def _understanding(self, complexity: str) -> McqItem:
+        operation, first, second, result = self._operation(complexity)
+        name, things = self.random.choice(NAMES), self.random.choice(THINGS)
+        question = {
+            "+": f"{name} has {first} {things} and then gets {second} more. How many {things} does {name} have now?",
+            "-": f"{name} had {first} {things} and gave away {second}. How many {things} does {name} have left?",
+            "×": f"There are {first} boxes with {second} {things} in each box. How many {things} are there in all?",
+            "÷": f"{first} {things} are shared equally among {second} friends. How many {things} does each friend get?",
+        }[operation]
+        return self._item(question, result, self._distractors(result, first, second), "L2", complexity)
+
+    def _applying(self, complexity: str) -> McqItem:
+        """Two-step real-world problems"""
+        name, things = self.random.choice(NAMES), self.random.choice(THINGS)
+        if "×" in COMPLEXITY_LEVELS[complexity]["operations"] and self.random.random() < 0.5:
+            _, per_bag, bags, total = self._operation_with(complexity, "×")
+            given = self.random.randint(1, total)
+            result = total - given
+            question = (f"{name} buys {bags} bags of {things} with {per_bag} in each bag and then gives away "
+                        f"{given}. How many {things} does {name} have left?")
+            return self._item(question, result, self._distractors(result, total, given), "L3", complexity)
+        start, added = self._number(complexity), self._number(complexity)
+        removed = self.random.randint(1, start + added)
+        result = start + added - removed
+        question = (f"A class collects {start} {things} on Monday and {added} on Tuesday. On Wednesday they use "
+                    f"{removed}. How many {things} are left?")
+        return self._item(question, result, self._distractors(result, start + added, removed), "L3", complexity)
+
+    def _analyzing(self, complexity: str) -> McqItem:
+        """Missing numbers and number patterns"""
+        if self.random.random() < 0.5:
+            operation, first, second, result = self._operation(complexity)
+            question = f"Which number makes this true? {first} {operation} ? = {result}"
+            return self._item(question, second, self._distractors(second, first, result), "L4", complexity)
+        low, high = COMPLEXITY_LEVELS[complexity]["range"]
+        step = self.random.randint(2, max(3, high // 10))
+        start = self.random.randint(low, max(low, high - 5 * step))
+        pattern = [start + index * step for index in range(4)]
+        result = start + 4 * step
+        question = f"What number comes next in the pattern {', '.join(map(str, pattern))}, ...?"
+        distractors = self._distractors(result)
+        wrong_step = result + step
+        if wrong_step not in distractors:
+            distractors[-1] = wrong_step
+        return self._item(question, result, distractors, "L4", complexity)
+
+    def _operation_with(self, complexity: str, operation: str) -> Tuple[str, int, int, int]:
+        """_operation restricted to one operation"""
+        while True:
+            drawn = self._operation(complexity)
+            if drawn[0] == operation:
+                return drawn
@@ -1,8 +1,17 @@
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
+from shared.execution_profile import (
+    ExecutionProfile,
+    compile_model,
+    execution_profile_from_env,
+    load_with_attention_fallback,
+    resolved_profile,
+)
+
 class ModelLoader:
-    def __init__(self, base_model_name: str, quantize: bool = False, device: str | None = None):
+    def __init__(self, base_model_name: str, quantize: bool = False, device: str | None = None,
+                 execution_profile: ExecutionProfile | str | None = None):
         self.base_model_name = base_model_name
         self.quantize = quantize
         if device:
@@ -13,19 +22,38 @@ class ModelLoader:
             self.device = "mps"
         else:
             self.device = "cpu"
+        if isinstance(execution_profile, str):
+            execution_profile = ExecutionProfile.parse(execution_profile)
+        # TEST_MODEL_EXECUTION_PROFILE, e.g. "sdpa+compile"; see shared/execution_profile.py
+        self.requested_execution_profile = execution_profile or execution_profile_from_env("TEST_MODEL_EXECUTION_PROFILE")
+        self.attention = None
+        self.execution_profile = None
 
     def load_model(self) -> tuple[torch.nn.Module, AutoTokenizer, str]:
         tokenizer = AutoTokenizer.from_pretrained(self.base_model_name)
         if not tokenizer.pad_token:
             tokenizer.pad_token = tokenizer.eos_token
 
-        load_kwargs = {"attn_implementation": "eager"}
+        load_kwargs = {}
         if self.quantize:
             load_kwargs["torch_dtype"] = torch.float16
 
-        model = AutoModelForCausalLM.from_pretrained(
-            self.base_model_name,
-            **load_kwargs
-        ).to(self.device)
+        model, self.attention = load_with_attention_fallback(
+            lambda attn_implementation: AutoModelForCausalLM.from_pretrained(
+                self.base_model_name,
+                attn_implementation=attn_implementation,
+                **load_kwargs
+            ),
+            self.requested_execution_profile,
+            device=self.device,
+        )
+        model = model.to(self.device)
         model.eval()
+        self.execution_profile = resolved_profile(self.requested_execution_profile, self.attention, False)
         return model, tokenizer, self.device
+
+    def optimize(self, model: torch.nn.Module) -> torch.nn.Module:
+        """Apply torch.compile from the execution profile; call after any weight changes such as a LoRA merge"""
+        model, compiled = compile_model(model, self.requested_execution_profile)
+        self.execution_profile = resolved_profile(self.requested_execution_profile, self.attention, compiled)
+        return model
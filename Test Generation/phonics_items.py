@@ -0,0 +1,242 @@
+import random
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from phonics_lexicon import RIME, LexiconEntry, PhonicsLexicon
+from procedural_items import McqItem
+
+# Words a reading_level band from TestGenerator.get_class_parameters may use: at least this
+# frequent and at most this many syllables
+READING_LEVELS = {
+    "1st-grade": {"min_zipf": 4.0, "max_syllables": 2},
+    "2nd-grade": {"min_zipf": 3.7, "max_syllables": 3},
+    "3rd-grade": {"min_zipf": 3.4, "max_syllables": 4},
+    "4th-grade": {"min_zipf": 3.0, "max_syllables": 5},
+    "5th-grade": {"min_zipf": 0.0, "max_syllables": 5},
+}
+
+# How a sound is written between slashes in a question, e.g. "/sh/"
+SOUND_SPELLINGS = {
+    "B": "b", "CH": "ch", "D": "d", "DH": "th", "F": "f", "G": "g", "HH": "h", "JH": "j", "K": "k",
+    "L": "l", "M": "m", "N": "n", "NG": "ng", "P": "p", "R": "r", "S": "s", "SH": "sh", "T": "t",
+    "TH": "th", "V": "v", "W": "w", "Y": "y", "Z": "z", "ZH": "zh",
+}
+
+@lru_cache(maxsize=64)
+def _band_words(lexicon: PhonicsLexicon, min_zipf: float, max_syllables: int) -> Tuple[int, ...]:
+    """Indexes of every word a band may use"""
+    return tuple(index for syllables in range(1, max_syllables + 1)
+                 for index in lexicon.by_syllables(syllables, min_zipf))
+
+@lru_cache(maxsize=64)
+def _rime_families(lexicon: PhonicsLexicon, min_zipf: float, max_syllables: int) -> Tuple[Tuple[int, ...], ...]:
+    """Groups of at least two rhyming words a band may use"""
+    families = []
+    for rime in lexicon.keys(RIME):
+        members = tuple(index for index in lexicon.by_rime(rime, min_zipf)
+                        if lexicon.entry(index).syllables <= max_syllables)
+        if len(members) >= 2:
+            families.append(members)
+    return tuple(families)
+
+def _unstressed(phones: Sequence[str]) -> Tuple[str, ...]:
+    return tuple(phone.rstrip("012") for phone in phones)
+
+class PhonicsItemEngine:
+    """
+    Seedable generator of phonological-awareness MCQs from the pronunciation lexicon.
+
+    Syllable counts, first sounds, rhymes and sound substitutions are read off the
+    ARPAbet pronunciations, so every answer is checked against the lexicon rather than
+    spelling, and each distractor is verified not to satisfy the question as well.
+    """
+
+    def __init__(self, lexicon: PhonicsLexicon, seed: int):
+        """
+        Initialization of class arguments.
+
+        1. lexicon -> PhonicsLexicon -> Compiled pronunciation lexicon, see phonics_lexicon.get_phonics_lexicon().\n
+        2. seed -> int -> Seed of the private random generator; record it to reproduce a test.\n
+        """
+        self.lexicon = lexicon
+        self.seed = seed
+        self.random = random.Random(seed)
+        self._builders: Dict[str, Sequence[Callable[[Dict], Optional[McqItem]]]] = {
+            "L1": (self._syllable_count, self._first_sound),
+            "L2": (self._rhyme, self._substitution),
+            "L3": (self._build_word,),
+            "L4": (self._odd_one_out, self._same_syllables),
+        }
+
+    def generate(self, reading_level: str, bloom_level: str, count: int) -> List[McqItem]:
+        """Up to count distinct items; unknown reading levels use the widest band"""
+        band = dict(READING_LEVELS.get(reading_level, READING_LEVELS["5th-grade"]), name=reading_level)
+        items, questions = [], set()
+        for _ in range(count * 20):
+            if len(items) == count:
+                break
+            item = self.random.choice(self._builders[bloom_level])(band)
+            if item is not None and item.question not in questions:
+                questions.add(item.question)
+                items.append(item)
+        return items
+
+    def section_items(self, reading_level: str, counts: Dict[str, int]) -> Dict[str, List[McqItem]]:
+        """Items for every section, e.g. counts={"L1": 2, "L2": 2, "L3": 1, "L4": 1}"""
+        return {section: self.generate(reading_level, section, count) for section, count in counts.items() if count}
+
+    def _words(self, band: Dict) -> Tuple[int, ...]:
+        return _band_words(self.lexicon, band["min_zipf"], band["max_syllables"])
+
+    def _families(self, band: Dict) -> Tuple[Tuple[int, ...], ...]:
+        return _rime_families(self.lexicon, band["min_zipf"], band["max_syllables"])
+
+    def _pick(self, indexes: Sequence[int], accept: Callable[[LexiconEntry], bool] = lambda entry: True,
+              attempts: int = 30) -> Optional[LexiconEntry]:
+        """A random entry passing accept, by rejection sampling"""
+        if not indexes:
+            return None
+        for _ in range(attempts):
+            entry = self.lexicon.entry(indexes[self.random.randrange(len(indexes))])
+            if accept(entry):
+                return entry
+        return None
+
+    def _distractors(self, band: Dict, reject: Callable[[LexiconEntry], bool], taken: List[str],
+                     preferred: Sequence[int] = ()) -> Optional[List[str]]:
+        """Three words of the band for which reject is false, from preferred first and then the whole band"""
+        distractors = []
+        for pool in (preferred, self._words(band)):
+            while len(distractors) < 3:
+                # preferred pools such as rhyme families are not limited to the band's syllables
+                entry = self._pick(pool, lambda entry: entry.syllables <= band["max_syllables"]
+                                   and entry.word not in taken + distractors and not reject(entry))
+                if entry is None:
+                    break
+                distractors.append(entry.word)
+        return distractors if len(distractors) == 3 else None
+
+    def _item(self, question: str, answer: str, distractors: Optional[List[str]], bloom_level: str,
+              band: Dict) -> Optional[McqItem]:
+        if distractors is None:
+            return None
+        options = [answer] + distractors
+        self.random.shuffle(options)
+        return McqItem(question, tuple(options), options.index(answer), bloom_level, band["name"])
+
+    def _syllable_count(self, band: Dict) -> Optional[McqItem]:
+        syllables = self.random.randint(1, band["max_syllables"])
+        target = self._pick(self.lexicon.by_syllables(syllables, band["min_zipf"]))
+        if target is None:
+            return None
+        first = max(1, syllables - self.random.randint(0, 2))
+        options = [str(count) for count in range(first, first + 4)]
+        return McqItem(f'How many syllables are in the word "{target.word}"?', tuple(options),
+                       options.index(str(syllables)), "L1", band["name"])
+
+    def _first_sound(self, band: Dict) -> Optional[McqItem]:
+        target = self._pick(self._words(band), lambda entry: bool(entry.onset))
+        if target is None:
+            return None
+        first = target.phones[0]
+        # Not "basket" for "basketball": the shared spelling would give the answer away
+        unrelated = lambda entry: not entry.word.startswith(target.word) and not target.word.startswith(entry.word)
+        answer = self._pick(self.lexicon.by_onset(target.onset, band["min_zipf"]),
+                            lambda entry: unrelated(entry) and entry.syllables <= band["max_syllables"])
+        if answer is None:
+            return None
+        distractors = self._distractors(band, lambda entry: entry.phones[0] == first, [target.word, answer.word])
+        return self._item(f'Which word begins with the same sound as "{target.word}"?', answer.word, distractors,
+                          "L1", band)
+
+    def _rhyme(self, band: Dict) -> Optional[McqItem]:
+        family = self.random.choice(self._families(band)) if self._families(band) else ()
+        target = self._pick(family)
+        answer = self._pick(family, lambda entry: target is not None and entry.word != target.word)
+        if target is None or answer is None:
+            return None
+        # Same first sound, different ending: the likeliest wrong pick
+        distractors = self._distractors(band, lambda entry: entry.rime == target.rime, [target.word, answer.word],
+                                        preferred=self.lexicon.by_onset(target.onset, band["min_zipf"]))
+        return self._item(f'Which word rhymes with "{target.word}"?', answer.word, distractors, "L2", band)
+
+    def _onset_pair(self, band: Dict) -> Optional[Tuple[Tuple[int, ...], LexiconEntry, LexiconEntry]]:
+        """
+        Two rhyming words that each start with one consonant sound and differ only in it, and their family.
+
+        "remember" and "november" share a rime but not everything after the first sound, so
+        neither is the other with its first sound changed and the pair is not returned.
+        """
+        single = lambda entry: len(entry.onset.split()) == 1 and entry.onset in SOUND_SPELLINGS
+        families = self._families(band)
+        if not families:
+            return None
+        family = self.random.choice(families)
+        target = self._pick(family, single)
+        if target is None:
+            return None
+        answers = [entry for entry in map(self.lexicon.entry, family)
+                   if single(entry) and self._substitutes(entry, target, SOUND_SPELLINGS[entry.onset])]
+        if not answers:
+            return None
+        return family, target, self.random.choice(answers)
+
+    @staticmethod
+    def _substitutes(entry: LexiconEntry, target: LexiconEntry, sound: str) -> bool:
+        """Whether entry is target with its single first sound changed to the one written /sound/"""
+        return (SOUND_SPELLINGS.get(entry.phones[0]) == sound != SOUND_SPELLINGS[target.onset]
+                and _unstressed(entry.phones[1:]) == _unstressed(target.phones[1:]))
+
+    def _substitution(self, band: Dict) -> Optional[McqItem]:
+        pair = self._onset_pair(band)
+        if pair is None:
+            return None
+        family, target, answer = pair
+        sound = SOUND_SPELLINGS[answer.onset]
+        # Other words of the rhyme and other words with the new sound, but never a word that also answers
+        distractors = self._distractors(
+            band, lambda entry: self._substitutes(entry, target, sound) or entry.word == target.word,
+            [target.word, answer.word], preferred=family,
+        )
+        question = f'Change the first sound in "{target.word}" to /{sound}/. What new word do you make?'
+        return self._item(question, answer.word, distractors, "L2", band)
+
+    def _build_word(self, band: Dict) -> Optional[McqItem]:
+        pair = self._onset_pair(band)
+        if pair is None:
+            return None
+        family, target, answer = pair
+        sound = SOUND_SPELLINGS[answer.onset]
+        fits = lambda entry: SOUND_SPELLINGS.get(entry.phones[0]) == sound and entry.rime == target.rime
+        half_right = [index for index in family] + list(self.lexicon.by_onset(answer.onset, band["min_zipf"]))
+        distractors = self._distractors(band, lambda entry: fits(entry) or entry.word == target.word,
+                                        [target.word, answer.word], preferred=half_right)
+        question = f'Which word begins with the /{sound}/ sound and rhymes with "{target.word}"?'
+        return self._item(question, answer.word, distractors, "L3", band)
+
+    def _odd_one_out(self, band: Dict) -> Optional[McqItem]:
+        families = [family for family in self._families(band) if len(family) >= 3]
+        if not families:
+            return None
+        family = list(self.random.choice(families))
+        self.random.shuffle(family)
+        rhyming = [self.lexicon.entry(index) for index in family[:3]]
+        rime = rhyming[0].rime
+        odd = self._pick(self.lexicon.by_onset(rhyming[0].onset, band["min_zipf"]),
+                         lambda entry: entry.rime != rime and entry.syllables <= band["max_syllables"])
+        odd = odd or self._pick(self._words(band), lambda entry: entry.rime != rime)
+        if odd is None:
+            return None
+        return self._item("Which word does NOT rhyme with the others?", odd.word, [entry.word for entry in rhyming],
+                          "L4", band)
+
+    def _same_syllables(self, band: Dict) -> Optional[McqItem]:
+        syllables = self.random.randint(1, band["max_syllables"])
+        pool = self.lexicon.by_syllables(syllables, band["min_zipf"])
+        target = self._pick(pool)
+        answer = self._pick(pool, lambda entry: target is not None and entry.word != target.word)
+        if target is None or answer is None:
+            return None
+        distractors = self._distractors(band, lambda entry: entry.syllables == syllables, [target.word, answer.word])
+        question = f'Which word has the same number of syllables as "{target.word}"?'
+        return self._item(question, answer.word, distractors, "L4", band)
@@ -0,0 +1,315 @@
+"""
+Compact pronunciation lexicon for the phonological-awareness items.
+
+The bundled lexicon/phonics_lexicon.tsv, or a full CMUdict with a frequency list, is
+compiled once into a binary file that is memory-mapped at runtime. Words are stored
+sorted for binary-search lookup, and posting lists index them by syllable count,
+onset and rime, each sorted by descending frequency so a grade filter is a prefix.
+
+Usage:
+    python phonics_lexicon.py --output Models/phonics_lexicon.bin
+    python phonics_lexicon.py --cmudict cmudict.dict --frequencies zipf.txt --output Models/phonics_lexicon.bin
+"""
+import argparse
+import array
+import mmap
+import os
+import struct
+import sys
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# The shared package sits at the repository root, one level above this app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.logger import Logger
+
+logger = Logger(name="Phonics Lexicon", log_file_needed=True, log_file_path="Logs/phonics_lexicon.log", level="DEV")
+
+BUNDLED_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicon", "phonics_lexicon.tsv")
+
+MAGIC = b"PHLX"
+VERSION = 1
+FLAG_BUNDLED = 1
+# magic, version, flags, then (offset, count) of tokens, words, strings, phones, keys, postings
+HEADER = struct.Struct("<4sHH12I")
+TOKEN_SIZE = 4
+# word offset, phones offset, word length, phone count, syllables, zipf x 10
+WORD = struct.Struct("<IIBBBB")
+# kind, key length, key offset, first posting, posting count
+KEY = struct.Struct("<BBxxIII")
+
+SYLLABLES, ONSET, RIME = 0, 1, 2
+
+def is_vowel(phone: str) -> bool:
+    return phone[-1].isdigit()
+
+def onset_of(phones: Tuple[str, ...]) -> str:
+    """Consonants before the first vowel, e.g. "S T" for stop; empty for vowel-initial words"""
+    consonants = []
+    for phone in phones:
+        if is_vowel(phone):
+            break
+        consonants.append(phone)
+    return " ".join(consonants)
+
+def rime_of(phones: Tuple[str, ...]) -> str:
+    """Phones from the last primary-stressed vowel on, without stress: words that share it rhyme"""
+    vowels = [index for index, phone in enumerate(phones) if is_vowel(phone)]
+    if not vowels:
+        return ""
+    stressed = [index for index in vowels if phones[index].endswith("1")]
+    start = stressed[-1] if stressed else vowels[-1]
+    return " ".join(phone.rstrip("012") for phone in phones[start:])
+
+class LexiconEntry(NamedTuple):
+    index: int
+    word: str
+    phones: Tuple[str, ...]
+    syllables: int
+    zipf: float
+
+    @property
+    def onset(self) -> str:
+        return onset_of(self.phones)
+
+    @property
+    def rime(self) -> str:
+        return rime_of(self.phones)
+
+def read_bundled(path: str = BUNDLED_SOURCE) -> Iterator[Tuple[str, float, List[str]]]:
+    """(word, zipf, phones) from the tab-separated bundled source"""
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            if not line.strip() or line.startswith("#"):
+                continue
+            word, zipf, phones = line.rstrip("\n").split("\t")
+            yield word, float(zipf), phones.split()
+
+def read_cmudict(path: str, frequencies_path: str) -> Iterator[Tuple[str, float, List[str]]]:
+    """
+    (word, zipf, phones) from a CMUdict file and a "word zipf" frequency list.
+
+    Words without a frequency, and words CMUdict lists with more than one pronunciation,
+    are skipped so that no item depends on which pronunciation a student uses.
+    """
+    frequencies = {}
+    with open(frequencies_path, encoding="utf-8") as frequency_file:
+        for line in frequency_file:
+            parts = line.split()
+            if len(parts) >= 2:
+                frequencies[parts[0].lower()] = float(parts[1])
+
+    pronunciations: Dict[str, List[str]] = {}
+    variants = set()
+    with open(path, encoding="latin-1") as cmudict:
+        for line in cmudict:
+            if not line.strip() or line.startswith(";;;"):
+                continue
+            word, *phones = line.split("#")[0].split()
+            word = word.lower()
+            if word.endswith(")"):
+                variants.add(word.split("(")[0])
+                continue
+            if word.isalpha() and word in frequencies:
+                pronunciations[word] = phones
+    for word, phones in pronunciations.items():
+        if word not in variants:
+            yield word, frequencies[word], phones
+
+def build_lexicon(entries: Iterable[Tuple[str, float, List[str]]], output_path: str, bundled: bool = False) -> int:
+    """Compile (word, zipf, phones) entries into the binary lexicon; returns the number of words"""
+    words: Dict[str, Tuple[float, Tuple[str, ...]]] = {}
+    for word, zipf, phones in entries:
+        words.setdefault(word, (zipf, tuple(phones)))
+    ordered = sorted(words)
+
+    tokens = sorted({phone for _, phones in words.values() for phone in phones})
+    token_ids = {token: index for index, token in enumerate(tokens)}
+    strings, phone_bytes, word_records = bytearray(), bytearray(), bytearray()
+    postings: Dict[Tuple[int, str], List[int]] = {}
+    for index, word in enumerate(ordered):
+        zipf, phones = words[word]
+        encoded = word.encode("utf-8")
+        syllables = sum(1 for phone in phones if is_vowel(phone))
+        word_records += WORD.pack(len(strings), len(phone_bytes), len(encoded), len(phones), syllables,
+                                  max(0, min(255, round(zipf * 10))))
+        strings += encoded
+        phone_bytes += bytes(token_ids[phone] for phone in phones)
+        postings.setdefault((SYLLABLES, str(syllables)), []).append(index)
+        postings.setdefault((ONSET, onset_of(phones)), []).append(index)
+        postings.setdefault((RIME, rime_of(phones)), []).append(index)
+
+    key_records, posting_values = bytearray(), array.array("I")
+    for (kind, key), indexes in sorted(postings.items()):
+        indexes.sort(key=lambda index: (-words[ordered[index]][0], ordered[index]))
+        encoded = key.encode("ascii")
+        key_records += KEY.pack(kind, len(encoded), len(strings), len(posting_values), len(indexes))
+        strings += encoded
+        posting_values.extend(indexes)
+    if sys.byteorder != "little":
+        posting_values.byteswap()
+
+    token_bytes = b"".join(token.encode("ascii").ljust(TOKEN_SIZE, b"\0") for token in tokens)
+    sections = [(token_bytes, len(tokens)), (word_records, len(ordered)), (strings, len(strings)),
+                (phone_bytes, len(phone_bytes)), (key_records, len(postings)),
+                (posting_values.tobytes(), len(posting_values))]
+    table, offset = [], HEADER.size
+    for data, count in sections:
+        table.extend((offset, count))
+        offset += len(data)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    temporary_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as output:
+        output.write(HEADER.pack(MAGIC, VERSION, FLAG_BUNDLED if bundled else 0, *table))
+        for data, _ in sections:
+            output.write(data)
+    os.replace(temporary_path, output_path)
+    logger.info(f"Compiled {len(ordered)} words and {len(postings)} index keys into {output_path} ({offset} bytes)")
+    return len(ordered)
+
+class PhonicsLexicon:
+    """Read-only, memory-mapped view of a compiled lexicon; safe to share between threads"""
+
+    def __init__(self, path: str):
+        """
+        Initialization of class arguments.
+
+        1. path -> str -> Compiled lexicon written by build_lexicon().\n
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.flags, *table = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} phonics lexicon")
+        (tokens_at, token_count, self._words_at, self.size, self._strings_at, _,
+         self._phones_at, _, keys_at, key_count, postings_at, posting_count) = table
+
+        self._tokens = [
+            self._data[tokens_at + index * TOKEN_SIZE:tokens_at + (index + 1) * TOKEN_SIZE].rstrip(b"\0").decode("ascii")
+            for index in range(token_count)
+        ]
+        if sys.byteorder == "little":
+            self._postings = memoryview(self._data)[postings_at:postings_at + posting_count * 4].cast("I")
+        else:
+            swapped = array.array("I", self._data[postings_at:postings_at + posting_count * 4])
+            swapped.byteswap()
+            self._postings = memoryview(swapped)
+        self._keys: Dict[Tuple[int, str], Tuple[int, int]] = {}
+        for index in range(key_count):
+            kind, length, key_at, start, count = KEY.unpack_from(self._data, keys_at + index * KEY.size)
+            key = self._data[self._strings_at + key_at:self._strings_at + key_at + length].decode("ascii")
+            self._keys[(kind, key)] = (start, count)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _word_at(self, index: int) -> bytes:
+        word_at, _, length, _, _, _ = WORD.unpack_from(self._data, self._words_at + index * WORD.size)
+        return self._data[self._strings_at + word_at:self._strings_at + word_at + length]
+
+    def _zipf_at(self, index: int) -> float:
+        return self._data[self._words_at + index * WORD.size + WORD.size - 1] / 10
+
+    @lru_cache(maxsize=8192)
+    def entry(self, index: int) -> LexiconEntry:
+        word_at, phones_at, length, phone_count, syllables, zipf = WORD.unpack_from(
+            self._data, self._words_at + index * WORD.size
+        )
+        word = self._data[self._strings_at + word_at:self._strings_at + word_at + length].decode("utf-8")
+        phone_ids = self._data[self._phones_at + phones_at:self._phones_at + phones_at + phone_count]
+        return LexiconEntry(index, word, tuple(self._tokens[phone] for phone in phone_ids), syllables, zipf / 10)
+
+    def lookup(self, word: str) -> Optional[LexiconEntry]:
+        """Binary search of the sorted word table"""
+        target = word.lower().encode("utf-8")
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._word_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size and self._word_at(low) == target:
+            return self.entry(low)
+        return None
+
+    def keys(self, kind: int) -> List[str]:
+        return sorted(key for key_kind, key in self._keys if key_kind == kind)
+
+    @lru_cache(maxsize=4096)
+    def postings(self, kind: int, key: str, min_zipf: float = 0.0) -> memoryview:
+        """Word indexes under a key with frequency at least min_zipf, most frequent first"""
+        start, count = self._keys.get((kind, key), (0, 0))
+        # Sorted by descending frequency, so the eligible words are a prefix
+        low, high = start, start + count
+        while low < high:
+            middle = (low + high) // 2
+            if self._zipf_at(self._postings[middle]) >= min_zipf:
+                low = middle + 1
+            else:
+                high = middle
+        return self._postings[start:low]
+
+    def by_syllables(self, syllables: int, min_zipf: float = 0.0) -> memoryview:
+        return self.postings(SYLLABLES, str(syllables), min_zipf)
+
+    def by_onset(self, onset: str, min_zipf: float = 0.0) -> memoryview:
+        return self.postings(ONSET, onset, min_zipf)
+
+    def by_rime(self, rime: str, min_zipf: float = 0.0) -> memoryview:
+        return self.postings(RIME, rime, min_zipf)
+
+def ensure_compiled(compiled_path: str, source_path: str = BUNDLED_SOURCE):
+    """Compile the bundled source when the binary is missing, or stale and built from it"""
+    if os.path.exists(compiled_path):
+        with open(compiled_path, "rb") as compiled:
+            header = compiled.read(HEADER.size)
+        from_bundled = len(header) == HEADER.size and HEADER.unpack(header)[2] & FLAG_BUNDLED
+        if not from_bundled or os.path.getmtime(compiled_path) >= os.path.getmtime(source_path):
+            return
+    build_lexicon(read_bundled(source_path), compiled_path, bundled=True)
+
+_phonics_lexicon: Optional[PhonicsLexicon] = None
+_phonics_lexicon_lock = threading.Lock()
+
+def get_phonics_lexicon() -> PhonicsLexicon:
+    """
+    Process-wide lexicon from TEST_PHONICS_LEXICON (default Models/phonics_lexicon.bin).
+
+    The file is compiled from the bundled source on first use; a lexicon built from a
+    full CMUdict with this module's command line is used as is.
+    """
+    global _phonics_lexicon
+    with _phonics_lexicon_lock:
+        if _phonics_lexicon is None:
+            path = os.environ.get("TEST_PHONICS_LEXICON", "Models/phonics_lexicon.bin")
+            ensure_compiled(path)
+            _phonics_lexicon = PhonicsLexicon(path)
+            logger.info(f"Phonics lexicon {path}: {len(_phonics_lexicon)} words")
+    return _phonics_lexicon
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the phonics lexicon used by the phonological items")
+    parser.add_argument("--output", default=os.environ.get("TEST_PHONICS_LEXICON", "Models/phonics_lexicon.bin"))
+    parser.add_argument("--cmudict", help="CMUdict file to compile instead of the bundled lexicon")
+    parser.add_argument("--frequencies", help="'word zipf' lines; required with --cmudict")
+    args = parser.parse_args()
+
+    if args.cmudict:
+        if not args.frequencies:
+            parser.error("--cmudict needs --frequencies to pick grade-appropriate words")
+        count = build_lexicon(read_cmudict(args.cmudict, args.frequencies), args.output)
+    else:
+        count = build_lexicon(read_bundled(), args.output, bundled=True)
+
+    lexicon = PhonicsLexicon(args.output)
+    syllables = {key: len(lexicon.postings(SYLLABLES, key)) for key in lexicon.keys(SYLLABLES)}
+    print(f"{count} words in {os.path.getsize(args.output)} bytes; by syllables: {syllables}; "
+          f"{len(lexicon.keys(ONSET))} onsets, {len(lexicon.keys(RIME))} rimes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+OPTION_LABELS = ("a", "b", "c", "d")
+
+# Headings only, not rule lines that mention a section such as '- Label each section clearly: "Section L1..."'
+SECTION_LINE = re.compile(r'^\W*Section (L\d)\b')
+READING_MARKER = "Reading Comprehension Section"
+QUESTION_LINE = re.compile(r'^\s*\d+\.\s+\S')
+QUESTION_COUNT = re.compile(r'Create exactly (\d+) MCQ questions')
+NUMBERING = re.compile(r'Number questions 1-(\d+)')
+
+# Prompt rules that only concern one topic's items, dropped along with them
+TOPIC_RULES = {
+    "mathematics": "Mathematical problems should use",
+}
+
+@dataclass(frozen=True)
+class McqItem:
+    """One multiple-choice question whose answer was computed, not generated"""
+    question: str
+    options: Tuple[str, ...]
+    answer_index: int
+    bloom_level: str
+    # The difficulty band it was built for: a math_complexity or a reading_level
+    level: str
+
+    def __post_init__(self):
+        if len(self.options) != len(OPTION_LABELS) or len(set(self.options)) != len(self.options):
+            raise ValueError(f"Item needs {len(OPTION_LABELS)} distinct options: {self.options}")
+        if not 0 <= self.answer_index < len(self.options):
+            raise ValueError(f"Answer index {self.answer_index} out of range")
+
+    @property
+    def answer(self) -> str:
+        return OPTION_LABELS[self.answer_index]
+
+    def render(self, number: int) -> str:
+        """The item in the "1. question / a) option" layout the test page parses"""
+        lines = [f"{number}. {self.question}"]
+        lines.extend(f"{label}) {option}" for label, option in zip(OPTION_LABELS, self.options))
+        return "\n".join(lines)
+
+def _topic_bullet(topic: str) -> re.Pattern:
+    return re.compile(rf'^\s*-\s*(\d+)\s+{topic}\b', re.IGNORECASE)
+
+def split_instructions(prompt: str, topics: Iterable[str]) -> Tuple[str, Dict[str, Dict[str, int]]]:
+    """
+    Remove the items of some topics from a test or section prompt.
+
+    Returns the prompt without the "- N <topic> ..." bullets, with each section's
+    "Create exactly N MCQ questions" reduced to match, and the number of items dropped
+    per topic and section. Numbering rules shared by sections of different lengths
+    become "Number questions from 1".
+    """
+    bullets = {topic: _topic_bullet(topic) for topic in topics}
+    lines = prompt.splitlines()
+    dropped: Dict[str, Dict[str, int]] = {}
+    section = None
+    for line in lines:
+        match = SECTION_LINE.search(line)
+        if match:
+            section = match.group(1)
+        elif READING_MARKER in line:
+            section = None
+        for topic, bullet in bullets.items():
+            count = bullet.match(line)
+            if count and section:
+                topic_counts = dropped.setdefault(topic, {})
+                topic_counts[section] = topic_counts.get(section, 0) + int(count.group(1))
+
+    per_section: Dict[str, int] = {}
+    for topic_counts in dropped.values():
+        for section, count in topic_counts.items():
+            per_section[section] = per_section.get(section, 0) + count
+    rules = tuple(TOPIC_RULES[topic] for topic in bullets if topic in TOPIC_RULES)
+
+    kept, section = [], None
+    for line in lines:
+        match = SECTION_LINE.search(line)
+        if match:
+            section = match.group(1)
+        elif READING_MARKER in line:
+            section = None
+        if any(bullet.match(line) for bullet in bullets.values()) or (rules and line.lstrip("- ").startswith(rules)):
+            continue
+        if section in per_section:
+            line = QUESTION_COUNT.sub(
+                lambda count: f"Create exactly {int(count.group(1)) - per_section[section]} MCQ questions", line
+            )
+            line = NUMBERING.sub(lambda count: f"Number questions 1-{int(count.group(1)) - per_section[section]}", line)
+        elif per_section:
+            line = NUMBERING.sub("Number questions from 1", line)
+        kept.append(line)
+    return "\n".join(kept), dropped
+
+def merge_items(raw_output: str, items: Dict[str, List[McqItem]], headings: Dict[str, str]) -> str:
+    """
+    Append procedural items to their sections of a generated test, numbered after
+    the generated questions. A section the model left out is added in its place, with
+    the heading from headings.
+    """
+    blocks: List[List] = [[None, []]]
+    for line in raw_output.splitlines():
+        match = SECTION_LINE.search(line)
+        if match:
+            blocks.append([match.group(1), []])
+        elif READING_MARKER in line:
+            blocks.append(["reading", []])
+        blocks[-1][1].append(line)
+
+    present = {section for section, _ in blocks}
+    for section in sorted(set(items) - present):
+        # Before the first later block; "L1" < "L2" < ... < "reading"
+        index = next((index for index, (other, _) in enumerate(blocks) if other is not None and other > section),
+                     len(blocks))
+        blocks.insert(index, [section, [headings[section]]])
+
+    # Duplicated headings: the items go after the last copy of a section
+    last_block = {section: index for index, (section, _) in enumerate(blocks)}
+    for section, section_items in items.items():
+        lines = blocks[last_block[section]][1]
+        while lines and not lines[-1].strip():
+            lines.pop()
+        number = sum(1 for line in lines if QUESTION_LINE.match(line))
+        for item in section_items:
+            number += 1
+            lines.extend(["", item.render(number)])
+        lines.append("")
+    return "\n".join(line for _, lines in blocks for line in lines)
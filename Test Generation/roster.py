@@ -0,0 +1,298 @@
+import contextvars
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from shared.logger import Logger
+from shared.tracing import get_tracer
+
+logger = Logger(name="Roster", log_file_needed=True, log_file_path="Logs/roster.log", level="DEV")
+tracer = get_tracer("test_generation")
+
+CLASS_OPTIONS = [
+    "1st Grade", "2nd Grade", "3rd Grade", "4th Grade", "5th Grade", "6th Grade",
+    "7th Grade", "8th Grade", "9th Grade", "10th Grade", "11th Grade", "12th Grade"
+]
+
+# Roster column names accepted for each student field
+COLUMN_ALIASES = {
+    "first_name": ("first_name", "first", "firstname", "given_name"),
+    "last_name": ("last_name", "last", "lastname", "surname", "family_name"),
+    "class_level": ("class_level", "grade", "grade_level", "class"),
+    "age": ("age",),
+    "name": ("name", "full_name", "student", "student_name"),
+}
+
+# No 0/O or 1/I, so a code read aloud or copied by hand still works
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 8
+
+def normalize_class_level(value) -> Optional[str]:
+    """"3", "3rd", "Grade 3" or "3rd grade" -> "3rd Grade"; None when no grade 1-12 is found"""
+    text = str(value or "").strip()
+    for option in CLASS_OPTIONS:
+        if text.lower() == option.lower():
+            return option
+    match = re.search(r'\d{1,2}', text)
+    if match and 1 <= int(match.group()) <= len(CLASS_OPTIONS):
+        return CLASS_OPTIONS[int(match.group()) - 1]
+    return None
+
+def _field(row: Dict[str, str], name: str) -> str:
+    for alias in COLUMN_ALIASES[name]:
+        value = row.get(alias)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+def _rows(content: str, filename: str) -> List[Dict[str, str]]:
+    """Rows with lower-case, underscore-separated keys from CSV or JSON content"""
+    if filename.lower().endswith(".json") or content.lstrip().startswith(("[", "{")):
+        data = json.loads(content)
+        rows = data.get("students", []) if isinstance(data, dict) else data
+    else:
+        rows = list(csv.DictReader(io.StringIO(content)))
+    return [
+        {str(key).strip().lower().replace(" ", "_"): value for key, value in row.items() if key is not None}
+        for row in rows if isinstance(row, dict)
+    ]
+
+def parse_roster(content, filename: str = "roster.csv") -> Tuple[List[Dict], List[str]]:
+    """
+    Students from a CSV or JSON roster, and a message for every row that was skipped.
+
+    Columns: first_name, last_name (or a single name), class_level (or grade) and an
+    optional age. Repeated students, same name and grade, are kept once.
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    students, errors, seen = [], [], {}
+    registration_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for number, row in enumerate(_rows(content, filename), start=1):
+        first_name, last_name = _field(row, "first_name"), _field(row, "last_name")
+        if not (first_name and last_name) and _field(row, "name"):
+            first_name, _, last_name = _field(row, "name").rpartition(" ")
+            first_name, last_name = (first_name, last_name) if first_name else (last_name, "")
+        class_level = normalize_class_level(_field(row, "class_level"))
+        if not (first_name and last_name and class_level):
+            errors.append(f"Row {number}: needs a first name, last name and a grade from 1 to 12")
+            continue
+
+        key = (first_name.lower(), last_name.lower(), class_level)
+        if key in seen:
+            errors.append(f"Row {number}: {first_name} {last_name} ({class_level}) repeats row {seen[key]}")
+            continue
+        seen[key] = number
+
+        age = _field(row, "age")
+        students.append({
+            "first_name": first_name,
+            "last_name": last_name,
+            "class_level": class_level,
+            "age": int(age) if age.isdigit() else None,
+            "registration_date": registration_date,
+        })
+    return students, errors
+
+def plan_roster(students: List[Dict], variants: int,
+                get_class_parameters: Callable[[str], Dict]) -> Tuple[List[Dict], List[str]]:
+    """
+    One generation job per grade band and variant, and the job each student is given.
+
+    Grades whose reading level and math complexity match share a band and its tests;
+    the band's tests are written for its lowest grade on the roster. Students of a band
+    are dealt the variants in roster order, so neighbours on the list get different tests.
+    """
+    bands: Dict[Tuple[str, str], Dict] = {}
+    for student in students:
+        params = get_class_parameters(student["class_level"])
+        band = bands.setdefault((params["reading_level"], params["math_complexity"]),
+                                {"params": params, "grades": set(), "students": []})
+        band["grades"].add(student["class_level"])
+        band["students"].append(student)
+
+    jobs, assignments = [], {}
+    for (reading_level, math_complexity), band in bands.items():
+        grades = sorted(band["grades"], key=CLASS_OPTIONS.index)
+        band_variants = max(1, min(variants, len(band["students"])))
+        for variant in range(band_variants):
+            jobs.append({
+                "test_id": f"{reading_level}-{math_complexity}-v{variant + 1}",
+                "class_level": grades[0],
+                "grades": grades,
+                "params": band["params"],
+                "variant": variant + 1,
+            })
+        for position, student in enumerate(band["students"]):
+            assignments[id(student)] = f"{reading_level}-{math_complexity}-v{position % band_variants + 1}"
+    return jobs, [assignments[id(student)] for student in students]
+
+class RosterStore:
+    """
+    Pre-generated tests and access codes as JSON files, so a code opens its test from any session.
+
+    Layout under root: <roster_id>/roster.json, <roster_id>/tests/<test_id>.json and
+    codes/<CODE>.json pointing at a student and test.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        """
+        Initialization of class arguments.
+
+        1. root -> str | None -> Directory of the store, defaults to TEST_ROSTER_DIR or Rosters.\n
+        """
+        self.root = root or os.environ.get("TEST_ROSTER_DIR", "Rosters")
+
+    @staticmethod
+    def _write_json(path: str, record: Dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as output:
+            json.dump(record, output, indent=2, ensure_ascii=False)
+        # Rename last so readers never see a partly written file
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict]:
+        try:
+            with open(path, encoding="utf-8") as source:
+                return json.load(source)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def normalize_code(code: str) -> str:
+        return re.sub(r'[^A-Z0-9]', "", str(code).upper())
+
+    def _code_path(self, code: str) -> str:
+        return os.path.join(self.root, "codes", f"{self.normalize_code(code)}.json")
+
+    def new_code(self) -> str:
+        """An unused access code, formatted ABCD-EFGH"""
+        while True:
+            code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+            if not os.path.exists(self._code_path(code)):
+                return f"{code[:4]}-{code[4:]}"
+
+    def save_test(self, roster_id: str, test_id: str, record: Dict):
+        self._write_json(os.path.join(self.root, roster_id, "tests", f"{test_id}.json"), record)
+
+    def save_roster(self, roster_id: str, record: Dict):
+        self._write_json(os.path.join(self.root, roster_id, "roster.json"), record)
+
+    def save_code(self, code: str, roster_id: str, test_id: str, student: Dict):
+        self._write_json(self._code_path(code), {"roster_id": roster_id, "test_id": test_id, "student": student})
+
+    def open_code(self, code: str) -> Optional[Tuple[Dict, Dict]]:
+        """The student and pre-generated test behind an access code, or None"""
+        assignment = self._read_json(self._code_path(code))
+        if assignment is None:
+            return None
+        test = self._read_json(os.path.join(self.root, assignment["roster_id"], "tests", f"{assignment['test_id']}.json"))
+        if test is None:
+            return None
+        return assignment["student"], test
+
+def _item_seed(roster_id: str, test_id: str) -> int:
+    """Seed of a variant's procedural items, recorded so the test can be rebuilt"""
+    return int.from_bytes(hashlib.sha256(f"{roster_id}|{test_id}".encode("utf-8")).digest()[:4], "big")
+
+def _generate_job(generator, roster_id: str, job: Dict) -> str:
+    with tracer.request(name="roster.test"):
+        return generator.generate_test(job["class_level"], student_key=f"roster:{roster_id}:{job['test_id']}",
+                                       item_seed=job["seed"])
+
+def _concurrent_jobs(generator) -> int:
+    """
+    How many roster jobs may run at once.
+
+    Only the adapter server batches concurrent generate_test calls; otherwise they would
+    share one HF pipeline, so the jobs run one at a time.
+    """
+    if getattr(generator, "adapter_server", None) is None:
+        return 1
+    return max(1, int(os.environ.get("TEST_ROSTER_WORKERS", "4")))
+
+def generate_roster_tests(generator, students: List[Dict], variants: int = 2, store: Optional[RosterStore] = None,
+                          progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+    """
+    Generate every test a roster needs and give each student an access code.
+
+    With adapter serving the jobs are submitted together and decoded as shared
+    batches; otherwise they run one after another. A 30-student class in one grade
+    band costs `variants` generations. Returns the roster record that is also saved
+    to the store.
+    """
+    store = store or RosterStore()
+    roster_id = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(3)}"
+    jobs, assigned = plan_roster(students, variants, generator.get_class_parameters)
+    for job in jobs:
+        job["seed"] = _item_seed(roster_id, job["test_id"])
+    max_workers = min(_concurrent_jobs(generator), len(jobs) or 1)
+    logger.info(f"Roster {roster_id}: {len(students)} students, {len(jobs)} generations")
+
+    tests, errors = {}, []
+    with tracer.span("roster.generate", students=len(students), generations=len(jobs)):
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="roster") as pool:
+            # Each job runs in a copy of this context so its spans join the current trace
+            futures = {
+                pool.submit(contextvars.copy_context().run, _generate_job, generator, roster_id, job): job
+                for job in jobs
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                try:
+                    content = future.result()
+                    if not content:
+                        raise ValueError("empty test")
+                    store.save_test(roster_id, job["test_id"], {**job, "content": content})
+                    tests[job["test_id"]] = job
+                except Exception as e:
+                    logger.error(f"Roster {roster_id} test {job['test_id']} failed: {str(e)}")
+                    errors.append(f"Test {job['test_id']} for {', '.join(job['grades'])} failed: {str(e)}")
+                if progress is not None:
+                    progress(done, len(jobs))
+
+    base_url = os.environ.get("TEST_APP_URL", "http://localhost:8501").rstrip("/")
+    assignments = []
+    for student, test_id in zip(students, assigned):
+        code = None
+        if test_id in tests:
+            code = store.new_code()
+            store.save_code(code, roster_id, test_id, student)
+        assignments.append({
+            **student,
+            "test_id": test_id,
+            "access_code": code,
+            "link": f"{base_url}/?code={code}" if code else None,
+        })
+
+    record = {
+        "roster_id": roster_id,
+        "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "generations": len(jobs),
+        "tests": tests,
+        "students": assignments,
+        "errors": errors,
+    }
+    store.save_roster(roster_id, record)
+    logger.info(f"Roster {roster_id}: {len(tests)}/{len(jobs)} tests generated, "
+                f"{sum(1 for student in assignments if student['access_code'])} codes issued")
+    return record
+
+def access_codes_csv(record: Dict) -> str:
+    """Name, grade, code and link of every student, for the teacher to hand out"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["first_name", "last_name", "class_level", "access_code", "link"])
+    for student in record["students"]:
+        writer.writerow([student["first_name"], student["last_name"], student["class_level"],
+                         student["access_code"] or "", student["link"] or ""])
+    return output.getvalue()
@@ -0,0 +1,260 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from procedural_items import split_instructions
+from shared.logger import Logger
+from shared.tracing import get_tracer
+
+logger = Logger(name="Section Routing", log_file_needed=True, log_file_path="Logs/section_routing.log", level="DEV")
+tracer = get_tracer("test_generation")
+
+# Model tiers a section can be routed to; "large" is the model TestGenerator always used
+DEFAULT_MODEL_TIERS = {
+    "small": {
+        "base_model": "meta-llama/Llama-3.2-1B-Instruct",
+        "lora_path": "llama3.2-1B-past-lora",
+        "merged_model_dir": "Models/llama3.2-1B-past-merged",
+    },
+    "large": {
+        "base_model": "meta-llama/Llama-3.2-3B-Instruct",
+        "lora_path": "llama3.2-past-lora",
+        "merged_model_dir": "Models/llama3.2-past-merged",
+    },
+}
+# Sections that fail the format check on a smaller tier are regenerated here
+ESCALATION_TIER = "large"
+
+# Keyed on the reading_level band from TestGenerator.get_class_parameters, "*" for every other band.
+# The small model takes the sections it writes well for a band: up to applying with
+# single-digit numbers, recall and comprehension through grade 6, recall alone for grades
+# 7-8. Analysis, the reading passage and every high-school section keep the large one.
+DEFAULT_ROUTING = {
+    "1st-grade": {"L1": "small", "L2": "small", "L3": "small", "L4": "large", "reading": "large"},
+    "2nd-grade": {"L1": "small", "L2": "small", "L3": "large", "L4": "large", "reading": "large"},
+    "3rd-grade": {"L1": "small", "L2": "small", "L3": "large", "L4": "large", "reading": "large"},
+    "4th-grade": {"L1": "small", "L2": "large", "L3": "large", "L4": "large", "reading": "large"},
+    "5th-grade": {"L1": "large", "L2": "large", "L3": "large", "L4": "large", "reading": "large"},
+    "*": {"L1": "large", "L2": "large", "L3": "large", "L4": "large", "reading": "large"},
+}
+
+# heading, instructions, questions expected, new-token budget
+SECTIONS = {
+    "L1": (
+        "Section L1: Remembering (Knowledge Recall)",
+        "- 2 phonological awareness questions (syllable counting, sound identification)\n"
+        "- 2 mathematics questions ({math_complexity} number operations)\n"
+        "- 1 vocabulary recall question",
+        5, 500,
+    ),
+    "L2": (
+        "Section L2: Understanding (Comprehension)",
+        "- 2 phonological awareness questions (sound manipulation, rhyming patterns)\n"
+        "- 2 mathematics word problems requiring interpretation\n"
+        "- 1 vocabulary comprehension question",
+        5, 600,
+    ),
+    "L3": (
+        "Section L3: Applying (Application)",
+        "- 1 phonological awareness application (creating words with specific sounds)\n"
+        "- 3 mathematics application problems (real-world scenarios)\n"
+        "- 1 vocabulary application question",
+        5, 700,
+    ),
+    "L4": (
+        "Section L4: Analyzing (Analysis)",
+        "- 1 phonological awareness analysis (comparing sound patterns)\n"
+        "- 3 mathematics analysis problems (problem-solving strategies)\n"
+        "- 1 vocabulary analysis question",
+        5, 700,
+    ),
+    "reading": (
+        "Reading Comprehension Section:",
+        "First write the line \"Reading Passage:\" followed by ONE passage of approximately 100 words "
+        "appropriate for {reading_level} readers.\n"
+        "Then write the line \"Passage-Based MCQ Questions:\" followed by exactly 5 questions testing:\n"
+        "- Main idea identification\n"
+        "- Detail recall\n"
+        "- Inference making\n"
+        "- Vocabulary in context\n"
+        "- Author's purpose/tone",
+        5, 900,
+    ),
+}
+
+SECTION_PROMPT = """
+You are an expert educational assessment creator. Write ONE section of a screening test for {class_level} students based on Bloom's Taxonomy levels.
+
+**{heading}**
+Create exactly {expected} MCQ questions:
+{instructions}
+
+Format each question EXACTLY like this example:
+1. How many syllables are in the word "elephant"?
+a) 2
+b) 3
+c) 4
+d) 5
+
+**STRICT FORMATTING RULES:**
+- Write only this section, without its heading and without any other section
+- Number questions 1-{expected}
+- Every question must have exactly 4 options: a), b), c), d), each on a new line
+- Use age-appropriate language for {class_level}
+- Mathematical problems should use {math_complexity} numbers
+
+"""
+
+QUESTION_LINE = re.compile(r'^\s*\d+\.\s+\S')
+OPTION_LINE = re.compile(r'^\s*([a-d])\)\s*\S')
+
+def count_valid_mcqs(text: str) -> int:
+    """Questions followed by exactly the options a) to d), the format the test page renders"""
+    valid, options = 0, None
+    for line in text.splitlines() + ["0. end"]:
+        if QUESTION_LINE.match(line):
+            if options == ["a", "b", "c", "d"]:
+                valid += 1
+            options = []
+            continue
+        option = OPTION_LINE.match(line)
+        if option and options is not None:
+            options.append(option.group(1))
+    return valid
+
+def _json_env(variable: str, default: Dict) -> Dict:
+    value = os.environ.get(variable)
+    return json.loads(value) if value else default
+
+def routing_table_from_env() -> Dict[str, Dict[str, str]]:
+    """TEST_ROUTING_TABLE overrides DEFAULT_ROUTING with the same JSON shape"""
+    return _json_env("TEST_ROUTING_TABLE", DEFAULT_ROUTING)
+
+def model_tiers_from_env() -> Dict[str, Dict[str, str]]:
+    """TEST_MODEL_TIERS overrides DEFAULT_MODEL_TIERS with the same JSON shape"""
+    return _json_env("TEST_MODEL_TIERS", DEFAULT_MODEL_TIERS)
+
+class RouteStats:
+    """Thread-safe latency, token and format-quality totals per (band, section, tier) route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(lambda: defaultdict(float))
+
+    def record(self, band: str, section: str, tier: str, seconds: float, tokens_out: int, valid: int,
+               expected: int, escalated: bool = False):
+        with self._lock:
+            route = self._routes[(band, section, tier)]
+            route['calls'] += 1
+            route['seconds'] += seconds
+            route['tokens_out'] += tokens_out
+            route['valid_questions'] += valid
+            route['expected_questions'] += expected
+            route['escalations'] += int(escalated)
+
+    def summary(self) -> Dict[str, Dict]:
+        """Per route: calls, mean latency, tokens, share of well-formed questions and escalations"""
+        with self._lock:
+            routes = {key: dict(values) for key, values in self._routes.items()}
+        return {
+            f"{band}/{section}/{tier}": {
+                'calls': int(route['calls']),
+                'mean_seconds': round(route['seconds'] / route['calls'], 2),
+                'tokens_out': int(route['tokens_out']),
+                'format_quality': round(route['valid_questions'] / route['expected_questions'], 3)
+                if route['expected_questions'] else None,
+                'escalations': int(route['escalations']),
+            }
+            for (band, section, tier), route in sorted(routes.items())
+        }
+
+    def snapshot(self) -> Dict[str, float]:
+        """Totals per tier as tracer counters (see Tracer.register_counter_source)"""
+        counters = defaultdict(float)
+        with self._lock:
+            for (_, _, tier), route in self._routes.items():
+                for name in ('calls', 'seconds', 'tokens_out', 'valid_questions', 'expected_questions', 'escalations'):
+                    counters[f"route_{tier}_{name}"] += route[name]
+        return dict(counters)
+
+route_stats = RouteStats()
+tracer.register_counter_source(route_stats.snapshot)
+
+class SectionRouter:
+    """
+    Generates a test section by section, each on the model tier the routing table picks.
+
+    The sections are joined in the order and format of the single-prompt test, so the
+    existing parser renders them unchanged. A section from a smaller tier that does not
+    come back as well-formed MCQs is regenerated on ESCALATION_TIER.
+    """
+
+    def __init__(self, get_generator: Callable[[str], object], routing: Optional[Dict[str, Dict[str, str]]] = None,
+                 escalate: bool = True, procedural_topics: Sequence[str] = ()):
+        """
+        Initialization of class arguments.
+
+        1. get_generator -> Callable[[str], TestGenerator] -> Returns the loaded generator of a tier.\n
+        2. routing -> Dict | None -> Band -> section -> tier table, defaults to routing_table_from_env().\n
+        3. escalate -> bool -> Regenerate malformed small-tier sections on ESCALATION_TIER.\n
+        4. procedural_topics -> Sequence[str] -> Prompt bullet topics left out because they are generated locally.\n
+        """
+        self.get_generator = get_generator
+        self.routing = routing or routing_table_from_env()
+        self.escalate = escalate
+        self.procedural_topics = list(procedural_topics)
+
+    def route(self, band: str, section: str) -> str:
+        return self.routing.get(band, {}).get(section) or self.routing.get("*", {}).get(section) or ESCALATION_TIER
+
+    def _section_prompt(self, section: str, class_level: str, params: Dict) -> Tuple[str, int, int]:
+        heading, instructions, expected, budget = SECTIONS[section]
+        prompt = SECTION_PROMPT.format(
+            class_level=class_level, heading=heading, expected=expected,
+            instructions=instructions.format(**params), math_complexity=params["math_complexity"],
+        )
+        if self.procedural_topics:
+            prompt, dropped = split_instructions(prompt, self.procedural_topics)
+            expected -= sum(sum(counts.values()) for counts in dropped.values())
+        return prompt, expected, budget
+
+    def _generate_section(self, section: str, tier: str, prompt: str, budget: int, class_level: str,
+                          student_key: str) -> Tuple[str, int, float, int]:
+        """Generated text, well-formed question count, seconds and output tokens of one section"""
+        generator = self.get_generator(tier)
+        started = time.perf_counter()
+        text = generator.generate_raw(prompt, "test.section", max_new_tokens=budget, student_key=student_key,
+                                      class_level=class_level, section=section, tier=tier)
+        seconds = time.perf_counter() - started
+        valid = count_valid_mcqs(text)
+        return text, valid, seconds, generator.count_tokens(text)
+
+    def generate_test(self, class_level: str, params: Dict, student_key: str = "") -> str:
+        """Raw text of a whole test in the single-prompt layout"""
+        band = params["reading_level"]
+        parts = []
+        for section, (heading, _, _, _) in SECTIONS.items():
+            tier = self.route(band, section)
+            prompt, expected, budget = self._section_prompt(section, class_level, params)
+            text, valid, seconds, tokens = self._generate_section(
+                section, tier, prompt, budget, class_level, student_key
+            )
+            escalated = self.escalate and tier != ESCALATION_TIER and valid < expected
+            route_stats.record(band, section, tier, seconds, tokens, valid, expected, escalated)
+            if escalated:
+                logger.info(f"{section} for {class_level} had {valid}/{expected} well-formed questions on "
+                            f"{tier}; regenerating on {ESCALATION_TIER}")
+                text, valid, seconds, tokens = self._generate_section(
+                    section, ESCALATION_TIER, prompt, budget, class_level, student_key
+                )
+                route_stats.record(band, section, ESCALATION_TIER, seconds, tokens, valid, expected)
+
+            # The heading is written here, so drop it if the model repeated it anyway
+            marker = heading.split(":")[0]
+            body = "\n".join(line for line in text.splitlines() if marker not in line)
+            parts.append(f"{heading}\n{body.strip()}")
+        return "\n\n".join(parts)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app's modules import each other by bare name, and the shared package from the repository root
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP_DIR, os.path.dirname(APP_DIR)]
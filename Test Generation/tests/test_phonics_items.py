@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+from phonics_items import READING_LEVELS, SOUND_SPELLINGS, PhonicsItemEngine
+from phonics_lexicon import PhonicsLexicon, build_lexicon, read_bundled
+
+SEEDS = range(150)
+
+@pytest.fixture(scope="module")
+def lexicon(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("lexicon") / "phonics_lexicon.bin")
+    build_lexicon(read_bundled(), path, bundled=True)
+    return PhonicsLexicon(path)
+
+def unstressed(phones):
+    return tuple(phone.rstrip("012") for phone in phones)
+
+def substitutes(entry, target, sound):
+    return (SOUND_SPELLINGS.get(entry.phones[0]) == sound
+            and unstressed(entry.phones[1:]) == unstressed(target.phones[1:]))
+
+def correct(lexicon, item, option):
+    """Whether option satisfies the item's question, worked out from the lexicon alone"""
+    question = item.question
+    if question == "Which word does NOT rhyme with the others?":
+        others = [lexicon.lookup(word) for word in item.options if word != option]
+        return len({entry.rime for entry in others}) == 1 and lexicon.lookup(option).rime != others[0].rime
+    target = lexicon.lookup(re.search(r'"([^"]+)"', question).group(1))
+    if question.startswith("How many syllables"):
+        return option == str(target.syllables)
+    entry = lexicon.lookup(option)
+    if question.startswith("Which word begins with the same sound"):
+        return entry.phones[0] == target.phones[0]
+    if question.startswith("Which word rhymes"):
+        return entry.rime == target.rime
+    if question.startswith("Change the first sound"):
+        sound = re.search(r"/(\w+)/", question).group(1)
+        return len(entry.onset.split()) == 1 and substitutes(entry, target, sound)
+    if question.startswith("Which word begins with the /"):
+        sound = re.search(r"/(\w+)/", question).group(1)
+        return SOUND_SPELLINGS.get(entry.phones[0]) == sound and entry.rime == target.rime
+    if question.startswith("Which word has the same number of syllables"):
+        return entry.syllables == target.syllables
+    raise AssertionError(f"Unknown question: {question}")
+
+@pytest.mark.parametrize("section", ["L1", "L2", "L3", "L4"])
+def test_only_the_keyed_option_answers_the_question(lexicon, section):
+    kinds = set()
+    for seed in SEEDS:
+        engine = PhonicsItemEngine(lexicon, seed)
+        for reading_level, band in READING_LEVELS.items():
+            for item in engine.generate(reading_level, section, 4):
+                kinds.add(item.question.split('"')[0])
+                assert len(set(item.options)) == 4, item
+                for index, option in enumerate(item.options):
+                    assert correct(lexicon, item, option) == (index == item.answer_index), (item, option)
+                    if not item.question.startswith("How many syllables"):
+                        assert lexicon.lookup(option).syllables <= band["max_syllables"], (item, option)
+    # every builder of the section produced items
+    assert len(kinds) >= len(PhonicsItemEngine(lexicon, 0)._builders[section]), kinds
+
+def test_same_seed_gives_the_same_items(lexicon):
+    first = PhonicsItemEngine(lexicon, 7).section_items("2nd-grade", {"L1": 2, "L2": 2, "L3": 1, "L4": 1})
+    second = PhonicsItemEngine(lexicon, 7).section_items("2nd-grade", {"L1": 2, "L2": 2, "L3": 1, "L4": 1})
+    assert first == second
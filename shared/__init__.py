@@ -0,0 +1,3 @@
+"""
+Logging, tracing, profiling, model registry, CPU layout and execution profile code used by both apps.
+"""
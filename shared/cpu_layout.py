@@ -0,0 +1,330 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .logger import Logger
+
+logger = Logger(name="CPU Layout", log_file_needed=True, log_file='Logs/cpu_layout.log', level='DEV')
+
+def detect_topology() -> List[List[int]]:
+    """
+    Physical cores this process may run on, each as the logical CPUs (hyperthread siblings) it holds.
+
+    Cores are ordered by socket and core id, so consecutive cores share a socket and its caches.
+    Where sysfs is unavailable every logical CPU is treated as its own core.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        allowed = sorted(os.sched_getaffinity(0))
+    else:
+        allowed = list(range(os.cpu_count() or 1))
+
+    cores: Dict[Tuple[int, int], List[int]] = {}
+    for cpu in allowed:
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(f"{topology}/physical_package_id") as package_file, open(f"{topology}/core_id") as core_file:
+                key = (int(package_file.read()), int(core_file.read()))
+        except (OSError, ValueError):
+            key = (0, cpu)
+        cores.setdefault(key, []).append(cpu)
+    return [cores[key] for key in sorted(cores)]
+
+def partition_cores(cores: List[List[int]], parts: int) -> List[List[List[int]]]:
+    """Split physical cores into `parts` contiguous, near-equal groups (a core is never split)"""
+    parts = max(1, min(parts, len(cores)))
+    size, extra = divmod(len(cores), parts)
+    groups, start = [], 0
+    for index in range(parts):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(cores[start:end])
+        start = end
+    return groups
+
+def cpu_busy_seconds(cpus: List[int]) -> Optional[float]:
+    """Non-idle time of the given logical CPUs since boot, from /proc/stat (Linux)"""
+    wanted = {f"cpu{cpu}" for cpu in cpus}
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    busy = 0
+    try:
+        with open("/proc/stat") as stat:
+            for line in stat:
+                fields = line.split()
+                if fields and fields[0] in wanted:
+                    values = [int(value) for value in fields[1:8]]
+                    # user nice system idle iowait irq softirq
+                    busy += sum(values) - values[3] - values[4]
+    except OSError:
+        return None
+    return busy / ticks
+
+class CpuPool:
+    """
+    A set of physical cores reserved for one model.
+
+    Work submitted to the pool runs on its own threads, which are pinned to the pool's
+    CPUs and set their intra-op thread count to its core count. With torch's OpenMP
+    backend the thread count is per calling thread and the OpenMP team a thread starts
+    inherits its CPU mask, so the model's kernels stay on the pool's cores.
+    """
+
+    def __init__(self, name: str, cores: List[List[int]], slots: int = 1):
+        """
+        Initialization of class arguments.
+
+        1. name -> str -> Pool name, e.g. "emotion" or "generation".\n
+        2. cores -> List[List[int]] -> Physical cores of the pool, each as its logical CPUs.\n
+        3. slots -> int -> Calls that may run at once; the cores' threads are divided between them.\n
+        """
+        self.name = name
+        self.cpus = sorted(cpu for core in cores for cpu in core)
+        self.physical_cores = len(cores)
+        self.slots = max(1, slots)
+        self.intra_op_threads = max(1, self.physical_cores // self.slots)
+        self._executor = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix=f"cpu-pool-{name}",
+                                            initializer=self._pin_thread)
+        self._pool_threads = set()
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._busy_seconds = 0.0
+        self._queue_seconds = 0.0
+        self._created_at = time.monotonic()
+        self._cpu_seconds_at_start = cpu_busy_seconds(self.cpus)
+
+    def _pin_thread(self):
+        self._pool_threads.add(threading.get_ident())
+        if hasattr(os, "sched_setaffinity"):
+            # On Linux, pid 0 is the calling thread only
+            os.sched_setaffinity(0, self.cpus)
+        try:
+            import torch
+        except ImportError:
+            return
+        # Initialize this thread's OpenMP settings first, so torch's lazy per-thread
+        # initialization cannot later overwrite them with another pool's count
+        torch.get_num_threads()
+        torch.set_num_threads(self.intra_op_threads)
+
+    def submit(self, function: Callable, /, *args, **kwargs) -> Future:
+        """Run function on the pool in a copy of the caller's context and grad mode"""
+        context = contextvars.copy_context()
+        grad_enabled = _grad_enabled()
+        submitted = time.monotonic()
+
+        def timed():
+            started = time.monotonic()
+            try:
+                with _grad_mode(grad_enabled):
+                    return context.run(function, *args, **kwargs)
+            finally:
+                finished = time.monotonic()
+                with self._lock:
+                    self._calls += 1
+                    self._busy_seconds += finished - started
+                    self._queue_seconds += started - submitted
+
+        return self._executor.submit(timed)
+
+    def run(self, function: Callable, /, *args, **kwargs):
+        """Run function on the pool and wait for its result; calls from a pool thread run inline"""
+        if threading.get_ident() in self._pool_threads:
+            return function(*args, **kwargs)
+        return self.submit(function, *args, **kwargs).result()
+
+    def stats(self) -> Dict:
+        """Calls, busy and queueing time of the pool, and how busy its cores were"""
+        elapsed = time.monotonic() - self._created_at
+        with self._lock:
+            calls, busy, queued = self._calls, self._busy_seconds, self._queue_seconds
+        stats = {
+            'cpus': self.cpus,
+            'physical_cores': self.physical_cores,
+            'slots': self.slots,
+            'intra_op_threads': self.intra_op_threads,
+            'calls': calls,
+            'busy_seconds': round(busy, 3),
+            'queue_seconds': round(queued, 3),
+            'slot_utilization': round(busy / (elapsed * self.slots), 4) if elapsed else 0.0,
+            'core_utilization': None,
+        }
+        cpu_seconds = cpu_busy_seconds(self.cpus)
+        if cpu_seconds is not None and self._cpu_seconds_at_start is not None and elapsed:
+            # Counts every process on these cores, which is what oversubscription shows up as
+            stats['core_utilization'] = round((cpu_seconds - self._cpu_seconds_at_start) / (elapsed * len(self.cpus)), 4)
+        return stats
+
+def _grad_enabled() -> Optional[bool]:
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch.is_grad_enabled()
+
+def _grad_mode(enabled: Optional[bool]):
+    """Grad mode is thread-local, so pool threads adopt the submitting thread's"""
+    if enabled is None:
+        return nullcontext()
+    import torch
+    return torch.set_grad_enabled(enabled)
+
+def parse_layout(spec: str) -> List[Tuple[str, str, int]]:
+    """
+    Parse "emotion=2,generation=*/2" into (pool, cores, slots) entries.
+
+    cores is a physical core count or "*" for every core the other pools leave;
+    the optional "/slots" is how many calls the pool runs concurrently.
+    """
+    entries = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, size = item.partition("=")
+        cores, _, slots = size.strip().partition("/")
+        if not name.strip() or not cores:
+            raise ValueError(f"Invalid CPU layout entry '{item}', expected name=cores[/slots]")
+        if cores != "*" and not cores.isdigit():
+            raise ValueError(f"Invalid core count in CPU layout entry '{item}'")
+        entries.append((name.strip(), cores, int(slots) if slots else 1))
+    return entries
+
+class ExecutionLayout:
+    """
+    Assignment of physical cores to named model pools.
+
+    Callers route model work through run()/submit() with a pool name; names without a
+    pool (or every name, when no layout is configured) run on the caller's thread as before.
+    """
+
+    def __init__(self, spec: str = "", interop_threads: Optional[int] = None):
+        """
+        Initialization of class arguments.
+
+        1. spec -> str -> Layout such as "emotion=2,generation=*", see parse_layout; empty disables pools.\n
+        2. interop_threads -> int | None -> torch inter-op pool size for the whole process.\n
+        """
+        self.spec = spec
+        self.interop_threads = interop_threads
+        self._entries = parse_layout(spec)
+        self._pools: Optional[Dict[str, CpuPool]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._entries)
+
+    def _build_pools(self) -> Dict[str, CpuPool]:
+        if self.interop_threads:
+            try:
+                import torch
+                torch.set_num_interop_threads(self.interop_threads)
+            except (ImportError, RuntimeError) as e:
+                # Only possible before the first inter-op parallel work in the process
+                logger.warning(f"Inter-op threads left unchanged: {str(e)}")
+
+        cores = detect_topology()
+        fixed = sum(int(count) for _, count, _ in self._entries if count != "*")
+        shared = [name for name, count, _ in self._entries if count == "*"]
+        if fixed + len(shared) > len(cores):
+            logger.warning(f"CPU layout '{self.spec}' needs more than the {len(cores)} available physical cores; "
+                           f"some pools will share cores")
+
+        # Counted pools take consecutive cores in order; "*" pools split whatever is left
+        remaining = cores[fixed:]
+        shared_groups = iter(partition_cores(remaining, len(shared)) if remaining else [])
+        pools, position = {}, 0
+        for name, count, slots in self._entries:
+            if count == "*":
+                pool_cores = next(shared_groups, None) or cores[-1:]
+            else:
+                pool_cores = [cores[(position + offset) % len(cores)] for offset in range(int(count))]
+                position += int(count)
+            pools[name] = CpuPool(name, pool_cores, slots)
+            logger.info(f"CPU pool '{name}': CPUs {pools[name].cpus}, {pools[name].intra_op_threads} intra-op "
+                        f"threads x {pools[name].slots} slots")
+        return pools
+
+    def pool(self, name: str) -> Optional[CpuPool]:
+        """The pool serving name, or None to run on the caller's thread"""
+        if not self._entries:
+            return None
+        if self._pools is None:
+            with self._lock:
+                if self._pools is None:
+                    self._pools = self._build_pools()
+        return self._pools.get(name)
+
+    def run(self, pool_name: str, function: Callable, /, *args, **kwargs):
+        """Run function on the named pool, or directly when there is none"""
+        pool = self.pool(pool_name)
+        if pool is None:
+            return function(*args, **kwargs)
+        return pool.run(function, *args, **kwargs)
+
+    def submit(self, pool_name: str, function: Callable, /, *args, thread_name: str = "cpu-layout",
+               **kwargs) -> Future:
+        """Start function in the background on the named pool, or on a new daemon thread when there is none"""
+        pool = self.pool(pool_name)
+        if pool is not None:
+            return pool.submit(function, *args, **kwargs)
+
+        future = Future()
+        context = contextvars.copy_context()
+
+        def target():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(context.run(function, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, name=thread_name, daemon=True).start()
+        return future
+
+    def stats(self) -> Dict[str, Dict]:
+        """Per-pool utilization; empty until a pool has been used"""
+        return {name: pool.stats() for name, pool in (self._pools or {}).items()}
+
+    def counters(self) -> Dict[str, float]:
+        """Pool utilization as tracer counters (see Tracer.register_counter_source)"""
+        counters = {}
+        for name, stats in self.stats().items():
+            counters[f"cpu_pool_{name}_calls"] = stats['calls']
+            counters[f"cpu_pool_{name}_busy_seconds"] = stats['busy_seconds']
+            counters[f"cpu_pool_{name}_queue_seconds"] = stats['queue_seconds']
+        return counters
+
+    def reset_after_fork(self):
+        """Pool threads do not survive fork; the child builds its own pools on first use"""
+        self._pools = None
+        self._lock = threading.Lock()
+
+_cpu_layout = None
+_cpu_layout_lock = threading.Lock()
+
+def get_cpu_layout() -> ExecutionLayout:
+    """
+    Process-wide execution layout configured from the environment.
+
+    CPU_LAYOUT assigns physical cores to pools, e.g. "emotion=2,generation=*" gives the
+    classifier two cores and the language model the rest; "generation=*/2" lets two
+    decodes run side by side on half the threads each. CPU_INTEROP_THREADS sets torch's
+    inter-op pool. Unset, every model runs on the caller's thread with torch's defaults.
+    """
+    global _cpu_layout
+    with _cpu_layout_lock:
+        if _cpu_layout is None:
+            interop_threads = os.environ.get("CPU_INTEROP_THREADS", "")
+            _cpu_layout = ExecutionLayout(
+                spec=os.environ.get("CPU_LAYOUT", ""),
+                interop_threads=int(interop_threads) if interop_threads else None,
+            )
+    return _cpu_layout
+
+def _reset_layout_in_child():
+    if _cpu_layout is not None:
+        _cpu_layout.reset_after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_layout_in_child)
@@ -0,0 +1,162 @@
+import importlib.util
+import os
+from dataclasses import dataclass, replace
+from enum import Enum
+from typing import Callable, List, Optional, Tuple
+
+from .logger import Logger
+
+logger = Logger(name="Execution Profile", log_file_needed=True, log_file='Logs/execution_profile.log', level='DEV')
+
+# Inductor and Triton artifacts are kept here so a restart reuses the compiled kernels
+DEFAULT_COMPILE_CACHE_DIR = "Models/torch_compile_cache"
+
+class AttentionBackend(str, Enum):
+    EAGER = "eager"
+    SDPA = "sdpa"
+    FLASH = "flash_attention_2"
+
+# Fastest first; a backend the host or model cannot use falls back to the next one
+ATTENTION_FALLBACK_ORDER = [AttentionBackend.FLASH, AttentionBackend.SDPA, AttentionBackend.EAGER]
+ATTENTION_ALIASES = {"flash": AttentionBackend.FLASH, "flash_attention_2": AttentionBackend.FLASH,
+                     "sdpa": AttentionBackend.SDPA, "eager": AttentionBackend.EAGER}
+
+@dataclass(frozen=True)
+class ExecutionProfile:
+    """How a causal model is executed: attention kernels and optional graph compilation"""
+    attention: AttentionBackend = AttentionBackend.SDPA
+    compile: bool = False
+    compile_mode: str = "default"
+
+    @property
+    def name(self) -> str:
+        name = self.attention.value
+        if self.compile:
+            name += "+compile" if self.compile_mode == "default" else f"+compile:{self.compile_mode}"
+        return name
+
+    @classmethod
+    def parse(cls, value: str) -> "ExecutionProfile":
+        """
+        Parse "eager", "sdpa", "flash", each optionally with "+compile" or "+compile:<torch.compile mode>",
+        e.g. "sdpa+compile:reduce-overhead".
+        """
+        attention, _, compile_spec = value.strip().lower().partition("+")
+        if attention not in ATTENTION_ALIASES:
+            raise ValueError(f"Unknown attention backend '{attention}', expected one of {sorted(ATTENTION_ALIASES)}")
+        if compile_spec and not compile_spec.startswith("compile"):
+            raise ValueError(f"Unknown execution option '{compile_spec}', expected 'compile[:mode]'")
+        _, _, mode = compile_spec.partition(":")
+        return cls(ATTENTION_ALIASES[attention], bool(compile_spec), mode or "default")
+
+def execution_profile_from_env(variable: str, default: str = "sdpa") -> ExecutionProfile:
+    return ExecutionProfile.parse(os.environ.get(variable) or default)
+
+def detect_supported_attention(device: str = "cpu") -> List[AttentionBackend]:
+    """
+    Attention backends usable on this host and device.
+
+    SDPA needs torch 2.x; flash-attention 2 needs the flash_attn package and an
+    Ampere or newer CUDA GPU. Eager is always available.
+    """
+    import torch
+
+    supported = []
+    if str(device).startswith("cuda") and torch.cuda.is_available() and importlib.util.find_spec("flash_attn"):
+        major, _ = torch.cuda.get_device_capability()
+        if major >= 8:
+            supported.append(AttentionBackend.FLASH)
+    if hasattr(torch.nn.functional, "scaled_dot_product_attention"):
+        supported.append(AttentionBackend.SDPA)
+    supported.append(AttentionBackend.EAGER)
+    return supported
+
+def attention_candidates(requested: AttentionBackend, device: str = "cpu") -> List[AttentionBackend]:
+    """The requested backend followed by the slower ones, restricted to what the host supports"""
+    supported = detect_supported_attention(device)
+    order = ATTENTION_FALLBACK_ORDER[ATTENTION_FALLBACK_ORDER.index(requested):]
+    return [backend for backend in order if backend in supported]
+
+def load_with_attention_fallback(load: Callable[[str], object], profile: ExecutionProfile,
+                                 device: str = "cpu") -> Tuple[object, AttentionBackend]:
+    """
+    Call load(attn_implementation) with the profile's backend, falling back when it is refused.
+
+    transformers raises when a model architecture has no kernel for the requested
+    implementation, so the model itself decides the final backend, not only the host.
+    """
+    candidates = attention_candidates(profile.attention, device)
+    for backend in candidates:
+        try:
+            model = load(backend.value)
+        except (ValueError, ImportError) as e:
+            if backend == candidates[-1]:
+                raise
+            logger.warning(f"Attention backend {backend.value} unavailable for this model: {str(e)}")
+            continue
+        if backend != profile.attention:
+            logger.info(f"Attention backend {profile.attention.value} fell back to {backend.value}")
+        return model, backend
+    raise RuntimeError("No attention backend available")
+
+def configure_compile_cache(cache_dir: Optional[str] = None) -> str:
+    """
+    Point the inductor and Triton caches at a persistent directory.
+
+    Compiled FX graphs are keyed by graph, shapes and torch version, so after a restart
+    only Dynamo's trace is repeated and the kernel compilation is read from disk.
+    """
+    cache_dir = os.path.abspath(cache_dir or os.environ.get("MODEL_COMPILE_CACHE_DIR", DEFAULT_COMPILE_CACHE_DIR))
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+    os.environ.setdefault("TRITON_CACHE_DIR", os.path.join(cache_dir, "triton"))
+    try:
+        import torch._inductor.config as inductor_config
+        inductor_config.fx_graph_cache = True
+        if hasattr(inductor_config, "autotune_local_cache"):
+            inductor_config.autotune_local_cache = True
+    except ImportError:
+        pass
+    return cache_dir
+
+def _warm_up(model):
+    """One prefill and one decode step, so both shape families are compiled before the first request"""
+    import torch
+
+    input_ids = torch.ones((1, 8), dtype=torch.long, device=model.device)
+    with torch.no_grad():
+        outputs = model(input_ids=input_ids, use_cache=True)
+        model(input_ids=input_ids[:, :1], past_key_values=outputs.past_key_values, use_cache=True)
+
+def compile_model(model, profile: ExecutionProfile, cache_dir: Optional[str] = None) -> Tuple[object, bool]:
+    """
+    Compile the model's forward with torch.compile when the profile asks for it.
+
+    Compilation happens lazily on the first call, so the model is warmed up here and the
+    eager forward is restored if compiling fails (no C++ toolchain, unsupported ops after
+    quantization, old torch). Returns the model and whether it is compiled.
+    """
+    if not profile.compile:
+        return model, False
+
+    import torch
+
+    if not hasattr(torch, "compile"):
+        logger.warning("torch.compile needs torch 2.0 or newer; running eagerly")
+        return model, False
+
+    configure_compile_cache(cache_dir)
+    eager_forward = model.forward
+    try:
+        # Dynamic shapes keep growing prompt and cache lengths from triggering recompiles
+        model.forward = torch.compile(eager_forward, mode=profile.compile_mode, dynamic=True)
+        _warm_up(model)
+    except Exception as e:
+        model.forward = eager_forward
+        logger.warning(f"torch.compile failed, running eagerly: {str(e)}")
+        return model, False
+    return model, True
+
+def resolved_profile(profile: ExecutionProfile, attention: AttentionBackend, compiled: bool) -> ExecutionProfile:
+    """The profile a model actually runs with after fallbacks"""
+    return replace(profile, attention=attention, compile=compiled)
@@ -0,0 +1,247 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Literal, Optional
+
+from .tracing import current_request_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotation falls back to single-process behaviour
+    fcntl = None
+
+# One background writer per logger name; re-creating a logger (e.g. on a Streamlit rerun) replaces it
+_listeners = {}
+
+def _stop_listener(name: str):
+    listener = _listeners.pop(name, None)
+    if listener is not None:
+        try:
+            listener.stop()
+        except Exception:
+            pass
+        for handler in listener.handlers:
+            handler.close()
+
+def shutdown_logging():
+    """Flush and stop every background writer; runs at interpreter exit, call it before os._exit()"""
+    for name in list(_listeners):
+        _stop_listener(name)
+
+atexit.register(shutdown_logging)
+
+def _pause_listeners():
+    """Drain and stop the writer threads so a fork never copies a queue mid-write"""
+    for listener in _listeners.values():
+        try:
+            listener.stop()
+        except Exception:
+            pass
+
+def _resume_listeners():
+    """Start fresh writer threads; threads do not survive fork, so the child needs its own"""
+    for listener in _listeners.values():
+        if listener._thread is None:
+            listener.start()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_pause_listeners, after_in_parent=_resume_listeners,
+                        after_in_child=_resume_listeners)
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the standard fields plus any structured fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'time': self.formatTime(record),
+            'logger': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            payload['request_id'] = request_id
+        payload.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+class InProcessQueueHandler(QueueHandler):
+    """
+    QueueHandler that enqueues the record untouched.
+
+    The stock handler formats the message in the calling thread so the record can be
+    pickled; our queue never leaves the process, so %-formatting is left to the writer
+    thread and stays off the request path.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class ProcessSafeRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that can be shared by several worker processes.
+
+    Every write takes an exclusive lock on a sidecar ".lock" file, and the stream is
+    reopened when another process has rotated the file underneath us.
+    """
+
+    def __init__(self, filename, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self._lock_path = os.path.abspath(filename) + ".lock"
+
+    def _stream_is_stale(self) -> bool:
+        if self.stream is None:
+            return True
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            return True
+
+    def emit(self, record: logging.LogRecord):
+        if fcntl is None:
+            super().emit(record)
+            return
+        try:
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    if self._stream_is_stale():
+                        if self.stream is not None:
+                            self.stream.close()
+                        self.stream = self._open()
+                    super().emit(record)
+                    self.flush()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+class Logger:
+    """
+    Logger implementation shared by the Emotional Chatbot and Test Generation apps.
+
+    Records are handed to a queue and written by a background thread, so callers never
+    block on file or console I/O. Messages accept lazy %-style arguments or a callable
+    that is only evaluated when the level is enabled.
+    """
+    def __init__(self, name: str, log_file_needed: bool = False, log_file: str = '',
+                 level: Literal['DEV', 'PROD'] = 'DEV', log_file_path: str = '',
+                 json_output: Optional[bool] = None, debug_sample_rate: Optional[float] = None):
+        """
+        Initialization of Logger class:
+        - name -> string -> Define the name of the logger, eg. a logger for monitoring data cleaning pipeline, name = "Data Cleaning Logs"
+        - log_file_needed -> boolean (True or False) -> Whether or not you want to store the logs in ".log" file.
+        - log_file / log_file_path -> string -> Mention the path for the log file (either name is accepted).
+        - level -> Literal (either "DEV" or "PROD") -> Select the level of logging, by default it is "DEV". LOG_LEVEL overrides it.
+        - json_output -> boolean -> Write the log file as JSON lines, defaults to LOG_FORMAT=json.
+        - debug_sample_rate -> float -> Fraction of sampled debug events kept, defaults to LOG_DEBUG_SAMPLE_RATE or 1.0.
+        """
+        log_file = log_file or log_file_path
+
+        # Validate that log_file is provided when log_file_needed is True
+        if log_file_needed and not log_file.strip():
+            raise ValueError("A file name is required when log_file_needed is set to True")
+
+        self.name = name
+        self.log_file_needed = log_file_needed
+        self.log_file = log_file
+        self.log_file_path = log_file
+
+        level = os.environ.get("LOG_LEVEL", level)
+        self.logger = logging.getLogger(name)
+        if level.upper() == 'DEV':
+            self.logger.setLevel(logging.DEBUG)
+        elif level.upper() == 'PROD':
+            self.logger.setLevel(logging.INFO)
+        else:
+            raise ValueError("The value of level must be 'DEV' or 'PROD'")
+        self.logger.propagate = False
+
+        if json_output is None:
+            json_output = os.environ.get("LOG_FORMAT", "").lower() == "json"
+        if debug_sample_rate is None:
+            debug_sample_rate = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+        self.debug_sample_rate = debug_sample_rate
+
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+        # Clear any existing handlers
+        _stop_listener(name)
+        self.logger.handlers.clear()
+
+        # Console handler
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formatter)
+        handlers = [console_handler]
+
+        # Rotating file handler with 5MB cap, safe across worker processes
+        if self.log_file_needed:
+            log_dir = os.path.dirname(log_file)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+            file_handler = ProcessSafeRotatingFileHandler(
+                log_file,
+                maxBytes=5*1024*1024,  # 5MB
+                backupCount=5  # Keep 5 backup files
+            )
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(JsonFormatter() if json_output else formatter)
+            handlers.append(file_handler)
+
+        # Background writer: the request path only enqueues the record
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(InProcessQueueHandler(log_queue))
+        self._listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self._listener.start()
+        _listeners[name] = self._listener
+
+    def is_enabled(self, level: int) -> bool:
+        """Whether a message at this level would be emitted"""
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level: int, message, args: tuple, fields: dict):
+        if not self.logger.isEnabledFor(level):
+            return
+        if callable(message):
+            message = message()
+        # Captured here because the record is formatted later on the writer thread
+        extra = {'request_id': current_request_id()}
+        if fields:
+            extra['fields'] = fields
+        self.logger.log(level, message, *args, extra=extra)
+
+    def debug(self, message, *args, sampled: bool = False, **fields):
+        """
+        Log debug message
+
+        sampled marks a high-volume event; only debug_sample_rate of those are kept.
+        """
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if sampled and self.debug_sample_rate < 1.0 and random.random() >= self.debug_sample_rate:
+            return
+        self._log(logging.DEBUG, message, args, fields)
+
+    def info(self, message, *args, **fields):
+        """Log info message"""
+        self._log(logging.INFO, message, args, fields)
+
+    def warning(self, message, *args, **fields):
+        """Log warning message"""
+        self._log(logging.WARNING, message, args, fields)
+
+    def error(self, message, *args, **fields):
+        """Log error message"""
+        self._log(logging.ERROR, message, args, fields)
+
+    def critical(self, message, *args, **fields):
+        """Log critical message"""
+        self._log(logging.CRITICAL, message, args, fields)
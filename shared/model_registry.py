@@ -0,0 +1,316 @@
+import ctypes
+import ctypes.util
+import gc
+import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Optional
+
+from .logger import Logger
+
+logger = Logger(name="Model Registry", log_file_needed=True, log_file='Logs/model_registry.log', level='DEV')
+
+def module_memory_mb(obj: Any, max_depth: int = 3) -> float:
+    """
+    Parameter and buffer memory of every torch module reachable from obj, in MB.
+
+    Follows attributes (and Hugging Face pipelines' .model) a few levels deep, so wrappers
+    such as EmotionDetector or TestGenerator are measured by the weights they hold.
+    """
+    try:
+        import torch
+    except ImportError:
+        return 0.0
+
+    seen_modules, seen_objects = set(), set()
+    total = 0
+
+    def visit(value, depth):
+        nonlocal total
+        if value is None or id(value) in seen_objects or depth > max_depth:
+            return
+        seen_objects.add(id(value))
+        if isinstance(value, torch.nn.Module):
+            if id(value) in seen_modules:
+                return
+            seen_modules.add(id(value))
+            for tensor in list(value.parameters()) + list(value.buffers()):
+                total += tensor.numel() * tensor.element_size()
+            return
+        if isinstance(value, (str, bytes, int, float, bool, torch.Tensor)):
+            return
+        if isinstance(value, dict):
+            children = value.values()
+        elif isinstance(value, (list, tuple, set)):
+            children = value
+        else:
+            children = getattr(value, "__dict__", {}).values()
+        for child in children:
+            visit(child, depth + 1)
+
+    visit(obj, 0)
+    return total / (1024 * 1024)
+
+def available_memory_mb() -> Optional[float]:
+    """MemAvailable of the host in MB (Linux), None where it cannot be read"""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def release_freed_memory():
+    """Collect garbage and hand freed heap and accelerator memory back to the OS"""
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        if hasattr(torch, "mps") and torch.backends.mps.is_available():
+            torch.mps.empty_cache()
+    except ImportError:
+        pass
+    # glibc keeps freed weight buffers in its arenas unless asked to trim them
+    libc_name = ctypes.util.find_library("c")
+    if libc_name:
+        try:
+            ctypes.CDLL(libc_name).malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+class ModelRegistry:
+    """
+    Tracks the memory and last use of every lazily loaded model in this process.
+
+    Models are loaded on first use. When the loaded models together exceed the memory
+    ceiling, or the host runs low on memory, the least recently used one is evicted, one
+    model per check so that the next reaper pass measures what the eviction freed; models
+    idle for longer than idle_seconds are evicted by the reaper too. An evicted model is
+    reloaded transparently on its next use. A model still referenced elsewhere (an in-flight
+    request, the batch scheduler, an adapter server) is freed only when that reference goes,
+    and its memory counts as resident until then.
+    """
+
+    def __init__(self, memory_ceiling_mb: Optional[float] = None, idle_seconds: Optional[float] = None,
+                 min_available_mb: Optional[float] = None, reap_interval: float = 30.0):
+        """
+        Initialization of class arguments.
+
+        1. memory_ceiling_mb -> float | None -> Upper bound on the summed weight memory of loaded models.\n
+        2. idle_seconds -> float | None -> Evict models unused for this long, even without memory pressure.\n
+        3. min_available_mb -> float | None -> Also evict while the host has less memory available than this.\n
+        4. reap_interval -> float -> Seconds between idle checks of the background reaper.\n
+        """
+        self.memory_ceiling_mb = memory_ceiling_mb
+        self.idle_seconds = idle_seconds
+        self.min_available_mb = min_available_mb
+        self.reap_interval = reap_interval
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._entries: Dict[str, Dict] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        """Declare a model and the zero-argument callable that loads it"""
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+            self._entries.setdefault(name, {'model': None, 'memory_mb': 0.0, 'last_used': None,
+                                            'load_seconds': None, 'loads': 0, 'evictions': 0, 'held': None})
+        self._ensure_reaper()
+
+    def get(self, name: str) -> Any:
+        """Return the model, loading it (and evicting others if needed) when it is not resident"""
+        entry = self._entries[name]
+        model = entry['model']
+        if model is not None:
+            entry['last_used'] = time.monotonic()
+            return model
+
+        with self._load_locks[name]:
+            model = entry['model']
+            if model is None:
+                model = self._load(name)
+            entry['last_used'] = time.monotonic()
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return entry is not None and entry['model'] is not None
+
+    def _load(self, name: str) -> Any:
+        started = time.monotonic()
+        model = self._loaders[name]()
+        load_seconds = time.monotonic() - started
+        memory_mb = module_memory_mb(model)
+
+        with self._lock:
+            entry = self._entries[name]
+            entry.update(model=model, memory_mb=memory_mb, load_seconds=load_seconds, last_used=time.monotonic(),
+                         held=None)
+            entry['loads'] += 1
+        logger.info(f"{name} loaded in {load_seconds:.1f}s ({memory_mb:.0f} MB of weights)")
+        self._enforce_limits(keep=name)
+        return model
+
+    def evict(self, name: str) -> bool:
+        """Drop the registry's reference to a model and release its memory"""
+        available_before = available_memory_mb()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry['model'] is None:
+                return False
+            try:
+                held = weakref.ref(entry['model'])
+            except TypeError:
+                held = None
+            entry.update(model=None, held=held)
+            entry['evictions'] += 1
+            memory_mb = entry['memory_mb']
+        release_freed_memory()
+        if held is not None and held() is not None:
+            logger.info(f"{name} evicted but still referenced elsewhere; its {memory_mb:.0f} MB are released "
+                        f"when that reference goes")
+            return True
+        available_after = available_memory_mb()
+        freed = "" if None in (available_before, available_after) else \
+            f", available memory {available_after - available_before:+.0f} MB"
+        logger.info(f"{name} evicted, {memory_mb:.0f} MB of weights dropped{freed}")
+        return True
+
+    @staticmethod
+    def _still_held(entry: Dict) -> bool:
+        """Whether an evicted model has not been freed yet because something else still references it"""
+        return entry['held'] is not None and entry['held']() is not None
+
+    def _over_limits(self) -> bool:
+        if self.memory_ceiling_mb is not None and self.resident_mb() > self.memory_ceiling_mb:
+            return True
+        if self.min_available_mb is not None:
+            available = available_memory_mb()
+            if available is not None and available < self.min_available_mb:
+                return True
+        return False
+
+    def _enforce_limits(self, keep: Optional[str] = None):
+        """
+        Evict the least recently used model when a limit is exceeded; never evicts `keep`.
+
+        At most one model goes per check: memory held by a model that is still in use, or by
+        weight pages shared with a pre-fork parent, does not come back on eviction, so evicting
+        until the limits hold would empty the registry. The reaper checks again next pass.
+        """
+        if not self._over_limits():
+            return
+        with self._lock:
+            candidates = [
+                (entry['last_used'], name) for name, entry in self._entries.items()
+                if entry['model'] is not None and name != keep
+            ]
+        if not candidates:
+            logger.warning("Memory limit exceeded but no other model can be evicted")
+            return
+        self.evict(min(candidates)[1])
+
+    def evict_idle(self) -> int:
+        """Evict every model unused for longer than idle_seconds; returns how many were evicted"""
+        if self.idle_seconds is None:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                name for name, entry in self._entries.items()
+                if entry['model'] is not None and now - entry['last_used'] > self.idle_seconds
+            ]
+        return sum(self.evict(name) for name in idle)
+
+    def _ensure_reaper(self):
+        limits = (self.idle_seconds, self.min_available_mb, self.memory_ceiling_mb)
+        if all(limit is None for limit in limits) or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reap, name="model-registry-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(self.reap_interval)
+            try:
+                self.evict_idle()
+                self._enforce_limits()
+            except Exception as e:
+                logger.error(f"Model reaper failed: {str(e)}")
+
+    def resident_mb(self) -> float:
+        """Summed weight memory of the loaded models and of evicted ones not yet freed"""
+        with self._lock:
+            return sum(entry['memory_mb'] for entry in self._entries.values()
+                       if entry['model'] is not None or self._still_held(entry))
+
+    def stats(self) -> Dict[str, Dict]:
+        """Residency, memory, load time and idle time of every registered model"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    'loaded': entry['model'] is not None,
+                    'memory_mb': round(entry['memory_mb'], 1),
+                    'idle_seconds': None if entry['last_used'] is None else round(now - entry['last_used'], 1),
+                    'load_seconds': None if entry['load_seconds'] is None else round(entry['load_seconds'], 2),
+                    'loads': entry['loads'],
+                    'evictions': entry['evictions'],
+                }
+                for name, entry in self._entries.items()
+            }
+
+def _restart_reaper_in_child():
+    """
+    Threads do not survive fork, so a forked worker starts its own reaper.
+
+    The worker's inherited models share their weight pages with the parent, so evicting
+    them frees no host memory and the reload would be a private copy: low-memory eviction
+    is turned off in forked workers.
+    """
+    if _model_registry is None:
+        return
+    if _model_registry.min_available_mb is not None:
+        _model_registry.min_available_mb = None
+        logger.info("MODEL_MIN_AVAILABLE_MB is ignored in forked workers; their weights are shared with the parent")
+    if _model_registry._reaper is not None:
+        _model_registry._reaper = None
+        _model_registry._ensure_reaper()
+
+def _optional_float(variable: str) -> Optional[float]:
+    value = os.environ.get(variable, "")
+    return float(value) if value else None
+
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    """
+    Process-wide model registry configured from the environment.
+
+    MODEL_MEMORY_CEILING_MB caps the weights kept resident, MODEL_IDLE_EVICT_S evicts models
+    idle that long and MODEL_MIN_AVAILABLE_MB evicts while the host is short of memory.
+    All are unset by default, which keeps every model resident as before. Under the
+    pre-fork supervisor MODEL_MIN_AVAILABLE_MB applies only to the supervisor, and an idle
+    eviction in a worker frees shared weights only once every worker and the supervisor
+    have dropped them; leave MODEL_IDLE_EVICT_S unset there.
+    """
+    global _model_registry
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry(
+                memory_ceiling_mb=_optional_float("MODEL_MEMORY_CEILING_MB"),
+                idle_seconds=_optional_float("MODEL_IDLE_EVICT_S"),
+                min_available_mb=_optional_float("MODEL_MIN_AVAILABLE_MB"),
+            )
+    return _model_registry
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_reaper_in_child)
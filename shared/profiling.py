@@ -0,0 +1,174 @@
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional
+
+from .tracing import current_request_id, new_request_id
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiler for the model and pipeline hot paths.
+
+    A sampled request runs under cProfile and, when available, the torch profiler.
+    Each one leaves three files in the profiles directory:
+    - <name>_<request id>.prof -> cProfile stats, readable with pstats or snakeviz
+    - <name>_<request id>.txt -> Top Python functions and torch operators by time and memory
+    - <name>_<request id>.trace.json -> Chrome trace of the torch operators (chrome://tracing, Perfetto)
+    """
+
+    def __init__(self, profiles_dir: str = "Profiles", sample_rate: float = 0.0, torch_profiler: bool = True,
+                 top_functions: int = 40):
+        """
+        Initialization of class arguments.
+
+        1. profiles_dir -> str -> Directory the per-request profile files are written to.\n
+        2. sample_rate -> float -> Fraction of requests profiled; 0 disables profiling.\n
+        3. torch_profiler -> bool -> Also record operator-level time and memory with torch.profiler.\n
+        4. top_functions -> int -> Number of rows kept in the text summaries.\n
+        """
+        self.profiles_dir = profiles_dir
+        self.sample_rate = sample_rate
+        self.torch_profiler = torch_profiler
+        self.top_functions = top_functions
+        # cProfile hooks are interpreter-wide since Python 3.12, so one request is profiled at a time
+        self._active = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def set_sample_rate(self, sample_rate: float):
+        """Change the sampling rate at runtime (admin toggle); 0 turns profiling off"""
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+    def _should_profile(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def _torch_profile(self):
+        if not self.torch_profiler:
+            return nullcontext(None)
+        try:
+            from torch.profiler import ProfilerActivity, profile
+        except ImportError:
+            return nullcontext(None)
+        return profile(activities=[ProfilerActivity.CPU], profile_memory=True, record_shapes=True)
+
+    def _write(self, name: str, elapsed: float, python_profile: cProfile.Profile, torch_profile):
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        request_id = current_request_id() or new_request_id()
+        base = os.path.join(self.profiles_dir, f"{name}_{request_id}")
+
+        python_profile.dump_stats(base + ".prof")
+
+        summary = io.StringIO()
+        summary.write(f"{name} request {request_id}: {elapsed:.3f} s wall time\n\n")
+        stats = pstats.Stats(python_profile, stream=summary)
+        stats.sort_stats("cumulative").print_stats(self.top_functions)
+
+        if torch_profile is not None:
+            averages = torch_profile.key_averages()
+            summary.write("\nTorch operators by CPU time\n")
+            summary.write(averages.table(sort_by="self_cpu_time_total", row_limit=self.top_functions))
+            summary.write("\n\nTorch operators by memory\n")
+            summary.write(averages.table(sort_by="self_cpu_memory_usage", row_limit=self.top_functions))
+            torch_profile.export_chrome_trace(base + ".trace.json")
+
+        with open(base + ".txt", "w", encoding="utf-8") as output:
+            output.write(summary.getvalue())
+
+    @contextmanager
+    def profile(self, name: str):
+        """Profile the enclosed block if this request is sampled and no other profile is running"""
+        if not self._should_profile() or not self._active.acquire(blocking=False):
+            yield
+            return
+        try:
+            python_profile = cProfile.Profile()
+            started = time.perf_counter()
+            with self._torch_profile() as torch_profile:
+                python_profile.enable()
+                try:
+                    yield
+                finally:
+                    python_profile.disable()
+            self._write(name, time.perf_counter() - started, python_profile, torch_profile)
+        finally:
+            self._active.release()
+
+    def _profile_generator(self, name: str, chunks):
+        """
+        Profile a streaming call.
+
+        cProfile only sees the consumer's thread, so it is enabled only while the
+        generator runs; the torch profiler also covers a generate() worker thread.
+        """
+        if not self._should_profile() or not self._active.acquire(blocking=False):
+            yield from chunks
+            return
+        try:
+            python_profile = cProfile.Profile()
+            started = time.perf_counter()
+            with self._torch_profile() as torch_profile:
+                while True:
+                    python_profile.enable()
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration:
+                        break
+                    finally:
+                        python_profile.disable()
+                    yield chunk
+            self._write(name, time.perf_counter() - started, python_profile, torch_profile)
+        finally:
+            chunks.close()
+            self._active.release()
+
+    def profiled(self, name: Optional[str] = None) -> Callable:
+        """Decorator that profiles sampled calls of a function or generator function"""
+        def decorator(function):
+            label = name or function.__name__
+
+            if inspect.isgeneratorfunction(function):
+                @functools.wraps(function)
+                def generator_wrapper(*args, **kwargs):
+                    chunks = function(*args, **kwargs)
+                    if not self.enabled:
+                        return chunks
+                    return self._profile_generator(label, chunks)
+                return generator_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.profile(label):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def get_profiler() -> RequestProfiler:
+    """
+    Process-wide profiler configured from the environment.
+
+    PROFILE_SAMPLE_RATE (default 0, off) is the fraction of requests profiled,
+    PROFILE_DIR (default "Profiles") where files go and PROFILE_TORCH=0 skips the torch profiler.
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = RequestProfiler(
+                profiles_dir=os.environ.get("PROFILE_DIR", "Profiles"),
+                sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+                torch_profiler=os.environ.get("PROFILE_TORCH", "1") != "0",
+            )
+    return _profiler
@@ -0,0 +1,274 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds; chosen to resolve both millisecond regex checks and multi-second decodes
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+# Megabytes
+MEMORY_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_current_trace: contextvars.ContextVar[Optional[List[Dict]]] = contextvars.ContextVar("current_trace", default=None)
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+def current_request_id() -> Optional[str]:
+    """Request ID of the request being handled in this context, if any"""
+    return _request_id.get()
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus model (buckets, sum, count)"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+class Tracer:
+    def __init__(self, service: str, jsonl_path: Optional[str] = None, enabled: bool = True):
+        """
+        Initialization of class arguments.
+
+        1. service -> str -> Name used as the Prometheus metric prefix, e.g. "chatbot".\n
+        2. jsonl_path -> str | None -> When set, every finished request's spans are appended there as one JSON line.\n
+        3. enabled -> bool -> Disable to turn every span into a no-op.\n
+        """
+        self.service = service
+        self.jsonl_path = jsonl_path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._counter_sources: List[Callable[[], Dict[str, float]]] = []
+
+    def _observe(self, metric: str, stage: str, value: float, buckets: Tuple[float, ...]):
+        with self._lock:
+            histogram = self._histograms.get((metric, stage))
+            if histogram is None:
+                histogram = self._histograms[(metric, stage)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, metric: str, stage: str, amount: float = 1.0):
+        with self._lock:
+            self._counters[(metric, stage)] = self._counters.get((metric, stage), 0.0) + amount
+
+    def register_counter_source(self, source: Callable[[], Dict[str, float]]):
+        """Add a callable whose counters are exported alongside the tracer's own metrics"""
+        self._counter_sources.append(source)
+
+    @contextmanager
+    def request(self, request_id: Optional[str] = None, name: str = "request"):
+        """
+        Scope for one user request: sets the request ID and collects its spans.
+
+        Nested requests reuse the outer request's ID and trace.
+        """
+        if _current_trace.get() is not None:
+            with self.span(name):
+                yield _request_id.get()
+            return
+
+        request_id = request_id or _request_id.get() or new_request_id()
+        id_token = _request_id.set(request_id)
+        trace_token = _current_trace.set([])
+        started = time.perf_counter()
+        try:
+            with self.span(name):
+                yield request_id
+        finally:
+            spans = _current_trace.get()
+            _current_trace.reset(trace_token)
+            _request_id.reset(id_token)
+            if self.jsonl_path and spans is not None:
+                self._write_trace(request_id, started, spans)
+
+    @contextmanager
+    def span(self, stage: str, **attributes):
+        """Time one stage with a monotonic clock; yields a dict the caller can add attributes to"""
+        if not self.enabled:
+            yield attributes
+            return
+        started = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            self.record_stage(stage, started, time.perf_counter() - started, **attributes)
+
+    def record_stage(self, stage: str, started: float, seconds: float, **attributes):
+        """Record a stage timed elsewhere; started is a time.perf_counter() value"""
+        if not self.enabled:
+            return
+        self._observe("stage_seconds", stage, seconds, LATENCY_BUCKETS)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append({'stage': stage, 'start': started, 'seconds': seconds, **attributes})
+
+    def record_tokens(self, stage: str, tokens_in: int, tokens_out: int, seconds: float):
+        """Record token counts and decode throughput for a model call"""
+        if not self.enabled:
+            return
+        self._observe("tokens_in", stage, tokens_in, TOKEN_BUCKETS)
+        self._observe("tokens_out", stage, tokens_out, TOKEN_BUCKETS)
+        if seconds > 0 and tokens_out:
+            self._observe("tokens_per_second", stage, tokens_out / seconds, THROUGHPUT_BUCKETS)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append({'stage': stage + ".tokens", 'tokens_in': tokens_in, 'tokens_out': tokens_out,
+                          'tokens_per_second': round(tokens_out / seconds, 2) if seconds > 0 else None})
+
+    def record_memory(self, stage: str, megabytes: float):
+        """Record a per-request memory peak, such as the KV cache of one generation"""
+        if not self.enabled:
+            return
+        self._observe("memory_mb", stage, megabytes, MEMORY_BUCKETS)
+
+    def _write_trace(self, request_id: str, started: float, spans: List[Dict]):
+        record = {
+            'service': self.service,
+            'request_id': request_id,
+            'timestamp': time.time(),
+            'spans': [
+                {**span, 'start': round(span['start'] - started, 6), 'seconds': round(span['seconds'], 6)}
+                if 'start' in span else span
+                for span in spans
+            ],
+        }
+        line = json.dumps(record, default=str)
+        with self._lock:
+            directory = os.path.dirname(self.jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.jsonl_path, "a", encoding="utf-8") as output:
+                output.write(line + "\n")
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        prefix = self.service.replace("-", "_").replace(" ", "_")
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        # Samples grouped per metric family: the format allows one TYPE line per name and no
+        # interleaving, and a counter source key can collide with a stage counter's name
+        families = {}
+
+        def family(name: str, kind: str) -> list:
+            if name not in families:
+                families[name] = [f"# TYPE {name} {kind}"]
+            return families[name]
+
+        for (metric, stage), histogram in histograms:
+            name = f"{prefix}_{metric}"
+            samples = family(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                samples.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            samples.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            samples.append(f'{name}_sum{{stage="{stage}"}} {histogram.total}')
+            samples.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        for (metric, stage), value in counters:
+            name = f"{prefix}_{metric}_total"
+            family(name, "counter").append(f'{name}{{stage="{stage}"}} {value}')
+
+        # Sources reporting the same key are summed, so the unlabelled sample appears once
+        source_totals = {}
+        for source in self._counter_sources:
+            for metric, value in source().items():
+                name = f"{prefix}_{metric}_total"
+                source_totals[name] = source_totals.get(name, 0) + value
+        for name, value in sorted(source_totals.items()):
+            family(name, "counter").append(f"{name} {value}")
+
+        for samples in families.values():
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def write_histograms_jsonl(self, path: str):
+        """Append one JSON line per histogram (bucket bounds, counts, sum, count) for offline analysis"""
+        timestamp = time.time()
+        with self._lock:
+            records = [
+                {
+                    'service': self.service, 'timestamp': timestamp, 'metric': metric, 'stage': stage,
+                    'buckets': list(histogram.buckets), 'counts': list(histogram.counts),
+                    'sum': histogram.total, 'count': histogram.count,
+                }
+                for (metric, stage), histogram in sorted(self._histograms.items())
+            ]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as output:
+            for record in records:
+                output.write(json.dumps(record) + "\n")
+
+    def start_metrics_server(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve render_prometheus() on http://host:port/metrics from a daemon thread"""
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name=f"{self.service}-metrics", daemon=True).start()
+        return server
+
+_tracers: Dict[str, Tracer] = {}
+_tracers_lock = threading.Lock()
+
+def get_tracer(service: str) -> Tracer:
+    """
+    Process-wide tracer for a service, configured from the environment.
+
+    TRACE_ENABLED=0 disables spans, TRACE_JSONL_DIR writes per-request traces to
+    <dir>/<service>_traces.jsonl and METRICS_PORT serves Prometheus metrics.
+    """
+    with _tracers_lock:
+        tracer = _tracers.get(service)
+        if tracer is None:
+            jsonl_dir = os.environ.get("TRACE_JSONL_DIR", "")
+            tracer = Tracer(
+                service,
+                jsonl_path=os.path.join(jsonl_dir, f"{service}_traces.jsonl") if jsonl_dir else None,
+                enabled=os.environ.get("TRACE_ENABLED", "1") != "0",
+            )
+            metrics_port = os.environ.get("METRICS_PORT", "")
+            if metrics_port:
+                try:
+                    tracer.start_metrics_server(int(metrics_port))
+                except OSError:
+                    # Another worker of this service already serves the port
+                    pass
+            _tracers[service] = tracer
+    return tracer